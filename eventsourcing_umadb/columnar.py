@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+class TopicDictionary:
+    """
+    Assigns small integer codes to topics. Pass the same dictionary when
+    reading successive pages, so that codes are the same in all pages.
+    """
+
+    def __init__(self) -> None:
+        self.topics: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, topic: str) -> int:
+        try:
+            return self._codes[topic]
+        except KeyError:
+            code = self._codes[topic] = len(self.topics)
+            self.topics.append(topic)
+            return code
+
+    def get(self, topic: str) -> int | None:
+        """Returns the code of a topic, or None if the topic hasn't been seen."""
+        return self._codes.get(topic)
+
+
+@dataclass
+class ColumnarPage:
+    """
+    A page of notifications as columns. The payload of the i-th notification
+    is payloads[payload_offsets[i]:payload_offsets[i + 1]], and its topic is
+    topic_dictionary.topics[topic_codes[i]].
+
+    The arrays support the buffer protocol, so they can be used without
+    copying by libraries such as NumPy, for example with
+    numpy.frombuffer(page.positions, dtype=numpy.int64).
+    """
+
+    topic_dictionary: TopicDictionary
+    positions: array[int] = field(default_factory=lambda: array("q"))
+    topic_codes: array[int] = field(default_factory=lambda: array("i"))
+    payload_offsets: array[int] = field(default_factory=lambda: array("q", [0]))
+    payloads: bytes = b""
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def last_position(self) -> int | None:
+        return self.positions[-1] if self.positions else None
+
+    def topic(self, i: int) -> str:
+        return self.topic_dictionary.topics[self.topic_codes[i]]
+
+    def payload(self, i: int) -> memoryview:
+        return memoryview(self.payloads)[
+            self.payload_offsets[i] : self.payload_offsets[i + 1]
+        ]
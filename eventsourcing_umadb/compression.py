@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import zlib
+from typing import Dict, Iterable, Mapping, Tuple
+
+from eventsourcing.persistence import Compressor
+
+COMPRESSION_METADATA_KEY = "umadb:compression"
+
+# Largest preset dictionary that zlib will use (the size of its window).
+MAX_DICTIONARY_SIZE = 32768
+
+
+class ZlibDictCompressor(Compressor):
+    """
+    Zlib compressor with an optional preset dictionary, which makes small
+    payloads that share structure (for example JSON field names) compress well.
+    """
+
+    def __init__(self, zdict: bytes = b"", level: int = 6) -> None:
+        self.zdict = zdict
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.zdict:
+            c = zlib.compressobj(self.level, zdict=self.zdict)
+        else:
+            c = zlib.compressobj(self.level)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.zdict:
+            d = zlib.decompressobj(zdict=self.zdict)
+        else:
+            d = zlib.decompressobj()
+        return d.decompress(data) + d.flush()
+
+
+def train_dictionary(
+    samples: Iterable[bytes], size: int = MAX_DICTIONARY_SIZE
+) -> bytes:
+    """
+    Builds a preset dictionary from sample payloads. Distinct samples are
+    ordered by how often they occur, and the most common are put at the end
+    of the dictionary, where zlib finds matches with the shortest distances.
+    """
+    counts: Dict[bytes, int] = {}
+    for sample in samples:
+        counts[sample] = counts.get(sample, 0) + 1
+    dictionary = b""
+    for sample in sorted(counts, key=lambda s: counts[s], reverse=True):
+        if len(dictionary) + len(sample) > size:
+            break
+        dictionary = sample + dictionary
+    return dictionary
+
+
+class PayloadCompression:
+    """
+    Compresses event payloads before they are appended to UmaDB, using
+    compressors that are registered with stable IDs and selected by event
+    type. The ID of the compressor is recorded in the event metadata, so
+    payloads are decompressed when events are read, even if the selection
+    of compressors has since changed. A compressed payload is only used if it
+    is smaller, so payloads that don't compress (for example, payloads that
+    were encrypted by the application) are stored as they are.
+    """
+
+    def __init__(self, min_size: int = 64) -> None:
+        self.min_size = min_size
+        self._compressors: Dict[str, Compressor] = {}
+        self._ids_by_type: Dict[str, str] = {}
+        self._default_id: str | None = None
+
+    def register(
+        self,
+        compressor_id: str,
+        compressor: Compressor,
+        event_types: Iterable[str] = (),
+        default: bool = False,
+    ) -> None:
+        self._compressors[compressor_id] = compressor
+        for event_type in event_types:
+            self._ids_by_type[event_type] = compressor_id
+        if default:
+            self._default_id = compressor_id
+
+    def encode(
+        self, event_type: str, data: bytes, metadata: Dict[str, str]
+    ) -> Tuple[bytes, Dict[str, str]]:
+        compressor_id = self._ids_by_type.get(event_type, self._default_id)
+        if compressor_id is None or len(data) < self.min_size:
+            return data, metadata
+        compressed = self._compressors[compressor_id].compress(data)
+        if len(compressed) >= len(data):
+            return data, metadata
+        return compressed, {**metadata, COMPRESSION_METADATA_KEY: compressor_id}
+
+    def decode(
+        self, data: bytes, metadata: Mapping[str, str]
+    ) -> Tuple[bytes, Dict[str, str]]:
+        if COMPRESSION_METADATA_KEY not in metadata:
+            return data, dict(metadata)
+        metadata = dict(metadata)
+        compressor_id = metadata.pop(COMPRESSION_METADATA_KEY)
+        try:
+            compressor = self._compressors[compressor_id]
+        except KeyError:
+            msg = f"Compressor not registered: {compressor_id}"
+            raise ValueError(msg) from None
+        return compressor.decompress(data), metadata
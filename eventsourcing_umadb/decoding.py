@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import queue
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from types import TracebackType
+from typing import Any, Callable, Generic, List, Protocol, Sequence, TypeVar
+
+from eventsourcing_umadb.recorders import RawEvent
+
+S = TypeVar("S")
+T = TypeVar("T")
+S_co = TypeVar("S_co", covariant=True)
+
+
+class BatchedSubscription(Protocol[S_co]):
+    """
+    A subscription with next_raw_batch(), such as UmaDbSubscription and
+    UmaDbDcbSubscription.
+    """
+
+    def next_raw_batch(self) -> Sequence[RawEvent]: ...
+
+    def raw_event_constructor(self) -> Callable[[RawEvent], S_co]: ...
+
+    def stop(self) -> None: ...
+
+
+# Construct and decode functions of a worker process, set by the pool's
+# initializer.
+_worker_construct: Callable[[RawEvent], Any] | None = None
+_worker_decode: Callable[[Any], Any] | None = None
+
+
+def _init_worker(
+    construct: Callable[[RawEvent], Any], decode: Callable[[Any], Any]
+) -> None:
+    global _worker_construct, _worker_decode
+    _worker_construct = construct
+    _worker_decode = decode
+
+
+def _decode_in_worker(raw_events: Sequence[RawEvent]) -> List[Any]:
+    assert _worker_construct is not None and _worker_decode is not None
+    return [_worker_decode(_worker_construct(raw)) for raw in raw_events]
+
+
+def _decode(
+    construct: Callable[[RawEvent], S],
+    decode: Callable[[S], T],
+    raw_events: Sequence[RawEvent],
+) -> List[T]:
+    return [decode(construct(raw)) for raw in raw_events]
+
+
+_END = object()
+
+
+class DecodingPipeline(Generic[S, T]):
+    """
+    Decodes the items of a subscription in parallel, and returns the decoded
+    items in the order they were received.
+
+    A thread takes batches of raw events from the subscription, and submits
+    chunks of at most 'batch_size' raw events to a pool of 'max_workers'
+    processes, which decompress the payloads, construct the items and decode
+    them. At most 'max_chunks_in_flight' chunks are submitted but not yet
+    consumed, so a slow consumer holds back the subscription. The decode
+    function must be picklable, so it must be importable from a module.
+
+    An executor can be given instead, for example a ThreadPoolExecutor when
+    running on a free-threaded Python, in which case the construct and
+    decode functions are sent with each chunk.
+    """
+
+    def __init__(
+        self,
+        subscription: BatchedSubscription[S],
+        decode: Callable[[S], T],
+        max_workers: int | None = None,
+        batch_size: int = 100,
+        max_chunks_in_flight: int = 32,
+        executor: Executor | None = None,
+    ) -> None:
+        self.subscription = subscription
+        self.construct = subscription.raw_event_constructor()
+        self.decode = decode
+        self.batch_size = batch_size
+        self._own_executor = executor is None
+        self.executor: Executor = executor or ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(self.construct, decode),
+        )
+        self._chunks: queue.Queue[Future[List[T]] | BaseException | object] = (
+            queue.Queue(maxsize=max_chunks_in_flight)
+        )
+        self._decoded: List[T] = []
+        self._index = 0
+        self._has_been_stopped = False
+        self._thread = threading.Thread(target=self._submit_chunks, daemon=True)
+        self._thread.start()
+
+    def _submit(self, raw_events: Sequence[RawEvent]) -> Future[List[T]]:
+        if self._own_executor:
+            return self.executor.submit(_decode_in_worker, raw_events)
+        return self.executor.submit(_decode, self.construct, self.decode, raw_events)
+
+    def _put(self, item: Future[List[T]] | BaseException | object) -> None:
+        while not self._has_been_stopped:
+            try:
+                self._chunks.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return
+
+    def _submit_chunks(self) -> None:
+        try:
+            while not self._has_been_stopped:
+                batch = self.subscription.next_raw_batch()
+                if not batch:
+                    break
+                for i in range(0, len(batch), self.batch_size):
+                    self._put(self._submit(batch[i : i + self.batch_size]))
+        except BaseException as e:
+            self._put(e)
+        else:
+            self._put(_END)
+
+    def __iter__(self) -> DecodingPipeline[S, T]:
+        return self
+
+    def __next__(self) -> T:
+        while self._index == len(self._decoded):
+            if self._has_been_stopped:
+                raise StopIteration
+            try:
+                chunk = self._chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is _END:
+                self._has_been_stopped = True
+                raise StopIteration
+            if isinstance(chunk, BaseException):
+                raise chunk
+            assert isinstance(chunk, Future)
+            self._decoded = chunk.result()
+            self._index = 0
+        decoded = self._decoded[self._index]
+        self._index += 1
+        return decoded
+
+    def stop(self) -> None:
+        self._has_been_stopped = True
+        self.subscription.stop()
+        self._thread.join()
+        if self._own_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> DecodingPipeline[S, T]:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.stop()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+if TYPE_CHECKING:
+    import umadb
+
+    from eventsourcing_umadb.recorders import UmaDbClient
+
+
+class DeferredClient:
+    """
+    Constructs an UmaDB client when it is first used, so that applications
+    which never read or write events don't connect to the server. Call
+    warm_up() to connect before the first request instead.
+    """
+
+    def __init__(self, construct: Callable[[], UmaDbClient]) -> None:
+        self._construct = construct
+        self._client: UmaDbClient | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None
+
+    @property
+    def client(self) -> UmaDbClient:
+        client = self._client
+        if client is None:
+            with self._lock:
+                client = self._client
+                if client is None:
+                    client = self._client = self._construct()
+        return client
+
+    def warm_up(self) -> None:
+        """
+        Constructs the client now.
+        """
+        self.client
+
+    def read(
+        self,
+        query: umadb.Query | None = None,
+        start: int | None = None,
+        backwards: bool = False,
+        limit: int | None = None,
+    ) -> umadb.ReadResponse:
+        return self.client.read(
+            query=query, start=start, backwards=backwards, limit=limit
+        )
+
+    def subscribe(
+        self, query: umadb.Query | None = None, after: int | None = None
+    ) -> umadb.Subscription:
+        return self.client.subscribe(query=query, after=after)
+
+    def head(self) -> int | None:
+        return self.client.head()
+
+    def append(
+        self,
+        events: Sequence[umadb.Event],
+        condition: umadb.AppendCondition | None = None,
+        tracking_info: umadb.TrackingInfo | None = None,
+    ) -> int:
+        return self.client.append(
+            events=events, condition=condition, tracking_info=tracking_info
+        )
+
+    def get_tracking_info(self, source: str) -> int | None:
+        return self.client.get_tracking_info(source)
+
+    def __getattr__(self, name: str) -> Any:
+        # Other methods of the client, such as check_health().
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
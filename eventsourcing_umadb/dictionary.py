@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from typing import TYPE_CHECKING, Dict, List, Mapping, Sequence, Set
+
+import umadb
+
+from eventsourcing_umadb.recorders import UmaDbClient
+
+if TYPE_CHECKING:
+    from umadb import Subscription
+
+DICTIONARY_TYPE = "DictionaryEntry"
+DICTIONARY_TAG_PREFIX = "dictionary:"
+# Encoded topics start with this prefix, which topics never do.
+CODE_PREFIX = "~"
+# Encoded metadata is a mapping with only this key. Other mappings with only
+# one key that starts with the code prefix are escaped with another prefix.
+METADATA_CODE_KEY = "~"
+
+
+class WireDictionary:
+    """
+    Replaces topics, and optionally metadata, of stored events with short
+    codes, and replaces codes with the original values when events are read.
+
+    Values are registered as events in UmaDB, and the code of a value is the
+    position of its registration event, so codes are stable and the same in
+    all processes. Registrations are conditional, so a value has only one
+    code even when several processes register it at the same time. Codes
+    and values are cached in memory. Use a separate database for the
+    dictionary, because registrations are events that would otherwise be
+    seen by reads and subscriptions that match all events.
+
+    Only encode metadata if it has few distinct values, because each
+    distinct value is registered.
+
+    Values that aren't registered are also cached, if 'cache_misses' is
+    true, so that queries for topics that were never encoded don't read
+    the dictionary each time. A subscription to new registrations, which
+    is started when the first miss is cached, removes them from the cache.
+
+    Counts the sizes of the encoded values and codes, so that savings can
+    be measured.
+    """
+
+    def __init__(
+        self,
+        umadb: UmaDbClient,
+        encode_metadata: bool = False,
+        cache_misses: bool = True,
+    ) -> None:
+        self.umadb = umadb
+        self.encode_metadata_values = encode_metadata
+        self.cache_misses = cache_misses
+        self._codes: Dict[str, str] = {}
+        self._values: Dict[str, str] = {}
+        self._metadata: Dict[str, Dict[str, str]] = {}
+        self._missing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._subscription: Subscription | None = None
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self.original_size = 0
+        self.encoded_size = 0
+
+    @staticmethod
+    def _tag(value: str) -> str:
+        return DICTIONARY_TAG_PREFIX + hashlib.sha256(value.encode()).hexdigest()[:32]
+
+    def _cache(self, value: str, code: str) -> str:
+        with self._lock:
+            self._codes[value] = code
+            self._values[code] = value
+            self._missing.discard(value)
+        return code
+
+    def find_code(self, value: str) -> str | None:
+        """
+        Returns the code of a value, or None if the value isn't registered.
+        """
+        code = self._codes.get(value)
+        if code is not None:
+            return code
+        if value in self._missing:
+            return None
+        if self.cache_misses:
+            # Registrations after the read are received by the subscription.
+            self._follow_registrations()
+        for ue in self.umadb.read(
+            query=umadb.Query(
+                items=[
+                    umadb.QueryItem(types=[DICTIONARY_TYPE], tags=[self._tag(value)])
+                ]
+            ),
+            limit=1,
+        ):
+            if ue.event.data.decode() == value:
+                return self._cache(value, f"{CODE_PREFIX}{ue.position}")
+        if self.cache_misses:
+            with self._lock:
+                if value not in self._codes:
+                    self._missing.add(value)
+        return None
+
+    def _follow_registrations(self) -> None:
+        with self._lock:
+            if self._subscription is not None or self._closed:
+                return
+            self._subscription = self.umadb.subscribe(
+                query=umadb.Query(items=[umadb.QueryItem(types=[DICTIONARY_TYPE])]),
+                after=self.umadb.head(),
+            )
+        self._thread = threading.Thread(target=self._follow, daemon=True)
+        self._thread.start()
+
+    def _follow(self) -> None:
+        assert self._subscription is not None
+        try:
+            while batch := self._subscription.next_batch():
+                for ue in batch:
+                    self._cache(ue.event.data.decode(), f"{CODE_PREFIX}{ue.position}")
+        except umadb.CancelledByUserError:
+            if not self._closed:
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        if self._subscription is not None:
+            self._subscription.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    def code(self, value: str) -> str:
+        """
+        Returns the code of a value, registering the value if necessary.
+        """
+        code = self.find_code(value)
+        if code is not None:
+            return code
+        tag = self._tag(value)
+        try:
+            position = self.umadb.append(
+                events=[
+                    umadb.Event(
+                        event_type=DICTIONARY_TYPE, data=value.encode(), tags=[tag]
+                    )
+                ],
+                condition=umadb.AppendCondition(
+                    fail_if_events_match=umadb.Query(
+                        items=[umadb.QueryItem(types=[DICTIONARY_TYPE], tags=[tag])]
+                    )
+                ),
+            )
+        except umadb.IntegrityError:
+            # Registered by another process.
+            code = self.find_code(value)
+            if code is None:
+                raise
+            return code
+        return self._cache(value, f"{CODE_PREFIX}{position}")
+
+    def value(self, code: str) -> str:
+        value = self._values.get(code)
+        if value is not None:
+            return value
+        position = int(code[len(CODE_PREFIX) :])
+        for ue in self.umadb.read(start=position, limit=1):
+            if ue.position == position and ue.event.event_type == DICTIONARY_TYPE:
+                value = ue.event.data.decode()
+                self._cache(value, code)
+                return value
+        raise ValueError(f"Dictionary code not registered: {code}")
+
+    def encode_topic(self, topic: str) -> str:
+        code = self.code(topic)
+        self.original_size += len(topic)
+        self.encoded_size += len(code)
+        return code
+
+    def decode_topic(self, event_type: str) -> str:
+        if event_type.startswith(CODE_PREFIX):
+            return self.value(event_type)
+        return event_type
+
+    def encode_metadata(self, metadata: Dict[str, str]) -> Dict[str, str]:
+        if not self.encode_metadata_values or not metadata:
+            if len(metadata) == 1:
+                ((key, value),) = metadata.items()
+                if key.startswith(CODE_PREFIX):
+                    return {CODE_PREFIX + key: value}
+            return metadata
+        value = json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+        code = self.code(value)
+        self.original_size += len(value)
+        self.encoded_size += len(METADATA_CODE_KEY) + len(code)
+        return {METADATA_CODE_KEY: code}
+
+    def decode_metadata(self, metadata: Mapping[str, str]) -> Dict[str, str]:
+        if len(metadata) == 1:
+            ((key, value),) = metadata.items()
+            if key == METADATA_CODE_KEY:
+                decoded = self._metadata.get(value)
+                if decoded is None:
+                    decoded = self._metadata[value] = json.loads(self.value(value))
+                return dict(decoded)
+            if key.startswith(CODE_PREFIX):
+                return {key[len(CODE_PREFIX) :]: value}
+        return dict(metadata)
+
+    def query_types(self, topics: Sequence[str]) -> List[str]:
+        """
+        Returns the topics and the codes of the registered topics, so that a
+        query matches events recorded with and without encoding. Topics that
+        aren't registered are only looked up once, if misses are cached.
+        """
+        codes = [self.find_code(topic) for topic in topics]
+        return [*topics, *(code for code in codes if code is not None)]
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from hashlib import blake2b
+from typing import Iterable
+from uuid import UUID
+
+import umadb
+
+from eventsourcing_umadb.heads import HeadTrackingClient
+from eventsourcing_umadb.recorders import UmaDbClient
+
+ORIGINATOR_TAG_PREFIX = "originator:"
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings. Sized so that, with 'capacity' keys added, the
+    rate of false positives is about 'error_rate'. Keys that were added are
+    always found. The number of keys is counted approximately, by counting
+    keys that weren't found when they were added.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.num_keys = 0
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.num_keys > self.capacity
+
+    def _indexes(self, key: str) -> Iterable[int]:
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        is_new = False
+        for i in self._indexes(key):
+            byte, bit = i >> 3, 1 << (i & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                is_new = True
+        if is_new:
+            self.num_keys += 1
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and all(
+            self.bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(key)
+        )
+
+
+class ExistenceFilter:
+    """
+    Bloom filter of the originator IDs that have events in UmaDB, so that
+    selecting events of an originator that doesn't exist can be answered
+    without reading events.
+
+    Recorders that use the filter add originator IDs before their events are
+    appended. Events of other writers are added by a background subscription
+    that starts at the beginning of the log and then follows new events, or,
+    if 'subscribe' is false, by reading the log when the filter is
+    constructed. UmaDB returns whole events, so this reads all payloads once.
+
+    A miss is only definite if the filter has added the events up to the
+    head of the log. Otherwise the originator might exist, and its events
+    are read as usual. The head is read from the server at most once every
+    'head_max_staleness' seconds, so most misses are answered without a
+    call to the server, but an originator whose first events were appended
+    by another writer within that time can be reported as missing. If more
+    originators are added than the filter's capacity, the filter is disabled
+    and a warning is logged, because its false positive rate would grow.
+    """
+
+    def __init__(
+        self,
+        client: UmaDbClient,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.01,
+        subscribe: bool = True,
+        head_max_staleness: float = 0.1,
+    ) -> None:
+        self.client = client
+        self.head_tracker = HeadTrackingClient(
+            client, max_staleness=head_max_staleness, refresh=False
+        )
+        self.bloom_filter = BloomFilter(capacity, error_rate)
+        self.is_disabled = False
+        self._position: int | None = None
+        self._subscription: umadb.Subscription | None = None
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        if subscribe:
+            self._subscription = client.subscribe()
+            self._thread = threading.Thread(target=self._follow, daemon=True)
+            self._thread.start()
+        else:
+            response = client.read()
+            while not self.is_disabled and (batch := response.next_batch()):
+                self._add_events(batch)
+            if not self.is_disabled:
+                self._position = response.head() or self._position
+
+    @property
+    def position(self) -> int | None:
+        """
+        Position of the last event that has been added to the filter.
+        """
+        return self._position
+
+    def _add_events(self, batch: Iterable[umadb.SequencedEvent]) -> None:
+        for ue in batch:
+            for tag in ue.event.tags:
+                if tag.startswith(ORIGINATOR_TAG_PREFIX):
+                    self.add(tag[len(ORIGINATOR_TAG_PREFIX) :])
+                    break
+            self._position = ue.position
+
+    def _follow(self) -> None:
+        assert self._subscription is not None
+        try:
+            while not self._closed and not self.is_disabled:
+                batch = self._subscription.next_batch()
+                if not batch:
+                    break
+                self._add_events(batch)
+        except umadb.CancelledByUserError:
+            if not self._closed and not self.is_disabled:
+                raise
+
+    def add(self, originator_id: UUID | str) -> None:
+        self.bloom_filter.add(str(originator_id))
+        if self.bloom_filter.is_saturated and not self.is_disabled:
+            self.is_disabled = True
+            logger.warning(
+                "Existence filter disabled: more than %d originators were added",
+                self.bloom_filter.capacity,
+            )
+            if self._subscription is not None:
+                self._subscription.cancel()
+
+    def might_exist(self, originator_id: UUID | str) -> bool:
+        """
+        Returns False if the originator definitely has no events.
+        """
+        if self.is_disabled or str(originator_id) in self.bloom_filter:
+            return True
+        position = self._position
+        head = self.head_tracker.head()
+        return head is not None and (position is None or position < head)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._subscription is not None:
+            self._subscription.cancel()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import argparse
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Callable, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+import umadb
+from eventsourcing.dcb.api import DcbEvent, DcbSequencedEvent
+from eventsourcing.domain import NIL_UUID
+
+# File layout:
+#   MAGIC
+#   chunk*    -> CHUNK_HEADER (flags, stored size, number of records) + payload
+#   index     -> INDEX_ENTRY (first position, offset, number of records) per chunk
+#   FOOTER    -> (index offset, number of chunks, MAGIC)
+# Each chunk payload, zlib compressed if FLAG_ZLIB is set, is a sequence of
+# records, each prefixed with its length (see _encode_record).
+
+MAGIC = b"UMADBEX1"
+FLAG_ZLIB = 1
+CHUNK_HEADER = struct.Struct("<BII")
+INDEX_ENTRY = struct.Struct("<QQI")
+FOOTER = struct.Struct("<QI8s")
+RECORD_LENGTH = struct.Struct("<I")
+RECORD_HEADER = struct.Struct("<Q16sHIHH")
+SHORT_LENGTH = struct.Struct("<H")
+LONG_LENGTH = struct.Struct("<I")
+
+
+# Returns whether to decode a record, given its event type and tags.
+RecordSelector = Callable[[str, List[str]], bool]
+
+
+class ExportFormatError(Exception):
+    pass
+
+
+def export_events(
+    client: umadb.Client,
+    path: str | Path,
+    query: umadb.Query | None = None,
+    after: int | None = None,
+    chunk_size: int = 1000,
+    compress: bool = True,
+) -> int:
+    """
+    Writes events from UmaDB to an export file, and returns the number of
+    events that were written.
+    """
+    num_events = 0
+    index: List[Tuple[int, int, int]] = []
+    records: List[bytes] = []
+    first_position = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for ue in client.read(query=query, start=after + 1 if after else None):
+            if not records:
+                first_position = ue.position
+            records.append(_encode_record(ue.position, ue.event))
+            if len(records) == chunk_size:
+                index.append((first_position, f.tell(), len(records)))
+                _write_chunk(f, records, compress)
+                num_events += len(records)
+                records = []
+        if records:
+            index.append((first_position, f.tell(), len(records)))
+            _write_chunk(f, records, compress)
+            num_events += len(records)
+        index_offset = f.tell()
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+    return num_events
+
+
+def restore_events(
+    client: umadb.Client,
+    path: str | Path,
+    batch_size: int = 1000,
+    tracking_source: str | None = None,
+) -> int:
+    """
+    Appends events from an export file to UmaDB in unconditioned batches, and
+    returns the number of events that were appended. If a tracking source is
+    given, the exported position of the last event in each batch is recorded
+    with the batch, and a restore that was interrupted is resumed.
+    """
+    after = client.get_tracking_info(tracking_source) if tracking_source else None
+    num_events = 0
+    with ExportReader(path) as reader:
+        batch: List[DcbSequencedEvent] = []
+        for sequenced in reader.read(after=after):
+            batch.append(sequenced)
+            if len(batch) == batch_size:
+                num_events += _append_batch(client, batch, tracking_source)
+                batch = []
+        if batch:
+            num_events += _append_batch(client, batch, tracking_source)
+    return num_events
+
+
+def _append_batch(
+    client: umadb.Client,
+    batch: Sequence[DcbSequencedEvent],
+    tracking_source: str | None,
+) -> int:
+    client.append(
+        events=[
+            umadb.Event(
+                event_type=s.event.type,
+                data=s.event.data,
+                tags=s.event.tags,
+                uuid=s.event.uuid if s.event.uuid != NIL_UUID else None,
+                metadata=s.event.metadata,
+            )
+            for s in batch
+        ],
+        tracking_info=(
+            umadb.TrackingInfo(tracking_source, batch[-1].position)
+            if tracking_source
+            else None
+        ),
+    )
+    return len(batch)
+
+
+class ExportReader:
+    """
+    Reads an export file by memory-mapping it. Chunks are located with the
+    index in the footer, so reading after a given position doesn't need to
+    decode earlier chunks.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise ExportFormatError(f"Empty export file: {path}") from e
+        if (
+            len(self._mmap) < len(MAGIC) + FOOTER.size
+            or self._mmap[: len(MAGIC)] != MAGIC
+        ):
+            self.close()
+            raise ExportFormatError(f"Not an export file: {path}")
+        index_offset, num_chunks, magic = FOOTER.unpack_from(
+            self._mmap, len(self._mmap) - FOOTER.size
+        )
+        if magic != MAGIC:
+            self.close()
+            raise ExportFormatError(f"Export file is truncated: {path}")
+        self._index: List[Tuple[int, int, int]] = [
+            INDEX_ENTRY.unpack_from(self._mmap, index_offset + i * INDEX_ENTRY.size)
+            for i in range(num_chunks)
+        ]
+        self._first_positions = [entry[0] for entry in self._index]
+
+    def __len__(self) -> int:
+        return sum(entry[2] for entry in self._index)
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self._index)
+
+    def read(self, after: int | None = None) -> Iterator[DcbSequencedEvent]:
+        i = 0
+        if after is not None:
+            i = max(bisect_right(self._first_positions, after) - 1, 0)
+        for chunk_number in range(i, len(self._index)):
+            for sequenced in self.read_chunk(chunk_number):
+                if after is None or sequenced.position > after:
+                    yield sequenced
+
+    def read_chunk(
+        self, chunk_number: int, select: RecordSelector | None = None
+    ) -> List[DcbSequencedEvent]:
+        """
+        Returns the events of a chunk. If 'select' is given, only the records
+        it selects by event type and tags are decoded.
+        """
+        _, chunk_offset, _ = self._index[chunk_number]
+        flags, size, num_records = CHUNK_HEADER.unpack_from(self._mmap, chunk_offset)
+        start = chunk_offset + CHUNK_HEADER.size
+        with memoryview(self._mmap) as buf, buf[start : start + size] as payload:
+            if flags & FLAG_ZLIB:
+                return _decode_records(zlib.decompress(payload), num_records, select)
+            return _decode_records(payload, num_records, select)
+
+    def close(self) -> None:
+        if hasattr(self, "_mmap"):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> ExportReader:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def _write_chunk(f: IO[bytes], records: List[bytes], compress: bool) -> None:
+    payload = b"".join(RECORD_LENGTH.pack(len(r)) + r for r in records)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    f.write(CHUNK_HEADER.pack(flags, len(payload), len(records)))
+    f.write(payload)
+
+
+def _encode_record(position: int, event: umadb.Event) -> bytes:
+    event_type = event.event_type.encode()
+    tags = [t.encode() for t in event.tags]
+    metadata = [(k.encode(), v.encode()) for k, v in event.metadata.items()]
+    parts = [
+        RECORD_HEADER.pack(
+            position,
+            event.uuid.bytes if event.uuid else bytes(16),
+            len(event_type),
+            len(event.data),
+            len(tags),
+            len(metadata),
+        ),
+        event_type,
+        event.data,
+    ]
+    for tag in tags:
+        parts.append(SHORT_LENGTH.pack(len(tag)))
+        parts.append(tag)
+    for key, value in metadata:
+        parts.append(SHORT_LENGTH.pack(len(key)))
+        parts.append(key)
+        parts.append(LONG_LENGTH.pack(len(value)))
+        parts.append(value)
+    return b"".join(parts)
+
+
+def _decode_records(
+    buf: bytes | memoryview, num_records: int, select: RecordSelector | None = None
+) -> List[DcbSequencedEvent]:
+    records = []
+    offset = 0
+    for _ in range(num_records):
+        (length,) = RECORD_LENGTH.unpack_from(buf, offset)
+        offset += RECORD_LENGTH.size
+        record = _decode_record(buf, offset, select)
+        if record is not None:
+            records.append(record)
+        offset += length
+    return records
+
+
+def _decode_record(
+    buf: bytes | memoryview, offset: int, select: RecordSelector | None = None
+) -> DcbSequencedEvent | None:
+    position, uuid, len_type, len_data, num_tags, num_metadata = (
+        RECORD_HEADER.unpack_from(buf, offset)
+    )
+    offset += RECORD_HEADER.size
+    event_type = str(buf[offset : offset + len_type], "utf-8")
+    offset += len_type
+    # The data is copied after the record is selected.
+    data_offset = offset
+    offset += len_data
+    tags = []
+    for _ in range(num_tags):
+        (length,) = SHORT_LENGTH.unpack_from(buf, offset)
+        offset += SHORT_LENGTH.size
+        tags.append(str(buf[offset : offset + length], "utf-8"))
+        offset += length
+    if select is not None and not select(event_type, tags):
+        return None
+    data = bytes(buf[data_offset : data_offset + len_data])
+    metadata = {}
+    for _ in range(num_metadata):
+        (length,) = SHORT_LENGTH.unpack_from(buf, offset)
+        offset += SHORT_LENGTH.size
+        key = str(buf[offset : offset + length], "utf-8")
+        offset += length
+        (length,) = LONG_LENGTH.unpack_from(buf, offset)
+        offset += LONG_LENGTH.size
+        metadata[key] = str(buf[offset : offset + length], "utf-8")
+        offset += length
+    return DcbSequencedEvent(
+        position=position,
+        event=DcbEvent(
+            type=event_type,
+            data=data,
+            tags=tags,
+            uuid=UUID(bytes=uuid),
+            metadata=metadata,
+        ),
+    )
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m eventsourcing_umadb.export",
+        description="Export events from UmaDB to a file, or restore them.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("uri")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--after", type=int, default=None)
+    export_parser.add_argument("--types", nargs="*", default=[])
+    export_parser.add_argument("--tags", nargs="*", default=[])
+    export_parser.add_argument("--chunk-size", type=int, default=1000)
+    export_parser.add_argument("--no-compress", action="store_true")
+    restore_parser = subparsers.add_parser("restore")
+    restore_parser.add_argument("uri")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--batch-size", type=int, default=1000)
+    restore_parser.add_argument("--tracking-source", default=None)
+    parsed = parser.parse_args(args)
+
+    client = umadb.Client(url=parsed.uri)
+    try:
+        if parsed.command == "export":
+            query = (
+                umadb.Query(
+                    items=[umadb.QueryItem(types=parsed.types, tags=parsed.tags)]
+                )
+                if parsed.types or parsed.tags
+                else None
+            )
+            num_events = export_events(
+                client,
+                parsed.path,
+                query=query,
+                after=parsed.after,
+                chunk_size=parsed.chunk_size,
+                compress=not parsed.no_compress,
+            )
+            print(f"Exported {num_events} events to {parsed.path}")
+        else:
+            num_events = restore_events(
+                client,
+                parsed.path,
+                batch_size=parsed.batch_size,
+                tracking_source=parsed.tracking_source,
+            )
+            print(f"Restored {num_events} events from {parsed.path}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
+
 from types import TracebackType
-from typing import Self
+from typing import TYPE_CHECKING, Callable, Dict, List, Self
 
 from eventsourcing.dcb.api import DcbRecorder
 from eventsourcing.dcb.persistence import DcbInfrastructureFactory
@@ -12,32 +14,182 @@ from eventsourcing.persistence import (
     ProcessRecorder,
     TrackingRecorder,
 )
-from eventsourcing.utils import Environment, resolve_topic
-from umadb import Client
+from eventsourcing.utils import Environment, resolve_topic, strtobool
 
-from eventsourcing_umadb.recorders import (
-    UmaDbAggregateRecorder,
-    UmaDbApplicationRecorder,
-    UmaDbDcbRecorder,
-)
+from eventsourcing_umadb.deferred import DeferredClient
+
+if TYPE_CHECKING:
+    from eventsourcing_umadb.compression import PayloadCompression
+    from eventsourcing_umadb.dictionary import WireDictionary
+    from eventsourcing_umadb.existence import ExistenceFilter
+    from eventsourcing_umadb.interning import StringInterner
+    from eventsourcing_umadb.recorders import (
+        UmaDbAggregateRecorder,
+        UmaDbClient,
+        UmaDbDcbRecorder,
+    )
+    from eventsourcing_umadb.spool import AppendSpool
+
+# Modules that connect to UmaDB, such as 'umadb' and the recorders, are
+# imported when first needed, so that importing the package and
+# constructing a factory is quick.
 
 
 class BaseUmaDbFactory(BaseInfrastructureFactory[TrackingRecorder]):
     UMADB_URI = "UMADB_URI"
+    UMADB_SHARD_URIS = "UMADB_SHARD_URIS"
+    UMADB_REPLICA_URIS = "UMADB_REPLICA_URIS"
+    UMADB_PAYLOAD_COMPRESSION_TOPIC = "UMADB_PAYLOAD_COMPRESSION_TOPIC"
+    UMADB_MAX_APPENDS_IN_FLIGHT = "UMADB_MAX_APPENDS_IN_FLIGHT"
+    UMADB_HEAD_MAX_STALENESS = "UMADB_HEAD_MAX_STALENESS"
+    UMADB_EXISTENCE_FILTER_CAPACITY = "UMADB_EXISTENCE_FILTER_CAPACITY"
+    UMADB_DICTIONARY_URI = "UMADB_DICTIONARY_URI"
+    UMADB_DICTIONARY_ENCODE_METADATA = "UMADB_DICTIONARY_ENCODE_METADATA"
+    UMADB_INTERN_STRINGS = "UMADB_INTERN_STRINGS"
+    UMADB_SPOOL_PATH = "UMADB_SPOOL_PATH"
 
     def __init__(self, env: Environment):
         super().__init__(env)
+        shard_uris = self.env.get(self.UMADB_SHARD_URIS) or ""
+        self.shard_clients = [
+            DeferredClient(self._client_constructor(u.strip()))
+            for u in shard_uris.split(",")
+            if u.strip()
+        ]
         uri = self.env.get(self.UMADB_URI)
-        if uri is None:
+        self.umadb: DeferredClient
+        if uri is not None:
+            self.umadb = DeferredClient(lambda: self._construct_client(uri))
+        elif self.shard_clients:
+            self.umadb = self.shard_clients[0]
+        else:
             raise EnvironmentError(
                 f"'{self.UMADB_URI}' not found "
                 "in environment with keys: "
                 f"'{', '.join(self.env.create_keys(self.UMADB_URI))}'"
             )
-        self.umadb = Client(url=uri)
+        self.payload_compression = self._construct_payload_compression()
+        self.max_appends_in_flight = int(
+            self.env.get(self.UMADB_MAX_APPENDS_IN_FLIGHT) or 16
+        )
+        self.existence_filters: List[ExistenceFilter] = []
+        self.wire_dictionary = self._construct_wire_dictionary()
+        self.string_interner = self._construct_string_interner()
+        self.spools: Dict[str, AppendSpool] = {}
+        # Recorders have append pipelines, which are closed with the factory.
+        self.recorders: List[UmaDbAggregateRecorder | UmaDbDcbRecorder] = []
+
+    @staticmethod
+    def _client_constructor(uri: str) -> Callable[[], UmaDbClient]:
+        def construct() -> UmaDbClient:
+            from umadb import Client
+
+            return Client(url=uri)
+
+        return construct
+
+    def _construct_client(self, uri: str) -> UmaDbClient:
+        from umadb import Client
+
+        client: UmaDbClient = Client(url=uri)
+        head_max_staleness = self.env.get(self.UMADB_HEAD_MAX_STALENESS)
+        if head_max_staleness:
+            from eventsourcing_umadb.heads import HeadTrackingClient
+
+            # Tracks the head of the leader, rather than of a replica.
+            client = HeadTrackingClient(client, max_staleness=float(head_max_staleness))
+        replica_uris = self.env.get(self.UMADB_REPLICA_URIS) or ""
+        replica_clients: List[UmaDbClient] = [
+            Client(url=u.strip()) for u in replica_uris.split(",") if u.strip()
+        ]
+        if replica_clients:
+            from eventsourcing_umadb.replicas import ReplicaRoutingClient
+
+            client = ReplicaRoutingClient(client, replica_clients)
+        return client
+
+    def warm_up(self) -> None:
+        """
+        Connects to UmaDB now, rather than when events are first read or written.
+        """
+        self.umadb.warm_up()
+        for client in self.shard_clients:
+            client.warm_up()
+
+    def _construct_wire_dictionary(self) -> WireDictionary | None:
+        uri = self.env.get(self.UMADB_DICTIONARY_URI)
+        if not uri:
+            return None
+        from eventsourcing_umadb.dictionary import WireDictionary
+
+        return WireDictionary(
+            DeferredClient(self._client_constructor(uri)),
+            encode_metadata=strtobool(
+                self.env.get(self.UMADB_DICTIONARY_ENCODE_METADATA) or "no"
+            ),
+        )
+
+    def _construct_string_interner(self) -> StringInterner | None:
+        if not strtobool(self.env.get(self.UMADB_INTERN_STRINGS) or "no"):
+            return None
+        from eventsourcing_umadb.interning import StringInterner
+
+        return StringInterner()
+
+    def _construct_existence_filter(
+        self, client: UmaDbClient
+    ) -> ExistenceFilter | None:
+        capacity = self.env.get(self.UMADB_EXISTENCE_FILTER_CAPACITY)
+        if not capacity:
+            return None
+        from eventsourcing_umadb.existence import ExistenceFilter
+
+        existence_filter = ExistenceFilter(client, capacity=int(capacity))
+        self.existence_filters.append(existence_filter)
+        return existence_filter
+
+    def _construct_spool(self, shard: int | None = None) -> AppendSpool | None:
+        path = self.env.get(self.UMADB_SPOOL_PATH)
+        if not path:
+            return None
+        if shard is not None:
+            path = f"{path}.{shard}"
+        # A spool sends its events with the recorder that started it, so each
+        # recorder needs its own spool file.
+        if path in self.spools:
+            raise RuntimeError(f"Spool file is used by another recorder: {path}")
+        from eventsourcing_umadb.spool import AppendSpool
+
+        spool = self.spools[path] = AppendSpool(path)
+        return spool
+
+    def _construct_payload_compression(self) -> PayloadCompression | None:
+        topic = self.env.get(self.UMADB_PAYLOAD_COMPRESSION_TOPIC)
+        if not topic:
+            return None
+        from eventsourcing_umadb.compression import PayloadCompression
+
+        payload_compression: type[PayloadCompression] | PayloadCompression = (
+            resolve_topic(topic)
+        )
+        if isinstance(payload_compression, type):
+            payload_compression = payload_compression()
+        assert isinstance(payload_compression, PayloadCompression)
+        return payload_compression
 
     def close(self) -> None:
+        for spool in self.spools.values():
+            spool.close()
+        for recorder in self.recorders:
+            recorder.close()
+        for existence_filter in self.existence_filters:
+            existence_filter.close()
         self.umadb.close()
+        if self.wire_dictionary is not None:
+            self.wire_dictionary.close()
+            self.wire_dictionary.umadb.close()
+        for client in self.shard_clients:
+            client.close()
         super().close()
 
     def __del__(self) -> None:
@@ -51,11 +203,50 @@ class Factory(BaseUmaDbFactory, InfrastructureFactory[TrackingRecorder]):
     """
 
     def aggregate_recorder(self, purpose: str = "events") -> AggregateRecorder:
-        return UmaDbAggregateRecorder(
-            umadb=self.umadb, for_snapshotting=bool(purpose == "snapshots")
+        from eventsourcing_umadb.recorders import UmaDbAggregateRecorder
+        from eventsourcing_umadb.sharding import ShardedUmaDbAggregateRecorder
+
+        if self.shard_clients:
+            shards = [
+                UmaDbAggregateRecorder(
+                    umadb=client,
+                    for_snapshotting=bool(purpose == "snapshots"),
+                    payload_compression=self.payload_compression,
+                    max_appends_in_flight=self.max_appends_in_flight,
+                    existence_filter=self._construct_existence_filter(client),
+                    wire_dictionary=self.wire_dictionary,
+                    string_interner=self.string_interner,
+                    spool=self._construct_spool(shard),
+                )
+                for shard, client in enumerate(self.shard_clients)
+            ]
+            self.recorders.extend(shards)
+            return ShardedUmaDbAggregateRecorder(shards)
+        recorder = UmaDbAggregateRecorder(
+            umadb=self.umadb,
+            for_snapshotting=bool(purpose == "snapshots"),
+            payload_compression=self.payload_compression,
+            max_appends_in_flight=self.max_appends_in_flight,
+            existence_filter=self._construct_existence_filter(self.umadb),
+            wire_dictionary=self.wire_dictionary,
+            string_interner=self.string_interner,
+            spool=self._construct_spool(),
         )
+        self.recorders.append(recorder)
+        return recorder
 
     def application_recorder(self) -> ApplicationRecorder:
+        from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+
+        if self.shard_clients:
+            # Applications select and subscribe to notifications, which
+            # sharded recorders can't do, so fail before any are recorded.
+            raise EnvironmentError(
+                "Application recorders can't be constructed with"
+                f" '{self.UMADB_SHARD_URIS}', because notifications of shards"
+                " can only be read with ShardedUmaDbApplicationRecorder's"
+                " read_merged() and subscribe_merged()"
+            )
         application_recorder_topic = self.env.get(self.APPLICATION_RECORDER_TOPIC)
         if application_recorder_topic:
             application_recorder_class: type[UmaDbApplicationRecorder] = resolve_topic(
@@ -65,7 +256,17 @@ class Factory(BaseUmaDbFactory, InfrastructureFactory[TrackingRecorder]):
         else:
             application_recorder_class = UmaDbApplicationRecorder
 
-        return application_recorder_class(self.umadb)
+        recorder = application_recorder_class(
+            self.umadb,
+            payload_compression=self.payload_compression,
+            max_appends_in_flight=self.max_appends_in_flight,
+            existence_filter=self._construct_existence_filter(self.umadb),
+            wire_dictionary=self.wire_dictionary,
+            string_interner=self.string_interner,
+            spool=self._construct_spool(),
+        )
+        self.recorders.append(recorder)
+        return recorder
 
     def process_recorder(self) -> ProcessRecorder:
         raise NotImplementedError()
@@ -79,4 +280,13 @@ class Factory(BaseUmaDbFactory, InfrastructureFactory[TrackingRecorder]):
 
 class DcbFactory(BaseUmaDbFactory, DcbInfrastructureFactory[TrackingRecorder]):
     def dcb_recorder(self) -> DcbRecorder:
-        return UmaDbDcbRecorder(self.umadb)
+        from eventsourcing_umadb.recorders import UmaDbDcbRecorder
+
+        recorder = UmaDbDcbRecorder(
+            self.umadb,
+            payload_compression=self.payload_compression,
+            max_appends_in_flight=self.max_appends_in_flight,
+            string_interner=self.string_interner,
+        )
+        self.recorders.append(recorder)
+        return recorder
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Sequence
+
+import umadb
+
+from eventsourcing_umadb.recorders import UmaDbClient
+
+
+class HeadTrackingClient:
+    """
+    Wraps an UmaDB client, and answers head() from the latest known position
+    instead of making a call to the server each time.
+
+    The known position only moves forwards. It is updated by the results of
+    appends and by calls to the server's head(), which are made by a
+    background thread every 'max_staleness' / 2 seconds if 'refresh' is true.
+    The known position is used if it was updated within 'max_staleness'
+    seconds, otherwise head() calls the server. So head() makes at most one
+    call to the server every 'max_staleness' seconds, and none while the
+    background thread is refreshing the position.
+
+    The background thread is started by the first call of head(), and stops
+    when head() hasn't been called for 'idle_timeout' seconds, so a client
+    that isn't being read doesn't keep calling the server. It is started
+    again by the next call of head().
+
+    To know the head of the log rather than of a read replica, wrap the
+    client of the leader, before wrapping it with ReplicaRoutingClient.
+    """
+
+    def __init__(
+        self,
+        client: UmaDbClient,
+        max_staleness: float = 0.1,
+        refresh: bool = True,
+        poll_interval: float = 0.01,
+        idle_timeout: float = 10.0,
+    ) -> None:
+        self.client = client
+        self.max_staleness = max_staleness
+        self.refresh = refresh
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._position: int | None = None
+        self._updated_at = float("-inf")
+        self._used_at = float("-inf")
+        self._condition = threading.Condition()
+        self._closing = threading.Event()
+        self._thread_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def position(self) -> int | None:
+        """
+        The latest known position, without calling the server.
+        """
+        return self._position
+
+    def _observe(self, position: int | None) -> None:
+        with self._condition:
+            if position is not None and (
+                self._position is None or position > self._position
+            ):
+                self._position = position
+                self._condition.notify_all()
+            self._updated_at = time.monotonic()
+
+    def _refresh(self) -> int | None:
+        self._observe(self.client.head())
+        return self._position
+
+    def _start_refreshing(self) -> None:
+        with self._thread_lock:
+            if self._thread is None and not self._closing.is_set():
+                self._thread = threading.Thread(
+                    target=self._refresh_periodically, daemon=True
+                )
+                self._thread.start()
+
+    def _refresh_periodically(self) -> None:
+        while not self._closing.wait(self.max_staleness / 2):
+            with self._thread_lock:
+                if time.monotonic() - self._used_at > self.idle_timeout:
+                    self._thread = None
+                    return
+            try:
+                self._refresh()
+            except Exception:
+                # The server is called by head() after 'max_staleness'.
+                pass
+
+    def head(self) -> int | None:
+        self._used_at = time.monotonic()
+        if self.refresh and self._thread is None:
+            self._start_refreshing()
+        if time.monotonic() - self._updated_at > self.max_staleness:
+            return self._refresh()
+        return self._position
+
+    def wait_for_position(self, position: int, timeout: float | None = None) -> bool:
+        """
+        Blocks until the head is at or after the given position, calling the
+        server every 'poll_interval' seconds. Returns False if that doesn't
+        happen within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (self._refresh() or 0) < position:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            wait = self.poll_interval
+            if remaining is not None:
+                wait = min(wait, remaining)
+            with self._condition:
+                # Woken early by appends made with this client.
+                if self._position is None or self._position < position:
+                    self._condition.wait(wait)
+        return True
+
+    def read(
+        self,
+        query: umadb.Query | None = None,
+        start: int | None = None,
+        backwards: bool = False,
+        limit: int | None = None,
+    ) -> umadb.ReadResponse:
+        return self.client.read(
+            query=query, start=start, backwards=backwards, limit=limit
+        )
+
+    def subscribe(
+        self, query: umadb.Query | None = None, after: int | None = None
+    ) -> umadb.Subscription:
+        return self.client.subscribe(query=query, after=after)
+
+    def append(
+        self,
+        events: Sequence[umadb.Event],
+        condition: umadb.AppendCondition | None = None,
+        tracking_info: umadb.TrackingInfo | None = None,
+    ) -> int:
+        position = self.client.append(
+            events=events, condition=condition, tracking_info=tracking_info
+        )
+        with self._condition:
+            if self._position is None or position > self._position:
+                self._position = position
+                self._condition.notify_all()
+        return position
+
+    def get_tracking_info(self, source: str) -> int | None:
+        return self.client.get_tracking_info(source)
+
+    def __getattr__(self, name: str) -> Any:
+        # Other methods of the client, such as check_health().
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def close(self) -> None:
+        self._closing.set()
+        with self._thread_lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.client.close()
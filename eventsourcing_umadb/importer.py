@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import replace
+from functools import partial
+from queue import Queue
+from typing import Deque, Dict, List, Sequence, Tuple
+from uuid import NAMESPACE_OID, uuid5
+
+import umadb
+from eventsourcing.domain import NIL_UUID
+from eventsourcing.persistence import (
+    ApplicationRecorder,
+    IntegrityError,
+    Notification,
+    StoredEvent,
+)
+
+from eventsourcing_umadb.pipelining import AppendPipeline
+from eventsourcing_umadb.recorders import UmaDbAggregateRecorder
+
+
+class ImportVerificationError(Exception):
+    pass
+
+
+class UmaDbImporter:
+    """
+    Copies the notification log of an application recorder into UmaDB.
+
+    Pages of notifications are read from the source recorder in a background
+    thread, and appended as batches with up to 'max_batches_in_flight'
+    appends in flight. Batches with events of the same aggregate are
+    appended in order. The source position of the last notification of a
+    batch is recorded as UmaDB tracking info once it and all earlier batches
+    have been appended, so an interrupted import resumes from there.
+
+    Events without an ID are given one derived from the tracking source and
+    the notification ID. UmaDB doesn't record events again that have the
+    same IDs as recorded events, so batches that are appended again when an
+    import is resumed aren't duplicated.
+    """
+
+    def __init__(
+        self,
+        source: ApplicationRecorder,
+        target: UmaDbAggregateRecorder,
+        tracking_source: str = "import",
+        batch_size: int = 1000,
+        max_batches_in_flight: int = 4,
+    ) -> None:
+        self.source = source
+        self.target = target
+        self.tracking_source = tracking_source
+        self.batch_size = batch_size
+        self.max_batches_in_flight = max_batches_in_flight
+
+    def position(self) -> int | None:
+        return self.target.umadb.get_tracking_info(self.tracking_source)
+
+    def run(self, stop: int | None = None) -> int:
+        num_imported = 0
+        pages: Queue[Sequence[Notification] | BaseException | None] = Queue(
+            maxsize=self.max_batches_in_flight
+        )
+        is_stopping = threading.Event()
+        reader = threading.Thread(
+            target=self._read_pages,
+            args=(self.position(), stop, pages, is_stopping),
+            daemon=True,
+        )
+        reader.start()
+        pipeline = AppendPipeline(self.max_batches_in_flight)
+        # Batches in the order they were read, with the ID of their last
+        # notification.
+        in_flight: Deque[Tuple[Future[int], int]] = deque()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+                if isinstance(page, BaseException):
+                    raise page
+                stored_events = [self._stored_event(n) for n in page]
+                future = pipeline.submit(
+                    {str(s.originator_id) for s in stored_events},
+                    partial(self._append_batch, stored_events),
+                )
+                in_flight.append((future, page[-1].id))
+                num_imported += self._record_position(in_flight, wait=False)
+            num_imported += self._record_position(in_flight, wait=True)
+        finally:
+            is_stopping.set()
+            while reader.is_alive():
+                # Unblock the reader if it is waiting to put a page.
+                while not pages.empty():
+                    pages.get_nowait()
+                reader.join(timeout=0.1)
+            pipeline.close()
+        return num_imported
+
+    def _read_pages(
+        self,
+        start: int | None,
+        stop: int | None,
+        pages: Queue[Sequence[Notification] | BaseException | None],
+        is_stopping: threading.Event,
+    ) -> None:
+        try:
+            while not is_stopping.is_set():
+                page = self.source.select_notifications(
+                    start=start,
+                    limit=self.batch_size,
+                    stop=stop,
+                    inclusive_of_start=start is None,
+                )
+                if len(page) == 0:
+                    break
+                pages.put(page)
+                start = page[-1].id
+                if stop is not None and start >= stop:
+                    break
+        except BaseException as e:
+            pages.put(e)
+        else:
+            pages.put(None)
+
+    def _stored_event(self, notification: Notification) -> StoredEvent:
+        if notification.uuid != NIL_UUID:
+            return notification
+        return replace(
+            notification,
+            uuid=uuid5(NAMESPACE_OID, f"{self.tracking_source}:{notification.id}"),
+        )
+
+    def _append_batch(self, stored_events: Sequence[StoredEvent]) -> int:
+        try:
+            self.target._insert_events(stored_events)
+        except IntegrityError:
+            # Some of the events may have been recorded in a different batch
+            # by an earlier run, so only the others are appended.
+            recorded = self._find_recorded(stored_events)
+            remaining: List[StoredEvent] = []
+            for s in stored_events:
+                ue = recorded.get((str(s.originator_id), s.originator_version))
+                if ue is None:
+                    remaining.append(s)
+                elif ue.event.uuid != s.uuid:
+                    raise
+            if remaining:
+                self.target._insert_events(remaining)
+        return len(stored_events)
+
+    def _record_position(
+        self, in_flight: Deque[Tuple[Future[int], int]], wait: bool
+    ) -> int:
+        """
+        Removes the appended batches from the front of the queue, records the
+        position of the last of them, and returns the number of their events.
+        """
+        num_appended = 0
+        last_id: int | None = None
+        try:
+            while in_flight and (wait or in_flight[0][0].done()):
+                future, batch_last_id = in_flight[0]
+                num_appended += future.result()
+                in_flight.popleft()
+                last_id = batch_last_id
+        finally:
+            if last_id is not None:
+                self._track(last_id)
+        return num_appended
+
+    def _track(self, last_id: int) -> None:
+        try:
+            self.target.umadb.append(
+                events=[],
+                tracking_info=umadb.TrackingInfo(self.tracking_source, last_id),
+            )
+        except umadb.IntegrityError:
+            # Recorded already, for example when retrying after a lost response.
+            position = self.position()
+            if position is None or position < last_id:
+                raise
+
+    def _find_recorded(
+        self, stored_events: Sequence[StoredEvent], after: int | None = None
+    ) -> Dict[Tuple[str, int], umadb.SequencedEvent]:
+        """
+        Returns the recorded events that have the originator IDs and versions
+        of the given events, by originator ID and version.
+        """
+        ues = self.target.umadb.read(
+            query=umadb.Query(
+                items=[
+                    umadb.QueryItem(
+                        tags=[
+                            self.target._tag_originator_id(s.originator_id),
+                            self.target._tag_originator_version(
+                                s.originator_id, s.originator_version
+                            ),
+                        ]
+                    )
+                    for s in stored_events
+                ]
+            ),
+            start=after + 1 if after else None,
+        )
+        return {
+            (
+                self.target._extract_originator_id(ue),
+                self.target._extract_originator_version(ue),
+            ): ue
+            for ue in ues
+        }
+
+    def verify(self, target_after: int | None = None, stop: int | None = None) -> int:
+        """
+        Checks that each notification of the source log was recorded in the
+        target after the given target position, with the same ID, originator
+        ID, originator version, topic, state and metadata. Events of other
+        writers may be interleaved with the imported events.
+        """
+        num_verified = 0
+        source_start: int | None = None
+        while True:
+            notifications = self.source.select_notifications(
+                start=source_start,
+                limit=self.batch_size,
+                stop=stop,
+                inclusive_of_start=source_start is None,
+            )
+            if len(notifications) == 0:
+                break
+            stored_events = [self._stored_event(n) for n in notifications]
+            recorded = self._find_recorded(stored_events, after=target_after)
+            for notification, s in zip(notifications, stored_events):
+                ue = recorded.get((str(s.originator_id), s.originator_version))
+                if ue is None:
+                    msg = f"Notification {notification.id} not found in target"
+                    raise ImportVerificationError(msg)
+                if not self._is_match(s, ue):
+                    msg = (
+                        f"Notification {notification.id} doesn't match the event"
+                        f" at position {ue.position} in target"
+                    )
+                    raise ImportVerificationError(msg)
+                num_verified += 1
+            source_start = notifications[-1].id
+            if stop is not None and source_start >= stop:
+                break
+        return num_verified
+
+    def _is_match(self, stored_event: StoredEvent, ue: umadb.SequencedEvent) -> bool:
+        expected = self.target._construct_umadb_event(stored_event)
+        return (
+            ue.event.uuid == stored_event.uuid
+            and ue.event.event_type == expected.event_type
+            and ue.event.data == expected.data
+            and ue.event.tags == expected.tags
+            and ue.event.metadata == expected.metadata
+        )
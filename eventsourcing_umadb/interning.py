@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+
+class StringInterner:
+    """
+    Returns the same string object for equal strings, so that event types,
+    tags and originator IDs that are repeated across many events are held in
+    memory once, and dictionary lookups with them can compare by identity.
+
+    Unlike sys.intern(), the strings aren't kept for the life of the process.
+    When 'max_size' strings are held, they are all forgotten, so that reading
+    events with many distinct values, such as originator IDs of a large
+    replay, doesn't grow memory without bound.
+    """
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.max_size = max_size
+        self._strings: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern(self, value: str) -> str:
+        existing = self._strings.get(value)
+        if existing is not None:
+            return existing
+        if len(self._strings) >= self.max_size:
+            self._strings.clear()
+        self._strings[value] = value
+        return value
+
+    def intern_all(self, values: Iterable[str]) -> List[str]:
+        return [self.intern(value) for value in values]
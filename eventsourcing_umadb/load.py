@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+)
+from uuid import uuid4
+
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbQueryItem,
+    DcbRecorder,
+)
+from eventsourcing.persistence import (
+    AggregateRecorder,
+    IntegrityError,
+    StoredEvent,
+)
+
+# Name of the metadata item with the time an event was sent, from which
+# live subscriptions measure the latency of receiving the event.
+SENT_AT_KEY = "load-sent-at"
+PERCENTILES = (50.0, 95.0, 99.0, 99.9)
+# Histogram buckets per doubling of latency, which gives about 2% precision.
+BUCKETS_PER_DOUBLING = 32
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in logarithmic buckets, so that percentiles can be
+    estimated with constant memory, and histograms can be merged.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(1.0, seconds * 1e6)
+        index = math.ceil(math.log2(micros) * BUCKETS_PER_DOUBLING)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: LatencyHistogram) -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """
+        Returns the latency in seconds that the given percentage of the
+        recorded latencies don't exceed, or zero if none were recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.max, 2 ** (index / BUCKETS_PER_DOUBLING) / 1e6)
+        return self.max  # pragma: no cover
+
+    def percentiles(self) -> Dict[str, float]:
+        return {f"p{p:g}": self.percentile(p) for p in PERCENTILES}
+
+
+@dataclass
+class LoadInterval:
+    """
+    Latencies and outcomes of the operations that were due to start in
+    an interval of a load run.
+    """
+
+    start: float
+    duration: float
+    latencies: Dict[str, LatencyHistogram] = field(default_factory=dict)
+    conflicts: Dict[str, int] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        histogram = self.latencies.get(name)
+        if histogram is None:
+            histogram = self.latencies[name] = LatencyHistogram()
+        return histogram
+
+    def throughput(self, name: str) -> float:
+        histogram = self.latencies.get(name)
+        return histogram.count / self.duration if histogram else 0.0
+
+
+@dataclass
+class LoadReport:
+    intervals: List[LoadInterval]
+
+    @property
+    def names(self) -> List[str]:
+        names: Dict[str, None] = {}
+        for interval in self.intervals:
+            names.update(dict.fromkeys(interval.latencies))
+            names.update(dict.fromkeys(interval.errors))
+        return list(names)
+
+    def histogram(
+        self, name: str, intervals: Sequence[LoadInterval] | None = None
+    ) -> LatencyHistogram:
+        histogram = LatencyHistogram()
+        for interval in self.intervals if intervals is None else intervals:
+            if name in interval.latencies:
+                histogram.merge(interval.latencies[name])
+        return histogram
+
+    def throughput(
+        self, name: str, intervals: Sequence[LoadInterval] | None = None
+    ) -> float:
+        intervals = self.intervals if intervals is None else intervals
+        duration = sum(interval.duration for interval in intervals)
+        count = self.histogram(name, intervals).count
+        return count / duration if duration else 0.0
+
+    def count(self, name: str, outcome: str) -> int:
+        return sum(
+            getattr(interval, outcome).get(name, 0) for interval in self.intervals
+        )
+
+    def degraded(
+        self, max_throughput_drop: float = 0.2, max_p99_increase: float = 2.0
+    ) -> List[str]:
+        """
+        Returns the names of the operations whose throughput in the last
+        third of the run dropped by more than 'max_throughput_drop', or
+        whose p99 latency increased by more than 'max_p99_increase' times,
+        compared with the first third of the run.
+        """
+        third = len(self.intervals) // 3
+        if not third:
+            return []
+        first, last = self.intervals[:third], self.intervals[-third:]
+        degraded = []
+        for name in self.names:
+            before = self.throughput(name, first)
+            after = self.throughput(name, last)
+            p99_before = self.histogram(name, first).percentile(99)
+            p99_after = self.histogram(name, last).percentile(99)
+            if after < before * (1 - max_throughput_drop) or (
+                p99_before and p99_after > p99_before * max_p99_increase
+            ):
+                degraded.append(name)
+        return degraded
+
+    def summary(self) -> str:
+        lines = []
+        for name in self.names:
+            histogram = self.histogram(name)
+            percentiles = " ".join(
+                f"{key}={value * 1000:.2f}ms"
+                for key, value in histogram.percentiles().items()
+            )
+            lines.append(
+                f"{name}: {self.throughput(name):.0f}/s {percentiles}"
+                f" max={histogram.max * 1000:.2f}ms"
+                f" conflicts={self.count(name, 'conflicts')}"
+                f" errors={self.count(name, 'errors')}"
+            )
+        return "\n".join(lines)
+
+
+@dataclass
+class Operation:
+    """
+    An operation that is called at a target rate by a load generator. Calls
+    that raise IntegrityError are counted as conflicts, and calls that raise
+    other errors are counted as errors.
+    """
+
+    name: str
+    rate: float
+    call: Callable[[], Any]
+    concurrency: int = 4
+
+
+@dataclass
+class LiveSubscription:
+    """
+    A subscription whose items are received by a load generator, which
+    records the latency of receiving items that have a sent time.
+    """
+
+    name: str
+    subscribe: Callable[[], Iterator[Any]]
+    sent_at: Callable[[Any], float | None]
+
+
+class LoadGenerator:
+    """
+    Calls operations at target rates, and records latencies of the calls
+    in a histogram per operation and interval, so that percentiles can be
+    compared over the course of a long run.
+
+    Calls are scheduled at fixed times from the start of the run, and the
+    latency of a call is measured from the time at which it was due, so
+    that calls delayed because previous calls were slow aren't left out of
+    the latencies. Each operation is called by 'concurrency' threads.
+    """
+
+    def __init__(
+        self,
+        operations: Sequence[Operation],
+        subscriptions: Sequence[LiveSubscription] = (),
+        interval: float = 1.0,
+    ) -> None:
+        self.operations = operations
+        self.subscriptions = subscriptions
+        self.interval = interval
+        self._intervals: Dict[int, LoadInterval] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._started = 0.0
+
+    def _record(
+        self, name: str, due: float, latency: float | None, outcome: str = ""
+    ) -> None:
+        index = max(0, int((due - self._started) / self.interval))
+        with self._lock:
+            interval = self._intervals.get(index)
+            if interval is None:
+                interval = self._intervals[index] = LoadInterval(
+                    start=index * self.interval, duration=self.interval
+                )
+            if latency is not None:
+                interval.histogram(name).record(latency)
+            if outcome:
+                counts = getattr(interval, outcome)
+                counts[name] = counts.get(name, 0) + 1
+
+    def _call_operation(self, operation: Operation, schedule: Iterator[int]) -> None:
+        while not self._stopping.is_set():
+            with self._lock:
+                due = self._started + next(schedule) / operation.rate
+            delay = due - time.monotonic()
+            if delay > 0 and self._stopping.wait(delay):
+                return
+            try:
+                operation.call()
+            except IntegrityError:
+                self._record(operation.name, due, time.monotonic() - due, "conflicts")
+            except Exception:
+                self._record(operation.name, due, None, "errors")
+            else:
+                self._record(operation.name, due, time.monotonic() - due)
+
+    def _receive(self, subscription: LiveSubscription, items: Iterator[Any]) -> None:
+        try:
+            for item in items:
+                sent_at = subscription.sent_at(item)
+                if sent_at is not None:
+                    now = time.time()
+                    self._record(
+                        subscription.name,
+                        time.monotonic() - (now - sent_at),
+                        now - sent_at,
+                    )
+        except Exception:
+            if not self._stopping.is_set():
+                self._record(subscription.name, time.monotonic(), None, "errors")
+
+    def run(
+        self,
+        duration: float,
+        on_interval: Callable[[LoadInterval], None] | None = None,
+    ) -> LoadReport:
+        """
+        Calls the operations for 'duration' seconds, and returns the report.
+        Calls 'on_interval' with each interval after it has ended.
+        """
+        self._stopping.clear()
+        self._intervals.clear()
+        live = [(s, s.subscribe()) for s in self.subscriptions]
+        self._started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._receive, args=(s, items), daemon=True)
+            for s, items in live
+        ]
+        for operation in self.operations:
+            schedule = iter(range(2**62))
+            threads.extend(
+                threading.Thread(
+                    target=self._call_operation,
+                    args=(operation, schedule),
+                    daemon=True,
+                )
+                for _ in range(operation.concurrency)
+            )
+        for thread in threads:
+            thread.start()
+        num_intervals = max(1, math.ceil(duration / self.interval))
+        try:
+            for index in range(num_intervals):
+                end = self._started + (index + 1) * self.interval
+                if self._stopping.wait(max(0.0, end - time.monotonic())):
+                    break
+                if on_interval is not None:
+                    with self._lock:
+                        interval = self._intervals.get(index)
+                    if interval is not None:
+                        on_interval(interval)
+        finally:
+            self._stopping.set()
+            for _, items in live:
+                stop = getattr(items, "stop", None)
+                if stop is not None:
+                    stop()
+            for thread in threads:
+                thread.join(timeout=10)
+        # Calls that were due after the end of the run are left out.
+        return LoadReport(
+            [self._intervals[i] for i in range(num_intervals) if i in self._intervals]
+        )
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+def sent_at_metadata(item: Any) -> float | None:
+    sent_at = getattr(item, "metadata", {}).get(SENT_AT_KEY)
+    if sent_at is None and hasattr(item, "event"):
+        sent_at = item.event.metadata.get(SENT_AT_KEY)
+    return None if sent_at is None else float(sent_at)
+
+
+def aggregate_save(
+    recorder: AggregateRecorder,
+    num_aggregates: int = 100,
+    conflict_ratio: float = 0.05,
+    state_size: int = 100,
+) -> Callable[[], None]:
+    """
+    Returns a function that records the next event of one of a fixed set of
+    aggregates. Concurrent calls for the same aggregate conflict, and so do
+    a 'conflict_ratio' of the calls, which use a stale version, as a
+    command handling a stale aggregate would. A conflicting call finds the
+    current version before raising the error.
+    """
+    originator_ids = [str(uuid4()) for _ in range(num_aggregates)]
+    versions = dict.fromkeys(originator_ids, 1)
+    state = os.urandom(state_size)
+
+    def call() -> None:
+        originator_id = random.choice(originator_ids)
+        version = versions[originator_id]
+        if version > 1 and random.random() < conflict_ratio:
+            version -= 1
+        try:
+            recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic="eventsourcing_umadb.load:Saved",
+                        state=state,
+                        uuid=uuid4(),
+                        metadata={SENT_AT_KEY: repr(time.time())},
+                    )
+                ]
+            )
+        except IntegrityError:
+            last = recorder.select_events(originator_id, desc=True, limit=1)
+            versions[originator_id] = last[0].originator_version + 1 if last else 1
+            raise
+        versions[originator_id] = max(versions[originator_id], version + 1)
+
+    return call
+
+
+def dcb_append(
+    recorder: DcbRecorder,
+    num_hot_tags: int = 10,
+    cold_ratio: float = 0.9,
+    conflict_ratio: float = 0.05,
+    data_size: int = 100,
+) -> Callable[[], None]:
+    """
+    Returns a function that appends an event with a consistency condition
+    on its tag, as a decision would. A 'cold_ratio' of the events have a
+    new tag, and the others have one of a few hot tags, for which
+    concurrent calls conflict, and so do a 'conflict_ratio' of the calls,
+    which use a stale position.
+    """
+    hot_tags = [f"load-hot:{uuid4()}" for _ in range(num_hot_tags)]
+    positions: Dict[str, int | None] = dict.fromkeys(hot_tags)
+    data = os.urandom(data_size)
+
+    def call() -> None:
+        if not hot_tags or random.random() < cold_ratio:
+            tag = f"load-cold:{uuid4()}"
+        else:
+            tag = random.choice(hot_tags)
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        after = positions.get(tag)
+        if after is not None and random.random() < conflict_ratio:
+            after -= 1
+        try:
+            position = recorder.append(
+                [
+                    DcbEvent(
+                        type="LoadAppended",
+                        data=data,
+                        tags=[tag],
+                        uuid=uuid4(),
+                        metadata={SENT_AT_KEY: repr(time.time())},
+                    )
+                ],
+                DcbAppendCondition(fail_if_events_match=query, after=after),
+            )
+        except IntegrityError:
+            positions[tag] = recorder.head()
+            raise
+        if tag in positions:
+            positions[tag] = max(positions[tag] or 0, position)
+
+    return call
+
+
+def catch_up_read(recorder: DcbRecorder, limit: int = 100) -> Callable[[], int]:
+    """
+    Returns a function that reads a page of events from a random position,
+    as a reader catching up would.
+    """
+
+    def call() -> int:
+        head = recorder.head() or 0
+        after = random.randint(0, max(0, head - limit))
+        return sum(1 for _ in recorder.read(after=after, limit=limit))
+
+    return call
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m eventsourcing_umadb.load",
+        description=(
+            "Run a mixed workload against UmaDB, configured with the usual"
+            " environment variables, and report latency percentiles."
+        ),
+    )
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--save-rate", type=float, default=100.0)
+    parser.add_argument("--append-rate", type=float, default=100.0)
+    parser.add_argument("--read-rate", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--no-subscribe", action="store_true")
+    parsed = parser.parse_args(args)
+
+    from eventsourcing.utils import Environment
+
+    from eventsourcing_umadb.factory import DcbFactory, Factory
+
+    env = Environment(env=os.environ)
+    with Factory(env) as factory, DcbFactory(env) as dcb_factory:
+        application_recorder = factory.application_recorder()
+        dcb_recorder = dcb_factory.dcb_recorder()
+        rates: Mapping[str, Tuple[float, Callable[[], Any]]] = {
+            "aggregate-save": (parsed.save_rate, aggregate_save(application_recorder)),
+            "dcb-append": (parsed.append_rate, dcb_append(dcb_recorder)),
+            "catch-up-read": (parsed.read_rate, catch_up_read(dcb_recorder)),
+        }
+        operations = [
+            Operation(name, rate, call, parsed.concurrency)
+            for name, (rate, call) in rates.items()
+            if rate > 0
+        ]
+        subscriptions = []
+        if not parsed.no_subscribe:
+            subscriptions.append(
+                LiveSubscription(
+                    "subscription",
+                    lambda: dcb_recorder.subscribe(after=dcb_recorder.head()),
+                    sent_at_metadata,
+                )
+            )
+        generator = LoadGenerator(operations, subscriptions, parsed.interval)
+
+        def print_interval(interval: LoadInterval) -> None:
+            for name, histogram in interval.latencies.items():
+                p = histogram.percentiles()
+                print(
+                    f"{interval.start:8.0f}s {name}:"
+                    f" {interval.throughput(name):.0f}/s"
+                    f" p50={p['p50'] * 1000:.2f}ms p99={p['p99'] * 1000:.2f}ms"
+                )
+
+        report = generator.run(parsed.duration, print_interval)
+    print(report.summary())
+    degraded = report.degraded()
+    if degraded:
+        print(f"Degraded: {', '.join(degraded)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+from typing import Iterator, Sequence
+
+from eventsourcing.persistence import ApplicationRecorder, Notification
+
+
+def notification_size(notification: Notification) -> int:
+    """
+    Returns the approximate number of bytes of a notification's topic,
+    state and metadata.
+    """
+    return (
+        len(notification.topic)
+        + len(notification.state)
+        + sum(len(k) + len(v) for k, v in notification.metadata.items())
+    )
+
+
+class AdaptivePageSize:
+    """
+    Chooses the limit of the next page from the sizes and durations of the
+    previous pages, so that pages have about 'target_bytes' bytes and take
+    about 'target_seconds' to select.
+
+    The bytes per notification are averaged over pages, with 'smoothing'
+    as the weight of the latest page. Durations include a cost per page,
+    such as finding the first matching event, so the limit is halved after
+    a page that took longer than the target, rather than scaled to it. The
+    limit grows at most by 'max_growth' times per page, and only after a
+    full page, so that a page of large events after a page of small ones
+    doesn't take much more memory than intended.
+    """
+
+    def __init__(
+        self,
+        target_bytes: int = 1_000_000,
+        target_seconds: float = 0.1,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 10_000,
+        max_growth: float = 4.0,
+        smoothing: float = 0.5,
+    ) -> None:
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("Limits must be 1 <= min <= initial <= max")
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_growth = max_growth
+        self.smoothing = smoothing
+        self.limit = initial_limit
+        self.bytes_per_notification: float | None = None
+
+    def observe(self, num_notifications: int, num_bytes: int, seconds: float) -> int:
+        """
+        Updates the limit after a page, and returns the next limit.
+        """
+        if not num_notifications:
+            return self.limit
+        bytes_each = num_bytes / num_notifications
+        if self.bytes_per_notification is None:
+            self.bytes_per_notification = bytes_each
+        else:
+            self.bytes_per_notification += self.smoothing * (
+                bytes_each - self.bytes_per_notification
+            )
+        limit = self.target_bytes / max(self.bytes_per_notification, 1.0)
+        if seconds > self.target_seconds:
+            limit = min(limit, self.limit / 2)
+        elif num_notifications == self.limit:
+            limit = min(limit, self.limit * self.max_growth)
+        else:
+            # A short page may be the end of the log, not a reason to grow.
+            limit = min(limit, self.limit)
+        self.limit = max(self.min_limit, min(self.max_limit, int(limit)))
+        return self.limit
+
+
+class AdaptiveNotificationReader:
+    """
+    Reads notifications from an application recorder in pages whose limits
+    are chosen by AdaptivePageSize, so that there are few round trips when
+    events are small, and pages of large events don't use too much memory.
+    Only one page is held at a time.
+    """
+
+    def __init__(
+        self,
+        recorder: ApplicationRecorder,
+        page_size: AdaptivePageSize | None = None,
+    ) -> None:
+        self.recorder = recorder
+        self.page_size = page_size or AdaptivePageSize()
+
+    def pages(
+        self,
+        start: int | None = None,
+        stop: int | None = None,
+        topics: Sequence[str] = (),
+        *,
+        inclusive_of_start: bool = True,
+    ) -> Iterator[Sequence[Notification]]:
+        """
+        Yields pages of notifications from 'start' to 'stop', or to the end
+        of the log as it was when the last page was selected.
+        """
+        while True:
+            limit = self.page_size.limit
+            started = time.perf_counter()
+            page = self.recorder.select_notifications(
+                start,
+                limit,
+                stop,
+                topics,
+                inclusive_of_start=inclusive_of_start,
+            )
+            duration = time.perf_counter() - started
+            if not page:
+                return
+            self.page_size.observe(
+                len(page), sum(notification_size(n) for n in page), duration
+            )
+            yield page
+            last_id = page[-1].id
+            if len(page) < limit or (stop is not None and last_id >= stop):
+                return
+            start, inclusive_of_start = last_id, False
+
+    def read(
+        self,
+        start: int | None = None,
+        stop: int | None = None,
+        topics: Sequence[str] = (),
+        *,
+        inclusive_of_start: bool = True,
+    ) -> Iterator[Notification]:
+        for page in self.pages(
+            start, stop, topics, inclusive_of_start=inclusive_of_start
+        ):
+            yield from page
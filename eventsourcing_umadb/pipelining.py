@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Collection, Dict, List, Set, TypeVar
+
+from eventsourcing.persistence import IntegrityError
+
+T = TypeVar("T")
+
+
+class AppendPipeline:
+    """
+    Runs appends in a pool of threads, so that a caller can have several
+    appends in flight instead of waiting for each to be acknowledged.
+
+    Each append has keys (for example, originator IDs or tags), and waits for
+    appends that were submitted earlier with any of the same keys, so that
+    dependent appends are made in the order they were submitted. If one of
+    those appends fails, the dependent append fails with IntegrityError
+    without being made. Appends without keys wait for all earlier appends.
+
+    Submitting blocks while 'max_in_flight' appends are not yet finished.
+    """
+
+    def __init__(self, max_in_flight: int = 16) -> None:
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="umadb-append"
+        )
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._last_by_key: Dict[str, Future[Any]] = {}
+        self._in_flight: Set[Future[Any]] = set()
+        self._barrier: Future[Any] | None = None
+
+    def submit(self, keys: Collection[str] | None, fn: Callable[[], T]) -> Future[T]:
+        self._slots.acquire()
+        future: Future[T] = Future()
+        with self._lock:
+            if keys is None:
+                dependencies = list(self._in_flight)
+                self._barrier = future
+            else:
+                dependencies = [
+                    self._last_by_key[k] for k in keys if k in self._last_by_key
+                ]
+                if self._barrier is not None:
+                    dependencies.append(self._barrier)
+                for key in keys:
+                    self._last_by_key[key] = future
+            self._in_flight.add(future)
+        future.add_done_callback(lambda f: self._done(f, keys))
+        try:
+            self._executor.submit(self._run, future, fn, dependencies)
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def _run(
+        self, future: Future[T], fn: Callable[[], T], dependencies: List[Future[Any]]
+    ) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        wait(dependencies)
+        if any(d.cancelled() or d.exception() is not None for d in dependencies):
+            future.set_exception(IntegrityError("An earlier dependent append failed"))
+            return
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def _done(self, future: Future[T], keys: Collection[str] | None) -> None:
+        with self._lock:
+            self._in_flight.discard(future)
+            if keys is None:
+                if self._barrier is future:
+                    self._barrier = None
+            else:
+                for key in keys:
+                    if self._last_by_key.get(key) is future:
+                        del self._last_by_key[key]
+        self._slots.release()
+
+    def join(self) -> None:
+        """
+        Waits for the appends that have been submitted to finish.
+        """
+        with self._lock:
+            in_flight = list(self._in_flight)
+        wait(in_flight)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
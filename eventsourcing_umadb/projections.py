@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Dict, Generic, List, Tuple
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbQuery
+
+from eventsourcing_umadb.compression import PayloadCompression
+from eventsourcing_umadb.replay import ReplayHandler, T, tag_partition
+
+CHECKPOINT_TYPE = "ProjectionCheckpoint"
+CHECKPOINT_POSITION_KEY = "position"
+
+
+def tracking_source(name: str, partition: int, num_partitions: int) -> str:
+    return f"{name}:{partition}/{num_partitions}"
+
+
+def checkpoint_tag(source: str) -> str:
+    return f"projection-checkpoint:{source}"
+
+
+@dataclass(frozen=True)
+class ProjectionProgress:
+    """
+    Positions of the last event processed by each partition, and the head
+    of the database when the progress was taken.
+    """
+
+    positions: Tuple[int, ...]
+    head: int | None
+
+    @property
+    def position(self) -> int:
+        """
+        All events up to this position have been processed by all partitions.
+        """
+        return min(self.positions)
+
+    @property
+    def lag(self) -> int:
+        return max(0, (self.head or 0) - self.position)
+
+
+class PartitionedProjectionRunner(Generic[T]):
+    """
+    Runs a projection in one worker process per partition. Each worker
+    subscribes to the events that match the query, and gives its handler
+    the events whose first tag with 'partition_tag_prefix' hashes to its
+    partition, using the same hash as replay_partitioned(). So events with
+    the same tag value are processed by the same handler, in order, and
+    the same handler class can rebuild a projection from an export file
+    and then follow new events.
+
+    Every 'checkpoint_interval' seconds, and when it is stopped, each
+    worker records the position of the last event it processed as UmaDB
+    tracking information, with a source named after the runner and the
+    partition, and continues after that position when it is started again.
+
+    The state of a handler, from get_state(), is recorded in a separate
+    UmaDB database, 'checkpoint_uri', so that checkpoints aren't events of
+    the projected log. The state is appended as a checkpoint event, with
+    the tracking information in the same append, so the state and the
+    position are recorded together or not at all. When a worker is started
+    again, it restores the state of its handler with set_state(), so events
+    processed since the last checkpoint of a failed worker are processed
+    again by a handler that hasn't seen them. Without 'checkpoint_uri', the
+    position is recorded in the projected database, and handlers must not
+    have state to record. Handlers that write to other stores must write
+    the position with their state in one transaction themselves.
+
+    Workers only construct and decompress the events of their partition.
+    The handler class must be importable from a module, because workers
+    are started with the 'spawn' method.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        handler_class: type[ReplayHandler[T]],
+        num_partitions: int,
+        name: str,
+        partition_tag_prefix: str = "originator:",
+        query: DcbQuery | None = None,
+        payload_compression: PayloadCompression | None = None,
+        checkpoint_interval: float = 1.0,
+        checkpoint_uri: str | None = None,
+    ) -> None:
+        if checkpoint_uri == uri:
+            raise ValueError("Checkpoints must be recorded in another database")
+        self.uri = uri
+        self.num_partitions = num_partitions
+        self.name = name
+        context = multiprocessing.get_context("spawn")
+        self._positions = context.Array("q", num_partitions, lock=False)
+        # A flag that workers poll, because a multiprocessing Event can't be
+        # set without blocking after a process waiting for it has exited.
+        self._stopping = context.Value("b", 0, lock=False)
+        self._results: multiprocessing.Queue[Tuple[int, Any, BaseException | None]]
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_run_partition,
+                args=(
+                    uri,
+                    handler_class,
+                    tracking_source(name, partition, num_partitions),
+                    partition,
+                    num_partitions,
+                    partition_tag_prefix,
+                    query,
+                    payload_compression,
+                    checkpoint_interval,
+                    checkpoint_uri,
+                    self._positions,
+                    self._stopping,
+                    self._results,
+                ),
+                daemon=True,
+            )
+            for partition in range(num_partitions)
+        ]
+        self._reports: Dict[int, Tuple[Any, BaseException | None]] = {}
+        self._client: Any = None
+
+    def start(self) -> None:
+        for process in self._processes:
+            process.start()
+
+    def progress(self) -> ProjectionProgress:
+        """
+        Returns the progress of the partitions. Raises the error of a worker
+        that has failed.
+        """
+        self._check_errors()
+        if self._client is None:
+            from umadb import Client
+
+            self._client = Client(url=self.uri)
+        return ProjectionProgress(
+            positions=tuple(self._positions), head=self._client.head()
+        )
+
+    def wait_for_position(self, position: int, timeout: float | None = None) -> bool:
+        """
+        Blocks until all partitions have processed the events up to the given
+        position. Returns False if that doesn't happen within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while min(self._positions) < position:
+            self._check_errors()
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _receive_reports(self, timeout: float) -> None:
+        try:
+            while True:
+                partition, result, error = self._results.get(timeout=timeout)
+                self._reports[partition] = (result, error)
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    def _check_errors(self) -> None:
+        self._receive_reports(timeout=0)
+        for _, error in self._reports.values():
+            if error is not None:
+                raise error
+
+    def stop(self) -> List[T]:
+        """
+        Stops the workers, and returns the results of the handlers, in
+        partition order.
+        """
+        self._stopping.value = 1
+        while len(self._reports) < self.num_partitions and any(
+            p.is_alive() for p in self._processes
+        ):
+            self._receive_reports(timeout=0.1)
+        self._receive_reports(timeout=0)
+        for process in self._processes:
+            process.join()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        self._check_errors()
+        results: List[T] = []
+        for partition, process in enumerate(self._processes):
+            if partition not in self._reports:
+                raise RuntimeError(
+                    f"Worker of partition {partition} exited with code"
+                    f" {process.exitcode}"
+                )
+            results.append(self._reports[partition][0])
+        return results
+
+    def __enter__(self) -> PartitionedProjectionRunner[T]:
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        if not self._stopping.value:
+            self.stop()
+
+
+def _run_partition(
+    uri: str,
+    handler_class: type[ReplayHandler[T]],
+    source: str,
+    partition: int,
+    num_partitions: int,
+    partition_tag_prefix: str,
+    query: DcbQuery | None,
+    payload_compression: PayloadCompression | None,
+    checkpoint_interval: float,
+    checkpoint_uri: str | None,
+    positions: Any,
+    stopping: Any,
+    results: multiprocessing.Queue[Tuple[int, Any, BaseException | None]],
+) -> None:
+    import umadb
+
+    from eventsourcing_umadb.recorders import UmaDbDcbRecorder, UmaDbDcbSubscription
+
+    try:
+        client = umadb.Client(url=uri)
+        store = umadb.Client(url=checkpoint_uri) if checkpoint_uri else None
+        try:
+            recorder = UmaDbDcbRecorder(client, payload_compression=payload_compression)
+            after = (store or client).get_tracking_info(source)
+            handler = handler_class(partition, num_partitions)
+            if store is not None and after is not None:
+                _restore(store, handler, source, after)
+            positions[partition] = after or 0
+            subscription = recorder.subscribe(query, after=after)
+            assert isinstance(subscription, UmaDbDcbSubscription)
+            construct = subscription.raw_event_constructor()
+
+            def stop_when_set() -> None:
+                while not stopping.value:
+                    time.sleep(0.05)
+                subscription.stop()
+
+            threading.Thread(target=stop_when_set, daemon=True).start()
+            position = checkpointed = after
+            next_checkpoint = time.monotonic() + checkpoint_interval
+            while raw_batch := subscription.next_raw_batch():
+                # Raw events are position, type, data, tags, ID and metadata.
+                events = [
+                    construct(raw)
+                    for raw in raw_batch
+                    if tag_partition(raw[3], partition_tag_prefix, num_partitions)
+                    == partition
+                ]
+                if events:
+                    handler.process_events(events)
+                position = raw_batch[-1][0]
+                positions[partition] = position
+                if time.monotonic() >= next_checkpoint:
+                    _checkpoint(client, store, handler, source, position)
+                    checkpointed = position
+                    next_checkpoint = time.monotonic() + checkpoint_interval
+            if position is not None and position != checkpointed:
+                _checkpoint(client, store, handler, source, position)
+            result = handler.result()
+        finally:
+            client.close()
+            if store is not None:
+                store.close()
+    except BaseException as e:
+        results.put((partition, None, _picklable(e)))
+    else:
+        results.put((partition, result, None))
+
+
+def _checkpoint(
+    client: Any,
+    store: Any,
+    handler: ReplayHandler[Any],
+    source: str,
+    position: int,
+) -> None:
+    import umadb
+
+    tracking_info = umadb.TrackingInfo(source, position)
+    state = handler.get_state()
+    if state is None:
+        (store or client).append([], tracking_info=tracking_info)
+        return
+    if store is None:
+        raise RuntimeError("Handler state can only be recorded with checkpoint_uri")
+    store.append(
+        [
+            umadb.Event(
+                event_type=CHECKPOINT_TYPE,
+                data=state,
+                tags=[checkpoint_tag(source)],
+                uuid=uuid4(),
+                metadata={CHECKPOINT_POSITION_KEY: str(position)},
+            )
+        ],
+        tracking_info=tracking_info,
+    )
+
+
+def _restore(
+    store: Any, handler: ReplayHandler[Any], source: str, position: int
+) -> None:
+    import umadb
+
+    checkpoints = list(
+        store.read(
+            query=umadb.Query(
+                items=[
+                    umadb.QueryItem(
+                        types=[CHECKPOINT_TYPE], tags=[checkpoint_tag(source)]
+                    )
+                ]
+            ),
+            backwards=True,
+            limit=1,
+        )
+    )
+    if not checkpoints:
+        # The handler had no state to record.
+        return
+    if int(checkpoints[0].event.metadata[CHECKPOINT_POSITION_KEY]) != position:
+        raise RuntimeError(
+            f"Last checkpoint of {source} isn't at its tracked position {position}"
+        )
+    handler.set_state(checkpoints[0].event.data)
+
+
+def _picklable(error: BaseException) -> BaseException:
+    try:
+        pickle.loads(pickle.dumps(error))
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+    return error
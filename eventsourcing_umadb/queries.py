@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Sequence, Tuple
+
+import umadb
+from eventsourcing.dcb.api import DcbQuery, DcbQueryItem
+
+# Types and tags of a query item, sorted. An event matches an item if its type
+# is one of the item's types (or the item has no types) and it has all of the
+# item's tags. An event matches a query if it matches any of the query's items.
+NormalisedItem = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+
+def _subsumes(a: NormalisedItem, b: NormalisedItem) -> bool:
+    """Returns True if every event that matches b also matches a."""
+    a_types, a_tags = a
+    b_types, b_tags = b
+    if not set(a_tags).issubset(b_tags):
+        return False
+    return not a_types or (bool(b_types) and set(b_types).issubset(a_types))
+
+
+def normalise_query_items(items: Sequence[DcbQueryItem]) -> List[NormalisedItem]:
+    """
+    Returns items that match the same events as the given items, without
+    duplicates, with the types of items that have the same tags merged, and
+    without items that are subsumed by broader items. Items are kept in the
+    order they first appear.
+    """
+    merged: OrderedDict[Tuple[str, ...], Tuple[str, ...]] = OrderedDict()
+    for item in items:
+        tags = tuple(sorted(set(item.tags)))
+        types = tuple(sorted(set(item.types)))
+        if tags not in merged:
+            merged[tags] = types
+        elif merged[tags] and types:
+            merged[tags] = tuple(sorted(set(merged[tags]).union(types)))
+        else:
+            # An item without types matches any type.
+            merged[tags] = ()
+    normalised = [(types, tags) for tags, types in merged.items()]
+    return [
+        item
+        for item in normalised
+        if not any(other is not item and _subsumes(other, item) for other in normalised)
+    ]
+
+
+class QueryPlanner:
+    """
+    Translates DCB queries to UmaDB queries, normalising the query items so
+    that fewer items are sent and evaluated by the server, and caching the
+    translations of recently used queries.
+    """
+
+    def __init__(self, cache_size: int = 1024) -> None:
+        self.cache_size = cache_size
+        self._cache: OrderedDict[Tuple[NormalisedItem, ...], umadb.Query] = (
+            OrderedDict()
+        )
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def translate(self, query: DcbQuery) -> umadb.Query:
+        key = tuple((tuple(qi.types), tuple(qi.tags)) for qi in query.items)
+        with self._lock:
+            translated = self._cache.get(key)
+            if translated is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return translated
+            self.misses += 1
+        translated = umadb.Query(
+            items=[
+                umadb.QueryItem(types=list(types), tags=list(tags))
+                for types, tags in normalise_query_items(query.items)
+            ]
+        )
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = translated
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return translated
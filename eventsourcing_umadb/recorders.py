@@ -1,7 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import Any, List, Optional, Sequence, cast
+from concurrent.futures import Future
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
 from uuid import UUID, uuid4
 
 import umadb
@@ -24,13 +39,70 @@ from eventsourcing.persistence import (
     Subscription,
 )
 
+from eventsourcing_umadb.columnar import ColumnarPage, TopicDictionary
+from eventsourcing_umadb.compression import PayloadCompression
+from eventsourcing_umadb.interning import StringInterner
+from eventsourcing_umadb.pipelining import AppendPipeline
+from eventsourcing_umadb.queries import QueryPlanner
+
+if TYPE_CHECKING:
+    from eventsourcing_umadb.dictionary import WireDictionary
+    from eventsourcing_umadb.existence import ExistenceFilter
+    from eventsourcing_umadb.spool import AppendSpool
+
+
+class UmaDbClient(Protocol):
+    """
+    The methods of umadb.Client that are used by the recorders.
+    """
+
+    def read(
+        self,
+        query: umadb.Query | None = None,
+        start: int | None = None,
+        backwards: bool = False,
+        limit: int | None = None,
+    ) -> umadb.ReadResponse: ...
+
+    def subscribe(
+        self, query: umadb.Query | None = None, after: int | None = None
+    ) -> umadb.Subscription: ...
+
+    def head(self) -> int | None: ...
+
+    def append(
+        self,
+        events: Sequence[umadb.Event],
+        condition: umadb.AppendCondition | None = None,
+        tracking_info: umadb.TrackingInfo | None = None,
+    ) -> int: ...
+
+    def get_tracking_info(self, source: str) -> int | None: ...
+
+    def close(self) -> None: ...
+
+
+# Returns secondary index tags for a stored event.
+TagExtractor = Callable[[StoredEvent], Iterable[str]]
+
+# The position, type, data, tags, ID and metadata of a received event, with
+# the payload not yet decoded. Unlike umadb.SequencedEvent, it can be sent to
+# another process.
+RawEvent = Tuple[int, str, bytes, List[str], Optional[UUID], Dict[str, str]]
+
 
 class UmaDbAggregateRecorder(AggregateRecorder):
     def __init__(
         self,
-        umadb: umadb.Client,
+        umadb: UmaDbClient,
         for_snapshotting: bool = False,
         *args: Any,
+        payload_compression: PayloadCompression | None = None,
+        max_appends_in_flight: int = 16,
+        existence_filter: ExistenceFilter | None = None,
+        wire_dictionary: WireDictionary | None = None,
+        string_interner: StringInterner | None = None,
+        spool: AppendSpool | None = None,
         **kwargs: Any,
     ) -> None:
         if for_snapshotting:
@@ -38,13 +110,56 @@ class UmaDbAggregateRecorder(AggregateRecorder):
         super(UmaDbAggregateRecorder, self).__init__(*args, **kwargs)
         self.umadb = umadb
         self.for_snapshotting = for_snapshotting
+        self.payload_compression = payload_compression
+        self.append_pipeline = AppendPipeline(max_appends_in_flight)
+        self.tag_extractors: Dict[str, List[TagExtractor]] = {}
+        self.existence_filter = existence_filter
+        self.wire_dictionary = wire_dictionary
+        self.string_interner = string_interner
+        self.spool = spool
+        if spool is not None:
+            spool.start(self._insert_events)
+
+    def register_tag_extractor(self, topic: str, extractor: TagExtractor) -> None:
+        """
+        Registers a function that returns secondary index tags for stored
+        events with the given topic. The tags are recorded with the events,
+        so that originators can be found by tag with find_originators().
+        """
+        self.tag_extractors.setdefault(topic, []).append(extractor)
 
     def insert_events(
         self, stored_events: Sequence[StoredEvent], **kwargs: Any
     ) -> Optional[Sequence[int]]:
+        if self.spool is not None:
+            self.spool.append(stored_events)
+            return None
         self._insert_events(stored_events, **kwargs)
         return None
 
+    def insert_events_nowait(
+        self, stored_events: Sequence[StoredEvent], **kwargs: Any
+    ) -> Future[Optional[Sequence[int]]]:
+        """
+        Inserts events without waiting for them to be recorded. Returns a
+        future of the notification IDs. Events of the same aggregate are
+        inserted in the order they were submitted. If the recorder has a
+        spool, the events are spooled, and the future's result is None.
+        """
+        if self.spool is not None:
+            future: Future[Optional[Sequence[int]]] = Future()
+            try:
+                self.spool.append(stored_events)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+            return future
+        return self.append_pipeline.submit(
+            {str(s.originator_id) for s in stored_events},
+            lambda: self._insert_events(stored_events, **kwargs),
+        )
+
     def _insert_events(
         self, stored_events: Sequence[StoredEvent], **kwargs: Any
     ) -> Optional[Sequence[int]]:
@@ -67,22 +182,16 @@ class UmaDbAggregateRecorder(AggregateRecorder):
                 originator_ids_and_versions[stored_event.originator_id] = (
                     stored_event.originator_version
                 )
-            originator_id_tag = self._tag_originator_id(stored_event.originator_id)
-            originator_version_tag = self._tag_originator_version(
-                stored_event.originator_id, stored_event.originator_version
-            )
-            umadb_event = umadb.Event(
-                event_type=stored_event.topic,
-                data=stored_event.state,
-                tags=[originator_id_tag, originator_version_tag],
-                uuid=stored_event.uuid,
-                metadata=stored_event.metadata,
-            )
-            umadb_events.append(umadb_event)
+            umadb_events.append(self._construct_umadb_event(stored_event))
+        if self.existence_filter is not None:
+            # Added before appending, so that new events are always found.
+            for originator_id in originator_ids_and_versions:
+                self.existence_filter.add(originator_id)
         try:
+            # Only the originator ID and version tags identify a conflict.
             query_items = [
                 umadb.QueryItem(
-                    tags=umadb_event.tags,
+                    tags=umadb_event.tags[:2],
                 )
                 for umadb_event in umadb_events
             ]
@@ -103,6 +212,66 @@ class UmaDbAggregateRecorder(AggregateRecorder):
                 range(sequence_number - len(stored_events) + 1, sequence_number + 1)
             )
 
+    def _construct_umadb_event(self, stored_event: StoredEvent) -> umadb.Event:
+        originator_id_tag = self._tag_originator_id(stored_event.originator_id)
+        originator_version_tag = self._tag_originator_version(
+            stored_event.originator_id, stored_event.originator_version
+        )
+        data, metadata = stored_event.state, stored_event.metadata
+        if self.payload_compression is not None:
+            data, metadata = self.payload_compression.encode(
+                stored_event.topic, data, metadata
+            )
+        event_type = stored_event.topic
+        if self.wire_dictionary is not None:
+            event_type = self.wire_dictionary.encode_topic(event_type)
+            metadata = self.wire_dictionary.encode_metadata(metadata)
+        return umadb.Event(
+            event_type=event_type,
+            data=data,
+            tags=[
+                originator_id_tag,
+                originator_version_tag,
+                *self._extract_index_tags(stored_event),
+            ],
+            uuid=stored_event.uuid,
+            metadata=metadata,
+        )
+
+    def _decode_payload(self, event: umadb.Event) -> Tuple[bytes, Dict[str, str]]:
+        metadata = event.metadata
+        if self.wire_dictionary is not None:
+            metadata = self.wire_dictionary.decode_metadata(metadata)
+        if self.payload_compression is None:
+            return event.data, metadata
+        return self.payload_compression.decode(event.data, metadata)
+
+    def _decode_topic(self, event: umadb.Event) -> str:
+        topic = event.event_type
+        if self.wire_dictionary is not None:
+            topic = self.wire_dictionary.decode_topic(topic)
+        if self.string_interner is not None:
+            topic = self.string_interner.intern(topic)
+        return topic
+
+    def _query_types(self, topics: Sequence[str]) -> Sequence[str]:
+        if self.wire_dictionary is None or not topics:
+            return topics
+        return self.wire_dictionary.query_types(topics)
+
+    def _extract_index_tags(self, stored_event: StoredEvent) -> List[str]:
+        extractors = self.tag_extractors.get(stored_event.topic)
+        if not extractors:
+            return []
+        return [
+            self._tag_index(tag)
+            for extractor in extractors
+            for tag in extractor(stored_event)
+        ]
+
+    def _tag_index(self, tag: str) -> str:
+        return f"index:{tag}"
+
     def _tag_originator_id(self, originator_id: UUID | str) -> str:
         return f"originator:{originator_id}"
 
@@ -118,55 +287,113 @@ class UmaDbAggregateRecorder(AggregateRecorder):
         lte: Optional[int] = None,
         desc: bool = False,
         limit: Optional[int] = None,
+        as_of_position: Optional[int] = None,
     ) -> List[StoredEvent]:
+        """
+        Returns the events of an aggregate. If 'as_of_position' is given, only
+        events recorded at or before that position are returned, so that the
+        aggregate can be reconstructed as it was at a notification ID.
+        """
         if self.for_snapshotting and desc and limit == 1:
             return []
+        if self.existence_filter is not None and not (
+            self.existence_filter.might_exist(originator_id)
+        ):
+            return []
+        # Without a limit, the position ceiling is applied by the server by
+        # reading backwards from it, so events recorded after it aren't read,
+        # and events are put in ascending order afterwards if necessary. With
+        # a limit, ascending reads are forwards, and stop at the ceiling or
+        # the limit, which is also given to the server, so only the first
+        # events of long histories are read.
+        backwards = desc or (as_of_position is not None and limit is None)
         umadb_events = self.umadb.read(
             query=umadb.Query(
                 items=[umadb.QueryItem(tags=[self._tag_originator_id(originator_id)])]
             ),
-            backwards=desc,
+            start=as_of_position if backwards else None,
+            backwards=backwards,
+            # Events skipped by 'gt' would count towards the server's limit.
+            limit=limit if not backwards and gt is None else None,
         )
 
         stored_events: List[StoredEvent] = []
         for ue in umadb_events:
+            if (
+                as_of_position is not None
+                and not backwards
+                and ue.position > as_of_position
+            ):
+                break
             extracted_originator_id = self._extract_originator_id(ue)
             extracted_originator_version = self._extract_originator_version(ue)
-            if len(stored_events) == limit:
+            if len(stored_events) == limit and backwards == desc:
                 break
             if gt is not None:
                 if extracted_originator_version <= gt:
-                    if desc:
+                    if backwards:
                         break
                     else:
                         continue
             if lte is not None:
                 if extracted_originator_version > lte:
-                    if not desc:
+                    if not backwards:
                         break
                     else:
                         continue
+            state, metadata = self._decode_payload(ue.event)
             stored_events.append(
                 StoredEvent(
                     originator_id=extracted_originator_id,
                     originator_version=extracted_originator_version,
-                    topic=ue.event.event_type,
-                    state=ue.event.data,
+                    topic=self._decode_topic(ue.event),
+                    state=state,
                     uuid=ue.event.uuid or NIL_UUID,
-                    metadata=ue.event.metadata,
+                    metadata=metadata,
                 )
             )
+        if backwards != desc:
+            stored_events.reverse()
+            if limit is not None:
+                del stored_events[limit:]
         return stored_events
 
+    def find_originators(self, tag: str, topics: Sequence[str] = ()) -> List[str]:
+        """
+        Returns the IDs of originators with events that were recorded with the
+        given secondary index tag, in order of their first such event. Since
+        the tag is indexed by UmaDB, only those events are read.
+        """
+        ues = self.umadb.read(
+            query=umadb.Query(
+                items=[
+                    umadb.QueryItem(
+                        types=self._query_types(topics), tags=[self._tag_index(tag)]
+                    )
+                ]
+            ),
+        )
+        return list(dict.fromkeys(self._extract_originator_id(ue) for ue in ues))
+
+    def close(self) -> None:
+        """
+        Waits for appends in flight, and stops the threads of the append
+        pipeline. The client isn't closed, because it can be shared.
+        """
+        self.append_pipeline.close()
+
     def _extract_originator_version(self, ue: umadb.SequencedEvent) -> int:
         return int(ue.event.tags[1].split(":")[1])
 
     def _extract_originator_id(self, ue: umadb.SequencedEvent) -> str:
         try:
-            return ue.event.tags[0].split(":")[1]
+            originator_id = ue.event.tags[0].split(":")[1]
         except IndexError as e:
             msg = f"Couldn't extract originator ID from: {ue.event.tags[0]}"
             raise ValueError(msg) from e
+        if self.string_interner is not None:
+            originator_id = self.string_interner.intern(originator_id)
+        return originator_id
 
 
 class UmaDbApplicationRecorder(UmaDbAggregateRecorder, ApplicationRecorder):
@@ -176,6 +403,10 @@ class UmaDbApplicationRecorder(UmaDbAggregateRecorder, ApplicationRecorder):
     def insert_events(
         self, stored_events: Sequence[StoredEvent], **kwargs: Any
     ) -> Optional[Sequence[int]]:
+        if self.spool is not None:
+            # Notification IDs aren't known until the events are sent.
+            self.spool.append(stored_events)
+            return None
         return self._insert_events(stored_events, **kwargs)
 
     def select_notifications(
@@ -186,13 +417,22 @@ class UmaDbApplicationRecorder(UmaDbAggregateRecorder, ApplicationRecorder):
         topics: Sequence[str] = (),
         *,
         inclusive_of_start: bool = True,
+        desc: bool = False,
     ) -> Sequence[Notification]:
+        if desc:
+            return self._select_notifications_desc(
+                start=start,
+                limit=limit,
+                stop=stop,
+                topics=topics,
+                inclusive_of_start=inclusive_of_start,
+            )
         if not inclusive_of_start and start is not None:
             start += 1
         ues = self.umadb.read(
             start=start,
             limit=limit,
-            query=umadb.Query(items=[umadb.QueryItem(types=topics)]),
+            query=umadb.Query(items=[umadb.QueryItem(types=self._query_types(topics))]),
         )
         notifications: List[Notification] = []
         count = 0
@@ -206,15 +446,106 @@ class UmaDbApplicationRecorder(UmaDbAggregateRecorder, ApplicationRecorder):
 
         return notifications
 
+    def select_notifications_columnar(
+        self,
+        start: int | None,
+        limit: int,
+        stop: int | None = None,
+        topics: Sequence[str] = (),
+        *,
+        inclusive_of_start: bool = True,
+        topic_dictionary: TopicDictionary | None = None,
+    ) -> ColumnarPage:
+        """
+        Like select_notifications(), but returns the positions, topics and
+        payloads of the notifications as columns, without constructing a
+        Notification object for each event.
+        """
+        if not inclusive_of_start and start is not None:
+            start += 1
+        page = ColumnarPage(topic_dictionary=topic_dictionary or TopicDictionary())
+        code = page.topic_dictionary.code
+        chunks: List[bytes] = []
+        offset = 0
+        ues = self.umadb.read(
+            start=start,
+            limit=limit,
+            query=umadb.Query(items=[umadb.QueryItem(types=self._query_types(topics))]),
+        )
+        stopped = False
+        while not stopped and (batch := ues.next_batch()):
+            for ue in batch:
+                event = ue.event
+                data = event.data
+                if self.payload_compression is not None:
+                    data, _ = self._decode_payload(event)
+                page.positions.append(ue.position)
+                page.topic_codes.append(code(self._decode_topic(event)))
+                chunks.append(data)
+                offset += len(data)
+                page.payload_offsets.append(offset)
+                if stop is not None and stop <= ue.position:
+                    stopped = True
+                    break
+        page.payloads = b"".join(chunks)
+        return page
+
+    def _select_notifications_desc(
+        self,
+        start: int | None,
+        limit: int,
+        stop: int | None,
+        topics: Sequence[str],
+        inclusive_of_start: bool,
+    ) -> Sequence[Notification]:
+        # Newest first. Here 'start' is the upper bound (None means the head),
+        # and 'stop' is the lower bound. To get the next page, pass the ID of
+        # the last notification as 'start' with 'inclusive_of_start=False'.
+        if not inclusive_of_start and start is not None:
+            start -= 1
+            if start < 1:
+                return []
+        ues = self.umadb.read(
+            start=start,
+            backwards=True,
+            limit=limit,
+            query=umadb.Query(items=[umadb.QueryItem(types=self._query_types(topics))]),
+        )
+        notifications: List[Notification] = []
+        for ue in ues:
+            if stop is not None and ue.position < stop:
+                break
+            notifications.append(self.construct_notification(ue))
+
+        return notifications
+
     def construct_notification(self, ue: umadb.SequencedEvent) -> Notification:
+        state, metadata = self._decode_payload(ue.event)
         return Notification(
             id=ue.position,
             originator_id=self._extract_originator_id(ue),
             originator_version=self._extract_originator_version(ue),
-            topic=ue.event.event_type,
-            state=ue.event.data,
+            topic=self._decode_topic(ue.event),
+            state=state,
             uuid=ue.event.uuid or NIL_UUID,
-            metadata=ue.event.metadata,
+            metadata=metadata,
+        )
+
+    def construct_raw_event(self, ue: umadb.SequencedEvent) -> RawEvent:
+        """
+        Decodes the topic and metadata names of a received event, but not its
+        payload, which is decoded by construct_notification_from_raw().
+        """
+        metadata = ue.event.metadata
+        if self.wire_dictionary is not None:
+            metadata = self.wire_dictionary.decode_metadata(metadata)
+        return (
+            ue.position,
+            self._decode_topic(ue.event),
+            ue.event.data,
+            ue.event.tags,
+            ue.event.uuid,
+            metadata,
         )
 
     def subscribe(
@@ -227,6 +558,23 @@ class UmaDbApplicationRecorder(UmaDbAggregateRecorder, ApplicationRecorder):
         )
 
 
+def construct_notification_from_raw(
+    raw: RawEvent, payload_compression: PayloadCompression | None = None
+) -> Notification:
+    position, topic, state, tags, uuid, metadata = raw
+    if payload_compression is not None:
+        state, metadata = payload_compression.decode(state, metadata)
+    return Notification(
+        id=position,
+        originator_id=tags[0].split(":")[1],
+        originator_version=int(tags[1].split(":")[1]),
+        topic=topic,
+        state=state,
+        uuid=uuid or NIL_UUID,
+        metadata=metadata,
+    )
+
+
 class UmaDbSubscription(Subscription[UmaDbApplicationRecorder]):
     def __init__(
         self,
@@ -236,7 +584,9 @@ class UmaDbSubscription(Subscription[UmaDbApplicationRecorder]):
     ) -> None:
         super().__init__(recorder=recorder, gt=gt, topics=topics)
         self._subscription = recorder.umadb.subscribe(
-            query=umadb.Query(items=[umadb.QueryItem(types=topics)]),
+            query=umadb.Query(
+                items=[umadb.QueryItem(types=recorder._query_types(topics))]
+            ),
             after=gt,
         )
 
@@ -248,40 +598,65 @@ class UmaDbSubscription(Subscription[UmaDbApplicationRecorder]):
                 raise StopIteration
             raise
 
+    def next_batch(self) -> List[Notification]:
+        """
+        Returns the notifications that have been received, waiting for at
+        least one. Returns an empty list when the subscription has stopped.
+        """
+        return [
+            self._recorder.construct_notification(ue) for ue in self._receive_batch()
+        ]
+
+    def next_raw_batch(self) -> List[RawEvent]:
+        """
+        Like next_batch(), but returns raw events, which can be constructed
+        in another process with the function from raw_event_constructor().
+        """
+        return [self._recorder.construct_raw_event(ue) for ue in self._receive_batch()]
+
+    def raw_event_constructor(self) -> Callable[[RawEvent], Notification]:
+        return partial(
+            construct_notification_from_raw,
+            payload_compression=self._recorder.payload_compression,
+        )
+
+    def _receive_batch(self) -> Sequence[umadb.SequencedEvent]:
+        try:
+            return self._subscription.next_batch()
+        except umadb.CancelledByUserError:
+            if self._has_been_stopped:
+                return []
+            raise
+
     def stop(self) -> None:
         super().stop()
         self._subscription.cancel()
 
 
 class UmaDbDcbRecorder(DcbRecorder):
-    def __init__(self, umadb: umadb.Client):
+    def __init__(
+        self,
+        umadb: UmaDbClient,
+        payload_compression: PayloadCompression | None = None,
+        max_appends_in_flight: int = 16,
+        string_interner: StringInterner | None = None,
+    ):
         self.umadb = umadb
+        self.payload_compression = payload_compression
+        self.string_interner = string_interner
+        self.append_pipeline = AppendPipeline(max_appends_in_flight)
+        self.query_planner = QueryPlanner()
 
     def append(
         self, events: Sequence[DcbEvent], condition: DcbAppendCondition | None = None
     ) -> int:
         try:
             return self.umadb.append(
-                events=[
-                    umadb.Event(
-                        event_type=e.type,
-                        data=e.data,
-                        tags=e.tags,
-                        uuid=e.uuid if e.uuid else uuid4(),
-                        metadata=e.metadata,
-                    )
-                    for e in events
-                ],
+                events=[self._construct_umadb_event(e) for e in events],
                 condition=(
                     umadb.AppendCondition(
-                        fail_if_events_match=umadb.Query(
-                            items=[
-                                umadb.QueryItem(
-                                    types=qi.types,
-                                    tags=qi.tags,
-                                )
-                                for qi in condition.fail_if_events_match.items
-                            ],
+                        fail_if_events_match=self.query_planner.translate(
+                            condition.fail_if_events_match
                         ),
                         after=condition.after,
                     )
@@ -292,6 +667,52 @@ class UmaDbDcbRecorder(DcbRecorder):
         except umadb.IntegrityError as exc:
             raise IntegrityError(exc)
 
+    def append_async(
+        self, events: Sequence[DcbEvent], condition: DcbAppendCondition | None = None
+    ) -> Future[int]:
+        """
+        Appends events without waiting for them to be recorded. Returns a
+        future of the position of the last event. Appends are made in the
+        order they were submitted if their events or conditions have tags in
+        common, or if a condition has query items without tags.
+        """
+        return self.append_pipeline.submit(
+            self._append_keys(events, condition),
+            lambda: self.append(events, condition),
+        )
+
+    def close(self) -> None:
+        """
+        Waits for appends in flight, and stops the threads of the append
+        pipeline. The client isn't closed, because it can be shared.
+        """
+        self.append_pipeline.close()
+
+    @staticmethod
+    def _append_keys(
+        events: Sequence[DcbEvent], condition: DcbAppendCondition | None
+    ) -> Set[str] | None:
+        # Conditions that don't select events by tag can depend on any append.
+        keys = {t for e in events for t in e.tags}
+        if condition is not None:
+            for item in condition.fail_if_events_match.items:
+                if not item.tags:
+                    return None
+                keys.update(item.tags)
+        return keys
+
+    def _construct_umadb_event(self, e: DcbEvent) -> umadb.Event:
+        data, metadata = e.data, e.metadata
+        if self.payload_compression is not None:
+            data, metadata = self.payload_compression.encode(e.type, data, metadata)
+        return umadb.Event(
+            event_type=e.type,
+            data=data,
+            tags=e.tags,
+            uuid=e.uuid if e.uuid else uuid4(),
+            metadata=metadata,
+        )
+
     def head(self) -> int | None:
         return self.umadb.head()
 
@@ -303,23 +724,11 @@ class UmaDbDcbRecorder(DcbRecorder):
         limit: int | None = None,
     ) -> DcbReadResponse:
         r = self.umadb.read(
-            (
-                umadb.Query(
-                    items=[
-                        umadb.QueryItem(
-                            types=qi.types,
-                            tags=qi.tags,
-                        )
-                        for qi in query.items
-                    ],
-                )
-                if query
-                else None
-            ),
+            self.query_planner.translate(query) if query else None,
             start=after + 1 if after else None,
             limit=limit,
         )
-        return UmaDbDcbReadResponse(r)
+        return UmaDbDcbReadResponse(r, self.payload_compression, self.string_interner)
 
     def subscribe(
         self,
@@ -334,25 +743,66 @@ class UmaDbDcbRecorder(DcbRecorder):
         )
 
 
+def construct_dcb_sequenced_event(
+    sequenced: umadb.SequencedEvent,
+    payload_compression: PayloadCompression | None = None,
+    string_interner: StringInterner | None = None,
+) -> DcbSequencedEvent:
+    data, metadata = sequenced.event.data, sequenced.event.metadata
+    if payload_compression is not None:
+        data, metadata = payload_compression.decode(data, metadata)
+    event_type, tags = sequenced.event.event_type, sequenced.event.tags
+    if string_interner is not None:
+        event_type = string_interner.intern(event_type)
+        tags = string_interner.intern_all(tags)
+    return DcbSequencedEvent(
+        position=sequenced.position,
+        event=DcbEvent(
+            type=event_type,
+            data=data,
+            tags=tags,
+            uuid=sequenced.event.uuid or NIL_UUID,
+            metadata=metadata,
+        ),
+    )
+
+
+def construct_dcb_sequenced_event_from_raw(
+    raw: RawEvent, payload_compression: PayloadCompression | None = None
+) -> DcbSequencedEvent:
+    position, event_type, data, tags, uuid, metadata = raw
+    if payload_compression is not None:
+        data, metadata = payload_compression.decode(data, metadata)
+    return DcbSequencedEvent(
+        position=position,
+        event=DcbEvent(
+            type=event_type,
+            data=data,
+            tags=tags,
+            uuid=uuid or NIL_UUID,
+            metadata=metadata,
+        ),
+    )
+
+
 class UmaDbDcbReadResponse(DcbReadResponse):
-    def __init__(self, read_response: umadb.ReadResponse) -> None:
+    def __init__(
+        self,
+        read_response: umadb.ReadResponse,
+        payload_compression: PayloadCompression | None = None,
+        string_interner: StringInterner | None = None,
+    ) -> None:
         self.read_response = read_response
+        self.payload_compression = payload_compression
+        self.string_interner = string_interner
 
     @property
     def head(self) -> int | None:
         return self.read_response.head()
 
     def __next__(self) -> DcbSequencedEvent:
-        sequenced = next(self.read_response)
-        return DcbSequencedEvent(
-            position=sequenced.position,
-            event=DcbEvent(
-                type=sequenced.event.event_type,
-                data=sequenced.event.data,
-                tags=sequenced.event.tags,
-                uuid=sequenced.event.uuid or NIL_UUID,
-                metadata=sequenced.event.metadata,
-            ),
+        return construct_dcb_sequenced_event(
+            next(self.read_response), self.payload_compression, self.string_interner
         )
 
 
@@ -369,19 +819,7 @@ class UmaDbDcbSubscription(DcbSubscription[UmaDbDcbRecorder]):
             after=after,
         )
         self._subscription = self._recorder.umadb.subscribe(
-            query=(
-                umadb.Query(
-                    items=[
-                        umadb.QueryItem(
-                            types=qi.types,
-                            tags=qi.tags,
-                        )
-                        for qi in query.items
-                    ],
-                )
-                if query
-                else None
-            ),
+            query=self._recorder.query_planner.translate(query) if query else None,
             after=after,
         )
 
@@ -393,16 +831,54 @@ class UmaDbDcbSubscription(DcbSubscription[UmaDbDcbRecorder]):
                 raise StopIteration
             raise
         else:
-            return DcbSequencedEvent(
-                position=sequenced.position,
-                event=DcbEvent(
-                    type=sequenced.event.event_type,
-                    data=sequenced.event.data,
-                    tags=sequenced.event.tags,
-                    uuid=sequenced.event.uuid or NIL_UUID,
-                    metadata=sequenced.event.metadata,
-                ),
+            return construct_dcb_sequenced_event(
+                sequenced,
+                self._recorder.payload_compression,
+                self._recorder.string_interner,
+            )
+
+    def next_batch(self) -> List[DcbSequencedEvent]:
+        """
+        Returns the events that have been received, waiting for at least one.
+        Returns an empty list when the subscription has stopped.
+        """
+        payload_compression = self._recorder.payload_compression
+        string_interner = self._recorder.string_interner
+        return [
+            construct_dcb_sequenced_event(s, payload_compression, string_interner)
+            for s in self._receive_batch()
+        ]
+
+    def next_raw_batch(self) -> List[RawEvent]:
+        """
+        Like next_batch(), but returns raw events, which can be constructed
+        in another process with the function from raw_event_constructor().
+        """
+        return [
+            (
+                s.position,
+                s.event.event_type,
+                s.event.data,
+                s.event.tags,
+                s.event.uuid,
+                s.event.metadata,
             )
+            for s in self._receive_batch()
+        ]
+
+    def raw_event_constructor(self) -> Callable[[RawEvent], DcbSequencedEvent]:
+        return partial(
+            construct_dcb_sequenced_event_from_raw,
+            payload_compression=self._recorder.payload_compression,
+        )
+
+    def _receive_batch(self) -> Sequence[umadb.SequencedEvent]:
+        try:
+            return self._subscription.next_batch()
+        except umadb.CancelledByUserError:
+            if self._has_been_stopped:
+                return []
+            raise
 
     def stop(self) -> None:
         super().stop()
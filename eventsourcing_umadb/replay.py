@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Generic, Iterator, List, Optional, Sequence, TypeVar
+from uuid import UUID
+
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbReadResponse,
+    DcbRecorder,
+    DcbSequencedEvent,
+    DcbSubscription,
+)
+from eventsourcing.persistence import (
+    ApplicationRecorder,
+    Notification,
+    StoredEvent,
+    Subscription,
+)
+
+from eventsourcing_umadb.compression import PayloadCompression
+from eventsourcing_umadb.export import ExportReader
+
+T = TypeVar("T")
+
+
+def matches_query(event: DcbEvent, query: DcbQuery | None) -> bool:
+    return _matches_type_and_tags(event.type, event.tags, query)
+
+
+def _matches_type_and_tags(
+    event_type: str, tags: Sequence[str], query: DcbQuery | None
+) -> bool:
+    if query is None or not query.items:
+        return True
+    return any(
+        (not item.types or event_type in item.types) and set(tags).issuperset(item.tags)
+        for item in query.items
+    )
+
+
+def tag_partition(tags: Sequence[str], prefix: str, num_partitions: int) -> int:
+    """
+    Returns the partition of the first tag that starts with the given prefix,
+    using a hash that is stable across processes. Events without such a tag
+    are in partition 0.
+    """
+    for tag in tags:
+        if tag.startswith(prefix):
+            return zlib.crc32(tag.encode()) % num_partitions
+    return 0
+
+
+def _decompressed(
+    sequenced: DcbSequencedEvent, payload_compression: PayloadCompression
+) -> DcbSequencedEvent:
+    # Copied, so that events read from the file aren't changed.
+    event = sequenced.event
+    data, metadata = payload_compression.decode(event.data, event.metadata)
+    return DcbSequencedEvent(
+        position=sequenced.position,
+        event=DcbEvent(
+            type=event.type,
+            data=data,
+            tags=list(event.tags),
+            uuid=event.uuid,
+            metadata=metadata,
+        ),
+    )
+
+
+class ExportDcbRecorder(DcbRecorder):
+    """
+    Read-only DCB recorder for an export file. Subscriptions end after the
+    last event in the file, instead of waiting for new events.
+    """
+
+    def __init__(
+        self,
+        reader: ExportReader,
+        payload_compression: PayloadCompression | None = None,
+    ) -> None:
+        self.reader = reader
+        self.payload_compression = payload_compression
+        self._head: int | None = None
+        if reader.num_chunks:
+            self._head = reader.read_chunk(reader.num_chunks - 1)[-1].position
+
+    def head(self) -> int | None:
+        return self._head
+
+    def read(
+        self,
+        query: DcbQuery | None = None,
+        *,
+        after: int | None = None,
+        limit: int | None = None,
+    ) -> DcbReadResponse:
+        return ExportDcbReadResponse(
+            self._iter_events(query, after, limit), head=self.head()
+        )
+
+    def _iter_events(
+        self, query: DcbQuery | None, after: int | None, limit: int | None = None
+    ) -> Iterator[DcbSequencedEvent]:
+        count = 0
+        for sequenced in self.reader.read(after=after):
+            if limit is not None and count >= limit:
+                break
+            if matches_query(sequenced.event, query):
+                count += 1
+                if self.payload_compression is not None:
+                    sequenced = _decompressed(sequenced, self.payload_compression)
+                yield sequenced
+
+    def append(
+        self, events: Sequence[DcbEvent], condition: DcbAppendCondition | None = None
+    ) -> int:
+        raise NotImplementedError("Export files are read-only")
+
+    def subscribe(
+        self,
+        query: DcbQuery | None = None,
+        *,
+        after: int | None = None,
+    ) -> ExportDcbSubscription:
+        return ExportDcbSubscription(recorder=self, query=query, after=after)
+
+
+class ExportDcbReadResponse(DcbReadResponse):
+    def __init__(self, events: Iterator[DcbSequencedEvent], head: int | None) -> None:
+        self._events = events
+        self._head = head
+
+    @property
+    def head(self) -> int | None:
+        return self._head
+
+    def __next__(self) -> DcbSequencedEvent:
+        return next(self._events)
+
+
+class ExportDcbSubscription(DcbSubscription[ExportDcbRecorder]):
+    def __init__(
+        self,
+        recorder: ExportDcbRecorder,
+        query: DcbQuery | None = None,
+        after: int | None = None,
+    ) -> None:
+        super().__init__(recorder=recorder, query=query, after=after)
+        self._events = recorder._iter_events(query, after)
+
+    def __next__(self) -> DcbSequencedEvent:
+        if self._has_been_stopped:
+            raise StopIteration
+        sequenced = next(self._events)
+        self._last_position = sequenced.position
+        return sequenced
+
+
+class ExportApplicationRecorder(ApplicationRecorder):
+    """
+    Read-only application recorder for an export file of events that were
+    recorded by UmaDbApplicationRecorder. Subscriptions end after the last
+    event in the file, instead of waiting for new events.
+    """
+
+    def __init__(
+        self,
+        reader: ExportReader,
+        payload_compression: PayloadCompression | None = None,
+    ) -> None:
+        self.dcb_recorder = ExportDcbRecorder(reader, payload_compression)
+
+    def insert_events(
+        self, stored_events: Sequence[StoredEvent], **kwargs: Any
+    ) -> Optional[Sequence[int]]:
+        raise NotImplementedError("Export files are read-only")
+
+    def select_events(
+        self,
+        originator_id: UUID | str,
+        *,
+        gt: int | None = None,
+        lte: int | None = None,
+        desc: bool = False,
+        limit: int | None = None,
+        as_of_position: int | None = None,
+    ) -> List[StoredEvent]:
+        originator_tag = f"originator:{originator_id}"
+        stored_events: List[StoredEvent] = []
+        for sequenced in self.dcb_recorder._iter_events(None, None):
+            if as_of_position is not None and sequenced.position > as_of_position:
+                break
+            if originator_tag not in sequenced.event.tags:
+                continue
+            notification = self.construct_notification(sequenced)
+            if gt is not None and notification.originator_version <= gt:
+                continue
+            if lte is not None and notification.originator_version > lte:
+                continue
+            stored_events.append(notification)
+        if desc:
+            stored_events.reverse()
+        return stored_events[:limit]
+
+    def select_notifications(
+        self,
+        start: int | None,
+        limit: int,
+        stop: int | None = None,
+        topics: Sequence[str] = (),
+        *,
+        inclusive_of_start: bool = True,
+    ) -> Sequence[Notification]:
+        after = None
+        if start is not None:
+            after = start if not inclusive_of_start else start - 1
+        notifications: List[Notification] = []
+        for sequenced in self.dcb_recorder._iter_events(None, after):
+            if stop is not None and sequenced.position > stop:
+                break
+            if topics and sequenced.event.type not in topics:
+                continue
+            notifications.append(self.construct_notification(sequenced))
+            if len(notifications) == limit:
+                break
+        return notifications
+
+    def max_notification_id(self) -> int | None:
+        return self.dcb_recorder.head()
+
+    def construct_notification(self, sequenced: DcbSequencedEvent) -> Notification:
+        event = sequenced.event
+        return Notification(
+            id=sequenced.position,
+            originator_id=event.tags[0].split(":")[1],
+            originator_version=int(event.tags[1].split(":")[1]),
+            topic=event.type,
+            state=event.data,
+            uuid=event.uuid,
+            metadata=event.metadata,
+        )
+
+    def subscribe(
+        self, gt: int | None = None, topics: Sequence[str] = ()
+    ) -> Subscription[ExportApplicationRecorder]:
+        return ExportSubscription(recorder=self, gt=gt, topics=topics)
+
+
+class ExportSubscription(Subscription[ExportApplicationRecorder]):
+    def __init__(
+        self,
+        recorder: ExportApplicationRecorder,
+        gt: int | None = None,
+        topics: Sequence[str] = (),
+    ) -> None:
+        super().__init__(recorder=recorder, gt=gt, topics=topics)
+        self._events = recorder.dcb_recorder._iter_events(None, gt)
+
+    def __next__(self) -> Notification:
+        while not self._has_been_stopped:
+            sequenced = next(self._events)
+            if self._topics and sequenced.event.type not in self._topics:
+                continue
+            self._last_notification_id = sequenced.position
+            return self._recorder.construct_notification(sequenced)
+        raise StopIteration
+
+
+class ReplayHandler(ABC, Generic[T]):
+    """
+    Processes batches of events for one partition of a replay, and returns
+    a result such as the state of a rebuilt projection. Subclasses must be
+    importable from a module so they can be used in worker processes.
+    """
+
+    def __init__(self, partition: int = 0, num_partitions: int = 1) -> None:
+        self.partition = partition
+        self.num_partitions = num_partitions
+
+    @abstractmethod
+    def process_events(self, events: Sequence[DcbSequencedEvent]) -> None:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def result(self) -> T:
+        pass  # pragma: no cover
+
+    def get_state(self) -> bytes | None:
+        """
+        Returns the state of the handler in a format chosen by the handler,
+        which PartitionedProjectionRunner records with the position of the
+        last processed event. Returns None by default, when the handler has
+        no state to record.
+        """
+        return None
+
+    def set_state(self, state: bytes) -> None:
+        """
+        Restores the state returned by get_state().
+        """
+        raise NotImplementedError("Handler can't restore its state")
+
+
+def replay(
+    recorder: DcbRecorder,
+    handler: ReplayHandler[T],
+    query: DcbQuery | None = None,
+    after: int | None = None,
+    batch_size: int = 1000,
+) -> T:
+    """
+    Feeds events from any DCB recorder, such as ExportDcbRecorder or the
+    in-memory recorder, to the handler in batches, in position order.
+    """
+    while True:
+        events = list(recorder.read(query, after=after, limit=batch_size))
+        if not events:
+            break
+        handler.process_events(events)
+        after = events[-1].position
+    return handler.result()
+
+
+def replay_partitioned(
+    path: str | Path,
+    handler_class: type[ReplayHandler[T]],
+    num_partitions: int,
+    partition_tag_prefix: str = "originator:",
+    query: DcbQuery | None = None,
+    payload_compression: PayloadCompression | None = None,
+) -> List[T]:
+    """
+    Replays an export file in one worker process per partition. Events are
+    partitioned by a hash of their first tag with the given prefix, so events
+    with the same tag value are processed by the same handler, in order.
+    Each worker decompresses every chunk, but only decodes the records of
+    its partition, and only decompresses their payloads with the given
+    'payload_compression'. Returns the results of the handlers, in partition
+    order.
+    """
+    with ProcessPoolExecutor(max_workers=num_partitions) as executor:
+        futures = [
+            executor.submit(
+                _replay_partition,
+                str(path),
+                handler_class,
+                partition,
+                num_partitions,
+                partition_tag_prefix,
+                query,
+                payload_compression,
+            )
+            for partition in range(num_partitions)
+        ]
+        return [future.result() for future in futures]
+
+
+def _replay_partition(
+    path: str,
+    handler_class: type[ReplayHandler[T]],
+    partition: int,
+    num_partitions: int,
+    partition_tag_prefix: str,
+    query: DcbQuery | None,
+    payload_compression: PayloadCompression | None,
+) -> T:
+    handler = handler_class(partition, num_partitions)
+
+    def select(event_type: str, tags: List[str]) -> bool:
+        return tag_partition(
+            tags, partition_tag_prefix, num_partitions
+        ) == partition and _matches_type_and_tags(event_type, tags, query)
+
+    with ExportReader(path) as reader:
+        for chunk_number in range(reader.num_chunks):
+            events = reader.read_chunk(chunk_number, select)
+            if payload_compression is not None:
+                events = [_decompressed(e, payload_compression) for e in events]
+            if events:
+                handler.process_events(events)
+    return handler.result()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Any, Dict, List, Sequence
+
+import umadb
+
+from eventsourcing_umadb.recorders import UmaDbClient
+
+
+class ReplicaRoutingClient:
+    """
+    Sends appends to a leader and spreads reads across read replicas, with
+    read-your-writes consistency.
+
+    The highest position of the appends made with the client is remembered,
+    including appends made by other threads such as those of an append
+    pipeline or a spool. A read is served by a replica only if the replica's
+    head has caught up with that position, otherwise it is served by the
+    leader. The position can be passed to another process with
+    position_token() and observe_position(), so that, for example, a request
+    that follows a write can read what was written.
+
+    Replica heads are cached, and only refreshed when a cached head is
+    behind the position that a read needs, so most reads don't make an
+    extra call to a replica. Replicas that can't be reached are skipped.
+    Calls of head() are answered by the leader.
+    """
+
+    def __init__(self, leader: UmaDbClient, replicas: Sequence[UmaDbClient]):
+        self.leader = leader
+        self.replicas = list(replicas)
+        self._heads: List[int | None] = [None] * len(self.replicas)
+        self._next_replica = itertools.cycle(range(len(self.replicas)))
+        self._lock = threading.Lock()
+        self._position: int | None = None
+        # Number of reads served by the leader (key -1) and each replica.
+        self.read_counts: Dict[int, int] = dict.fromkeys(
+            range(-1, len(self.replicas)), 0
+        )
+
+    def position_token(self) -> int | None:
+        """
+        Returns the position that reads must have caught up to.
+        """
+        return self._position
+
+    def observe_position(self, position: int | None) -> None:
+        """
+        Makes reads wait for the given position, for example a position token
+        received from another process.
+        """
+        if position is None:
+            return
+        with self._lock:
+            if self._position is None or position > self._position:
+                self._position = position
+
+    def _select(self) -> UmaDbClient:
+        if not self.replicas:
+            return self._count(-1)
+        with self._lock:
+            order = [next(self._next_replica) for _ in self.replicas]
+        position = self.position_token()
+        if position is None:
+            return self._count(order[0])
+        for i in order:
+            head = self._heads[i]
+            if head is not None and head >= position:
+                return self._count(i)
+        for i in order:
+            try:
+                head = self.replicas[i].head()
+            except Exception:
+                continue
+            self._heads[i] = head
+            if head is not None and head >= position:
+                return self._count(i)
+        return self._count(-1)
+
+    def _count(self, i: int) -> UmaDbClient:
+        with self._lock:
+            self.read_counts[i] += 1
+        return self.leader if i < 0 else self.replicas[i]
+
+    def read(
+        self,
+        query: umadb.Query | None = None,
+        start: int | None = None,
+        backwards: bool = False,
+        limit: int | None = None,
+    ) -> umadb.ReadResponse:
+        return self._select().read(
+            query=query, start=start, backwards=backwards, limit=limit
+        )
+
+    def subscribe(
+        self, query: umadb.Query | None = None, after: int | None = None
+    ) -> umadb.Subscription:
+        return self._select().subscribe(query=query, after=after)
+
+    def head(self) -> int | None:
+        # The head of the log is the leader's, and a HeadTrackingClient that
+        # wraps the leader answers it without calling the server.
+        return self.leader.head()
+
+    def append(
+        self,
+        events: Sequence[umadb.Event],
+        condition: umadb.AppendCondition | None = None,
+        tracking_info: umadb.TrackingInfo | None = None,
+    ) -> int:
+        position = self.leader.append(
+            events=events, condition=condition, tracking_info=tracking_info
+        )
+        self.observe_position(position)
+        return position
+
+    def get_tracking_info(self, source: str) -> int | None:
+        # Tracking info is used to decide what to write next, so is read from
+        # the leader.
+        return self.leader.get_tracking_info(source)
+
+    def __getattr__(self, name: str) -> Any:
+        # Other methods of the leader's client, such as check_health().
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.leader, name)
+
+    def close(self) -> None:
+        self.leader.close()
+        for replica in self.replicas:
+            replica.close()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Sequence, TypeVar
+
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbRecorder,
+    DcbSequencedEvent,
+)
+from eventsourcing.persistence import IntegrityError
+
+S = TypeVar("S")
+
+
+@dataclass(frozen=True)
+class TagContention:
+    tag: str
+    attempts: int
+    conflicts: int
+
+    @property
+    def conflict_rate(self) -> float:
+        return self.conflicts / self.attempts if self.attempts else 0.0
+
+
+class ContentionStatistics:
+    """
+    Counts conditional appends and conflicts for each tag in the conditions,
+    so that hot consistency boundaries can be found and split.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+        self._conflicts: Dict[str, int] = {}
+
+    def record(self, tags: Iterable[str], conflicted: bool) -> None:
+        with self._lock:
+            for tag in set(tags):
+                self._attempts[tag] = self._attempts.get(tag, 0) + 1
+                if conflicted:
+                    self._conflicts[tag] = self._conflicts.get(tag, 0) + 1
+
+    def get(self, tag: str) -> TagContention:
+        with self._lock:
+            return TagContention(
+                tag=tag,
+                attempts=self._attempts.get(tag, 0),
+                conflicts=self._conflicts.get(tag, 0),
+            )
+
+    def hottest(self, n: int = 10) -> List[TagContention]:
+        """
+        Returns the tags with the most conflicts, then the highest conflict rates.
+        """
+        with self._lock:
+            tags = list(self._conflicts)
+        contentions = [self.get(tag) for tag in tags]
+        contentions.sort(key=lambda c: (c.conflicts, c.conflict_rate), reverse=True)
+        return contentions[:n]
+
+
+class ConflictRetrier:
+    """
+    Makes decisions with a DCB recorder, retrying when the append condition
+    fails because another writer appended matching events.
+
+    The decision's state is built by reading the events that match the
+    query. After a conflict, only the events after the failed condition's
+    'after' position are read, the state is evolved with them, and the
+    decision is made again. Retries are delayed with exponential backoff and
+    full jitter, to avoid retry storms on hot tags.
+    """
+
+    def __init__(
+        self,
+        recorder: DcbRecorder,
+        max_attempts: int = 10,
+        base_delay: float = 0.005,
+        max_delay: float = 0.5,
+        statistics: ContentionStatistics | None = None,
+    ) -> None:
+        self.recorder = recorder
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statistics = statistics or ContentionStatistics()
+
+    def execute(
+        self,
+        query: DcbQuery,
+        initial: S,
+        evolve: Callable[[S, DcbSequencedEvent], S],
+        decide: Callable[[S], Sequence[DcbEvent]],
+    ) -> int | None:
+        """
+        Returns the position of the last appended event, or None if the
+        decision was to append nothing. Raises IntegrityError if the append
+        still conflicts after 'max_attempts' attempts.
+        """
+        tags = [tag for item in query.items for tag in item.tags]
+        state = initial
+        after: int | None = None
+        attempt = 0
+        while True:
+            response = self.recorder.read(query, after=after)
+            for sequenced in response:
+                state = evolve(state, sequenced)
+                after = sequenced.position
+            head = response.head
+            if head is not None and (after is None or head > after):
+                after = head
+            events = decide(state)
+            if not events:
+                return None
+            try:
+                position = self.recorder.append(
+                    events, DcbAppendCondition(fail_if_events_match=query, after=after)
+                )
+            except IntegrityError:
+                self.statistics.record(tags, conflicted=True)
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                time.sleep(random.uniform(0, delay))
+            else:
+                self.statistics.record(tags, conflicted=False)
+                return position
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import heapq
+import threading
+from bisect import bisect_right
+from concurrent.futures import Future, wait
+from dataclasses import replace
+from queue import Empty, Full, Queue
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from eventsourcing.persistence import (
+    AggregateRecorder,
+    ApplicationRecorder,
+    Notification,
+    StoredEvent,
+    Subscription,
+)
+
+from eventsourcing_umadb.recorders import (
+    TagExtractor,
+    UmaDbAggregateRecorder,
+    UmaDbApplicationRecorder,
+)
+
+# Position of the last consumed event in each shard (0 if none).
+ShardCursor = Tuple[int, ...]
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to shards by consistent hashing. Each shard has a number of
+    points on the ring, and a key belongs to the shard of the next point.
+    Shards are named by their index, so appending a shard only moves the keys
+    that the new shard's points take over (about 1/N of them).
+    """
+
+    def __init__(self, num_shards: int, points_per_shard: int = 128) -> None:
+        if num_shards < 1:
+            raise ValueError("At least one shard is required")
+        self.num_shards = num_shards
+        points = sorted(
+            (self._hash(f"shard-{shard}-{i}"), shard)
+            for shard in range(num_shards)
+            for i in range(points_per_shard)
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard_for(self, key: str) -> int:
+        i = bisect_right(self._hashes, self._hash(key))
+        return self._shards[i % len(self._shards)]
+
+
+def encode_notification_id(position: int, shard: int, num_shards: int) -> int:
+    """
+    Returns the notification ID of a position in a shard. IDs depend on the
+    number of shards, so adding a shard invalidates every notification ID
+    and ShardCursor that was issued before.
+    """
+    return position * num_shards + shard
+
+
+def decode_notification_id(notification_id: int, num_shards: int) -> Tuple[int, int]:
+    """Returns the shard and the position in the shard."""
+    return notification_id % num_shards, notification_id // num_shards
+
+
+class ShardedUmaDbAggregateRecorder(AggregateRecorder):
+    """
+    Routes events to one of several UmaDB recorders by consistent hash of the
+    originator ID. Events of one aggregate are always in the same shard, so
+    version conflicts are detected as usual. A batch of events for aggregates
+    in different shards is appended to each shard separately, and so is only
+    atomic within each shard. The shards are written concurrently.
+    """
+
+    def __init__(
+        self,
+        shards: Sequence[UmaDbAggregateRecorder],
+        ring: ConsistentHashRing | None = None,
+    ) -> None:
+        self.shards: Sequence[UmaDbAggregateRecorder] = list(shards)
+        self.ring = ring or ConsistentHashRing(len(self.shards))
+        if self.ring.num_shards != len(self.shards):
+            raise ValueError("Ring doesn't have the same number of shards")
+
+    def shard_for(self, originator_id: UUID | str) -> int:
+        return self.ring.shard_for(str(originator_id))
+
+    def insert_events(
+        self, stored_events: Sequence[StoredEvent], **kwargs: Any
+    ) -> Optional[Sequence[int]]:
+        self._insert_events(stored_events, **kwargs)
+        return None
+
+    def _insert_events(
+        self, stored_events: Sequence[StoredEvent], **kwargs: Any
+    ) -> Optional[Sequence[int]]:
+        if len(stored_events) == 0:
+            return None
+        indexes_by_shard: Dict[int, List[int]] = {}
+        for i, stored_event in enumerate(stored_events):
+            shard = self.shard_for(stored_event.originator_id)
+            indexes_by_shard.setdefault(shard, []).append(i)
+        if len(indexes_by_shard) == 1:
+            ((shard, _),) = indexes_by_shard.items()
+            recorder = self.shards[shard]
+            if recorder.spool is not None:
+                return recorder.insert_events(stored_events, **kwargs)
+            positions = recorder._insert_events(stored_events, **kwargs)
+            assert positions is not None
+            return [
+                encode_notification_id(position, shard, len(self.shards))
+                for position in positions
+            ]
+        futures: Dict[int, Future[Optional[Sequence[int]]]] = {
+            shard: (
+                self.shards[shard].insert_events_nowait(
+                    [stored_events[i] for i in indexes], **kwargs
+                )
+            )
+            for shard, indexes in indexes_by_shard.items()
+        }
+        # Waits for all the shards before raising an error from any of them.
+        wait(futures.values())
+        results = {shard: future.result() for shard, future in futures.items()}
+        if any(positions is None for positions in results.values()):
+            # Spooled events don't have notification IDs.
+            return None
+        notification_ids = [0] * len(stored_events)
+        for shard, indexes in indexes_by_shard.items():
+            positions = results[shard]
+            assert positions is not None
+            for i, position in zip(indexes, positions):
+                notification_ids[i] = encode_notification_id(
+                    position, shard, len(self.shards)
+                )
+        return notification_ids
+
+    def select_events(
+        self,
+        originator_id: UUID | str,
+        gt: Optional[int] = None,
+        lte: Optional[int] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        as_of_position: Optional[int] = None,
+    ) -> List[StoredEvent]:
+        """
+        The 'as_of_position' is a notification ID of the merged log, which
+        must be in the shard of the aggregate, because positions in different
+        shards aren't ordered.
+        """
+        shard = self.shard_for(originator_id)
+        position = None
+        if as_of_position is not None:
+            as_of_shard, position = decode_notification_id(
+                as_of_position, len(self.shards)
+            )
+            if as_of_shard != shard:
+                raise ValueError(
+                    f"Notification ID {as_of_position} isn't in the shard"
+                    f" of aggregate {originator_id}"
+                )
+        return self.shards[shard].select_events(
+            originator_id,
+            gt=gt,
+            lte=lte,
+            desc=desc,
+            limit=limit,
+            as_of_position=position,
+        )
+
+    def register_tag_extractor(self, topic: str, extractor: TagExtractor) -> None:
+        for shard in self.shards:
+            shard.register_tag_extractor(topic, extractor)
+
+    def find_originators(self, tag: str, topics: Sequence[str] = ()) -> List[str]:
+        """Returns the IDs of originators with the given tag, from all shards."""
+        return [
+            originator_id
+            for shard in self.shards
+            for originator_id in shard.find_originators(tag, topics)
+        ]
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+
+class ShardedUmaDbApplicationRecorder(
+    ShardedUmaDbAggregateRecorder, ApplicationRecorder
+):
+    """
+    Merges the notification logs of the shards. Notification IDs combine the
+    shard and the position in the shard (see encode_notification_id).
+
+    Shards are written at different rates, so a new event in one shard can
+    have a smaller ID than an event already read from another shard, and a
+    reader that resumes after the last notification ID would skip it. So
+    select_notifications() and subscribe() raise NotImplementedError, and
+    readers track a ShardCursor instead, with the position of the last event
+    consumed from each shard, using read_merged() or subscribe_merged().
+    Cursors that don't have a position for each shard, such as cursors that
+    were issued before a shard was added, are rejected with a ValueError.
+
+    Events of aggregates that are copied to a new shard are also still in
+    their old shard, so the merged log has them twice.
+    """
+
+    shards: Sequence[UmaDbApplicationRecorder]
+
+    def __init__(
+        self,
+        shards: Sequence[UmaDbApplicationRecorder],
+        ring: ConsistentHashRing | None = None,
+    ) -> None:
+        super().__init__(shards, ring)
+
+    def insert_events(
+        self, stored_events: Sequence[StoredEvent], **kwargs: Any
+    ) -> Optional[Sequence[int]]:
+        return self._insert_events(stored_events, **kwargs)
+
+    def max_notification_id(self) -> int | None:
+        ids = [
+            encode_notification_id(head, shard, len(self.shards))
+            for shard, head in enumerate(s.max_notification_id() for s in self.shards)
+            if head is not None
+        ]
+        return max(ids) if ids else None
+
+    def head_cursor(self) -> ShardCursor:
+        """
+        Returns the cursor of the merged log after the last recorded events.
+        """
+        return tuple(s.max_notification_id() or 0 for s in self.shards)
+
+    def read_merged(
+        self,
+        cursor: ShardCursor | None,
+        limit: int,
+        topics: Sequence[str] = (),
+    ) -> Tuple[List[Notification], ShardCursor]:
+        """
+        Returns up to 'limit' notifications after the cursor, ordered by their
+        IDs, and the cursor after the last of the returned notifications.
+        """
+        num_shards = len(self.shards)
+        new_cursor = list(self._check_cursor(cursor))
+        pages = []
+        for shard, recorder in enumerate(self.shards):
+            page = recorder.select_notifications(
+                start=new_cursor[shard] or None,
+                limit=limit,
+                topics=topics,
+                inclusive_of_start=not new_cursor[shard],
+            )
+            pages.append(
+                [
+                    replace(n, id=encode_notification_id(n.id, shard, num_shards))
+                    for n in page
+                ]
+            )
+        notifications = list(heapq.merge(*pages, key=lambda n: n.id))[:limit]
+        for notification in notifications:
+            shard, position = decode_notification_id(notification.id, num_shards)
+            new_cursor[shard] = position
+        return notifications, tuple(new_cursor)
+
+    def select_notifications(
+        self,
+        start: int | None,
+        limit: int,
+        stop: int | None = None,
+        topics: Sequence[str] = (),
+        *,
+        inclusive_of_start: bool = True,
+    ) -> Sequence[Notification]:
+        raise NotImplementedError(
+            "Notification IDs of shards aren't ordered, use read_merged() instead"
+        )
+
+    def subscribe(
+        self, gt: int | None = None, topics: Sequence[str] = ()
+    ) -> ShardedSubscription:
+        raise NotImplementedError(
+            "Notification IDs of shards aren't ordered, use subscribe_merged() instead"
+        )
+
+    def subscribe_merged(
+        self, cursor: ShardCursor | None = None, topics: Sequence[str] = ()
+    ) -> ShardedSubscription:
+        return ShardedSubscription(
+            recorder=self, cursor=self._check_cursor(cursor), topics=topics
+        )
+
+    def _check_cursor(self, cursor: ShardCursor | None) -> ShardCursor:
+        if cursor is None:
+            return (0,) * len(self.shards)
+        if len(cursor) != len(self.shards):
+            raise ValueError(
+                f"Cursor has {len(cursor)} positions but there are"
+                f" {len(self.shards)} shards, so it was issued before the"
+                " shards were changed and can't be used"
+            )
+        return cursor
+
+
+class ShardedSubscription(Subscription[ShardedUmaDbApplicationRecorder]):
+    """
+    Subscribes to each shard in a thread. Notifications are yielded in the
+    order they are received, which is in order of position within each shard.
+    """
+
+    def __init__(
+        self,
+        recorder: ShardedUmaDbApplicationRecorder,
+        cursor: ShardCursor,
+        topics: Sequence[str] = (),
+        max_buffered: int = 1000,
+    ) -> None:
+        super().__init__(recorder=recorder, gt=None, topics=topics)
+        self._cursor = list(cursor)
+        self._queue: Queue[Tuple[int, Notification | BaseException] | None] = Queue(
+            maxsize=max_buffered
+        )
+        self._subscriptions = [
+            shard_recorder.subscribe(gt=cursor[shard] or None, topics=topics)
+            for shard, shard_recorder in enumerate(recorder.shards)
+        ]
+        self._threads = [
+            threading.Thread(target=self._pull, args=(shard,), daemon=True)
+            for shard in range(len(self._subscriptions))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def cursor(self) -> ShardCursor:
+        return tuple(self._cursor)
+
+    def _pull(self, shard: int) -> None:
+        try:
+            for notification in self._subscriptions[shard]:
+                self._put((shard, notification))
+        except BaseException as e:
+            if not self._has_been_stopped:
+                self._put((shard, e))
+
+    def _put(self, item: Tuple[int, Notification | BaseException]) -> None:
+        while not self._has_been_stopped:
+            try:
+                self._queue.put(item, timeout=0.1)
+            except Full:
+                continue
+            else:
+                return
+
+    def __next__(self) -> Notification:
+        while not self._has_been_stopped:
+            try:
+                item = self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is None:
+                break
+            shard, notification = item
+            if isinstance(notification, BaseException):
+                raise notification
+            self._cursor[shard] = notification.id
+            return replace(
+                notification,
+                id=encode_notification_id(
+                    notification.id, shard, len(self._subscriptions)
+                ),
+            )
+        raise StopIteration
+
+    def stop(self) -> None:
+        super().stop()
+        for subscription in self._subscriptions:
+            subscription.stop()
+        try:
+            self._queue.put_nowait(None)
+        except Full:
+            pass
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Tuple, TypeVar
+
+import umadb
+from eventsourcing.dcb.api import DcbQuery, DcbRecorder, DcbSequencedEvent
+
+from eventsourcing_umadb.queries import normalise_query_items
+from eventsourcing_umadb.recorders import UmaDbClient
+
+S = TypeVar("S")
+
+SNAPSHOT_TYPE = "DecisionSnapshot"
+SNAPSHOT_TAG_PREFIX = "decision-snapshot:"
+
+
+def query_key(query: DcbQuery) -> str:
+    """
+    Returns a key that is the same for queries that match the same events,
+    as far as normalise_query_items() can tell, and stable across processes.
+    """
+    items = sorted(normalise_query_items(query.items))
+    return hashlib.sha256(repr(items).encode()).hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class DecisionModel(Generic[S]):
+    """
+    How to build the state of a decision from the events that match a query,
+    and how to encode the state in a snapshot. Change the name when the
+    state or evolve() changes, so that older snapshots aren't used.
+    """
+
+    name: str
+    initial: S
+    evolve: Callable[[S, DcbSequencedEvent], S]
+    encode: Callable[[S], bytes]
+    decode: Callable[[bytes], S]
+
+
+@dataclass(frozen=True)
+class DecisionSnapshot:
+    """
+    State of a decision model that includes the events that match its query
+    up to 'position'.
+    """
+
+    key: str
+    position: int
+    state: bytes
+
+
+class DecisionSnapshotStore(ABC):
+    @abstractmethod
+    def get(self, key: str) -> DecisionSnapshot | None:
+        """Returns the newest snapshot with the given key, if any."""
+
+    @abstractmethod
+    def put(self, snapshot: DecisionSnapshot) -> None:
+        pass  # pragma: no cover
+
+
+class InMemoryDecisionSnapshotStore(DecisionSnapshotStore):
+    """
+    Keeps the newest snapshot of the 'max_snapshots' most recently used keys.
+    """
+
+    def __init__(self, max_snapshots: int = 10000) -> None:
+        self.max_snapshots = max_snapshots
+        self._snapshots: OrderedDict[str, DecisionSnapshot] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> DecisionSnapshot | None:
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(key)
+            return snapshot
+
+    def put(self, snapshot: DecisionSnapshot) -> None:
+        with self._lock:
+            existing = self._snapshots.get(snapshot.key)
+            if existing is None or existing.position < snapshot.position:
+                self._snapshots[snapshot.key] = snapshot
+            self._snapshots.move_to_end(snapshot.key)
+            if len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+
+
+class UmaDbDecisionSnapshotStore(DecisionSnapshotStore):
+    """
+    Stores snapshots as events in UmaDB, tagged with their key. Use a
+    separate database from the application's events, otherwise snapshots
+    are seen by reads and subscriptions that match all events.
+    """
+
+    def __init__(self, umadb: UmaDbClient) -> None:
+        self.umadb = umadb
+
+    def get(self, key: str) -> DecisionSnapshot | None:
+        ues = self.umadb.read(
+            query=umadb.Query(
+                items=[
+                    umadb.QueryItem(
+                        types=[SNAPSHOT_TYPE], tags=[SNAPSHOT_TAG_PREFIX + key]
+                    )
+                ]
+            ),
+            backwards=True,
+            limit=1,
+        )
+        for ue in ues:
+            return DecisionSnapshot(
+                key=key,
+                position=int(ue.event.metadata["position"]),
+                state=ue.event.data,
+            )
+        return None
+
+    def put(self, snapshot: DecisionSnapshot) -> None:
+        self.umadb.append(
+            events=[
+                umadb.Event(
+                    event_type=SNAPSHOT_TYPE,
+                    data=snapshot.state,
+                    tags=[SNAPSHOT_TAG_PREFIX + snapshot.key],
+                    metadata={"position": str(snapshot.position)},
+                )
+            ]
+        )
+
+
+class SnapshottingDecisionReader:
+    """
+    Builds the state of decision models from the newest snapshot and the
+    events that match the query after the snapshot's position. A new
+    snapshot is written when at least 'snapshot_every' events were read
+    after the previous one.
+    """
+
+    def __init__(
+        self,
+        recorder: DcbRecorder,
+        store: DecisionSnapshotStore,
+        snapshot_every: int = 100,
+    ) -> None:
+        self.recorder = recorder
+        self.store = store
+        self.snapshot_every = snapshot_every
+
+    def read(self, model: DecisionModel[S], query: DcbQuery) -> Tuple[S, int | None]:
+        """
+        Returns the state and the position up to which it includes the
+        matching events, which can be used as the 'after' of an append
+        condition with the same query.
+        """
+        key = f"{model.name}:{query_key(query)}"
+        snapshot = self.store.get(key)
+        if snapshot is None:
+            state, after = model.initial, None
+        else:
+            state, after = model.decode(snapshot.state), snapshot.position
+        position = after
+        num_events = 0
+        response = self.recorder.read(query, after=after)
+        for sequenced in response:
+            state = model.evolve(state, sequenced)
+            position = sequenced.position
+            num_events += 1
+        head = response.head
+        if head is not None and (position is None or head > position):
+            position = head
+        if num_events >= self.snapshot_every and position is not None:
+            self.store.put(DecisionSnapshot(key, position, model.encode(state)))
+        return state, position
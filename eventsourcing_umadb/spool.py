@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, replace
+from types import TracebackType
+from typing import Any, Callable, List, Sequence, Tuple
+from uuid import UUID, uuid4
+
+from eventsourcing.domain import NIL_UUID
+from eventsourcing.persistence import IntegrityError, StoredEvent
+
+MAGIC = b"UMASPOOL"
+# Magic, write offset, sent offset.
+HEADER = struct.Struct("<8sQQ")
+# Length of the payload, checksum of the payload, time spooled.
+RECORD_HEADER = struct.Struct("<IId")
+EVENT_HEADER = struct.Struct("<q16sHHIH")
+SHORT_LENGTH = struct.Struct("<H")
+LONG_LENGTH = struct.Struct("<I")
+COUNT = struct.Struct("<I")
+
+
+@dataclass(frozen=True)
+class SpoolMetrics:
+    backlog_bytes: int
+    backlog_records: int
+    # Seconds since the oldest record that hasn't been sent was spooled.
+    lag: float
+    sent_events: int
+    rejected_events: int
+    failed_sends: int
+    last_error: BaseException | None
+
+
+class AppendSpool:
+    """
+    Records batches of stored events in a local memory-mapped file, and
+    sends them to UmaDB from a background thread, so that inserting events
+    doesn't wait for a round trip to the server.
+
+    The file is flushed to disk every 'fsync_interval' seconds, rather than
+    for each batch, so batches spooled since the last flush can be lost if
+    the machine fails. Batches are sent in order, combined into appends of
+    up to 'batch_size' events. The sent position is recorded after each
+    append, and unsent batches are sent when the spool is opened again, so
+    delivery is at least once. Events without an ID are given one when
+    spooled, and UmaDB returns the position of an earlier append of events
+    with the same IDs instead of appending them again, so batches that are
+    sent again aren't recorded twice.
+
+    Conflicts are only found when batches are sent. A batch that conflicts
+    with events already recorded is counted as rejected and is skipped.
+
+    When the file is full, spooling waits until all batches have been sent
+    and the file is reused, or raises TimeoutError after 'append_timeout'.
+
+    The file is locked with fcntl, so spools can only be used on Unix.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 64 * 1024 * 1024,
+        batch_size: int = 1000,
+        fsync_interval: float = 0.05,
+        retry_interval: float = 1.0,
+        append_timeout: float = 10.0,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.retry_interval = retry_interval
+        self.append_timeout = append_timeout
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(self._fd)
+            raise RuntimeError(f"Spool file is used by another process: {path}")
+        size = os.fstat(self._fd).st_size
+        if size < capacity:
+            os.ftruncate(self._fd, capacity)
+        self.capacity = max(size, capacity)
+        self._mmap = mmap.mmap(self._fd, self.capacity)
+        magic, self._write_offset, self._sent_offset = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._write_offset = self._sent_offset = HEADER.size
+            self._write_header()
+        # Batches that weren't completely written before a failure are dropped.
+        records = self._read_records(self._write_offset)
+        end = records[-1][0] if records else self._sent_offset
+        if end != self._write_offset:
+            self._write_offset = end
+            self._write_header()
+        self._backlog_records = len(records)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._dirty = False
+        self._closing = threading.Event()
+        self._send: Callable[[Sequence[StoredEvent]], Any] | None = None
+        self._threads: List[threading.Thread] = []
+        self.sent_events = 0
+        self.rejected_events = 0
+        self.failed_sends = 0
+        self.last_error: BaseException | None = None
+
+    def start(self, send: Callable[[Sequence[StoredEvent]], Any]) -> None:
+        """
+        Starts sending spooled batches with the given function, which must
+        insert events without spooling them. A spool can only be started once,
+        so it can only be used by one recorder.
+        """
+        with self._lock:
+            if self._send is not None:
+                raise RuntimeError("Spool has been started already")
+            self._send = send
+        self._threads = [
+            threading.Thread(target=self._flush_periodically, daemon=True),
+            threading.Thread(target=self._send_continually, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def append(self, stored_events: Sequence[StoredEvent]) -> None:
+        if not stored_events:
+            return
+        stored_events = [
+            replace(s, uuid=uuid4()) if s.uuid == NIL_UUID else s for s in stored_events
+        ]
+        payload = _encode_events(stored_events)
+        record = (
+            RECORD_HEADER.pack(len(payload), zlib.crc32(payload), time.time()) + payload
+        )
+        if HEADER.size + len(record) > self.capacity:
+            raise ValueError("Batch of events is larger than the spool")
+        deadline = time.monotonic() + self.append_timeout
+        with self._changed:
+            while self._write_offset + len(record) > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closing.is_set():
+                    raise TimeoutError("Spool is full")
+                self._changed.wait(remaining)
+            offset = self._write_offset
+            self._mmap[offset : offset + len(record)] = record
+            self._write_offset = offset + len(record)
+            self._backlog_records += 1
+            self._write_header()
+            self._dirty = True
+            self._changed.notify_all()
+
+    def flush(self) -> None:
+        """
+        Writes spooled batches to disk now.
+        """
+        with self._lock:
+            self._dirty = False
+        self._mmap.flush()
+
+    def metrics(self) -> SpoolMetrics:
+        with self._lock:
+            lag = 0.0
+            if self._sent_offset < self._write_offset:
+                _, _, spooled_at = RECORD_HEADER.unpack_from(
+                    self._mmap, self._sent_offset
+                )
+                lag = max(0.0, time.time() - spooled_at)
+            return SpoolMetrics(
+                backlog_bytes=self._write_offset - self._sent_offset,
+                backlog_records=self._backlog_records,
+                lag=lag,
+                sent_events=self.sent_events,
+                rejected_events=self.rejected_events,
+                failed_sends=self.failed_sends,
+                last_error=self.last_error,
+            )
+
+    def wait_until_sent(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until all spooled batches have been sent. Returns False if
+        that doesn't happen within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while self._sent_offset < self._write_offset:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """
+        Waits up to 'timeout' seconds for spooled batches to be sent, then
+        stops sending and closes the file. Unsent batches are sent when the
+        spool is opened again.
+        """
+        if self._mmap.closed:
+            return
+        if self._send is not None:
+            self.wait_until_sent(timeout)
+        self._closing.set()
+        with self._changed:
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._mmap.flush()
+        self._mmap.close()
+        os.close(self._fd)
+
+    def __enter__(self) -> AppendSpool:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(self._mmap, 0, MAGIC, self._write_offset, self._sent_offset)
+
+    def _read_records(
+        self, end: int, max_events: int | None = None
+    ) -> List[Tuple[int, List[StoredEvent]]]:
+        """
+        Returns the end offsets and events of the records after the sent
+        offset, stopping at a record that wasn't completely written.
+        """
+        records: List[Tuple[int, List[StoredEvent]]] = []
+        offset = self._sent_offset
+        num_events = 0
+        while offset < end:
+            length, checksum, _ = RECORD_HEADER.unpack_from(self._mmap, offset)
+            start = offset + RECORD_HEADER.size
+            payload = self._mmap[start : start + length]
+            if start + length > end or zlib.crc32(payload) != checksum:
+                break
+            events = _decode_events(payload)
+            if records and max_events is not None:
+                if num_events + len(events) > max_events:
+                    break
+            offset = start + length
+            records.append((offset, events))
+            num_events += len(events)
+        return records
+
+    def _flush_periodically(self) -> None:
+        while not self._closing.wait(self.fsync_interval):
+            if self._dirty:
+                self.flush()
+
+    def _send_continually(self) -> None:
+        assert self._send is not None
+        while True:
+            with self._changed:
+                while (
+                    self._sent_offset == self._write_offset
+                    and not self._closing.is_set()
+                ):
+                    self._changed.wait()
+                if self._closing.is_set():
+                    return
+                end = self._write_offset
+            try:
+                records = self._read_records(end, self.batch_size)
+                if not records:
+                    raise RuntimeError(
+                        f"Spooled batch at offset {self._sent_offset} is damaged"
+                    )
+                self._send_records(records)
+            except Exception as e:
+                self.failed_sends += 1
+                self.last_error = e
+                if self._closing.wait(self.retry_interval):
+                    return
+                continue
+            with self._changed:
+                self._sent_offset = records[-1][0]
+                self._backlog_records -= len(records)
+                if self._sent_offset == self._write_offset:
+                    # Everything is sent, so the file is reused.
+                    self._sent_offset = self._write_offset = HEADER.size
+                self._write_header()
+                self._dirty = True
+                self._changed.notify_all()
+
+    def _send_records(self, records: List[Tuple[int, List[StoredEvent]]]) -> None:
+        assert self._send is not None
+        try:
+            self._send([s for _, events in records for s in events])
+        except IntegrityError:
+            # Find which batches conflict. Events are only counted once all
+            # the batches have been sent or rejected, because other errors
+            # make the batches be sent again.
+            sent = rejected = 0
+            error: IntegrityError | None = None
+            for _, events in records:
+                try:
+                    self._send(events)
+                except IntegrityError as e:
+                    rejected += len(events)
+                    error = e
+                else:
+                    sent += len(events)
+            self.sent_events += sent
+            self.rejected_events += rejected
+            if error is not None:
+                self.last_error = error
+        else:
+            self.sent_events += sum(len(events) for _, events in records)
+
+
+def _encode_events(stored_events: Sequence[StoredEvent]) -> bytes:
+    parts = [COUNT.pack(len(stored_events))]
+    for s in stored_events:
+        originator_id = str(s.originator_id).encode()
+        topic = s.topic.encode()
+        metadata = [(k.encode(), v.encode()) for k, v in s.metadata.items()]
+        parts.append(
+            EVENT_HEADER.pack(
+                s.originator_version,
+                s.uuid.bytes,
+                len(originator_id),
+                len(topic),
+                len(s.state),
+                len(metadata),
+            )
+        )
+        parts.extend((originator_id, topic, s.state))
+        for key, value in metadata:
+            parts.append(SHORT_LENGTH.pack(len(key)))
+            parts.append(key)
+            parts.append(LONG_LENGTH.pack(len(value)))
+            parts.append(value)
+    return b"".join(parts)
+
+
+def _decode_events(buf: bytes) -> List[StoredEvent]:
+    (num_events,) = COUNT.unpack_from(buf)
+    offset = COUNT.size
+    stored_events = []
+    for _ in range(num_events):
+        version, uuid, len_id, len_topic, len_state, num_metadata = (
+            EVENT_HEADER.unpack_from(buf, offset)
+        )
+        offset += EVENT_HEADER.size
+        originator_id = str(buf[offset : offset + len_id], "utf-8")
+        offset += len_id
+        topic = str(buf[offset : offset + len_topic], "utf-8")
+        offset += len_topic
+        state = buf[offset : offset + len_state]
+        offset += len_state
+        metadata = {}
+        for _ in range(num_metadata):
+            (length,) = SHORT_LENGTH.unpack_from(buf, offset)
+            offset += SHORT_LENGTH.size
+            key = str(buf[offset : offset + length], "utf-8")
+            offset += length
+            (length,) = LONG_LENGTH.unpack_from(buf, offset)
+            offset += LONG_LENGTH.size
+            metadata[key] = str(buf[offset : offset + length], "utf-8")
+            offset += length
+        stored_events.append(
+            StoredEvent(
+                originator_id=originator_id,
+                originator_version=version,
+                topic=topic,
+                state=state,
+                uuid=UUID(bytes=uuid),
+                metadata=metadata,
+            )
+        )
+    return stored_events
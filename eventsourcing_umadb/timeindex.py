@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from types import TracebackType
+from typing import BinaryIO, Callable
+
+import umadb
+
+from eventsourcing_umadb.recorders import UmaDbClient
+
+# Position and recorded time (seconds since the epoch) of a sample.
+SAMPLE = struct.Struct("<qd")
+
+
+class TimeIndex:
+    """
+    Sparse index from recorded times to positions. Samples are added in
+    order of position, at most one every 'interval' seconds, so the index
+    stays small. Times are kept non-decreasing, so that a time can be
+    resolved to a position by binary search.
+
+    If a path is given, samples are appended to that file, and loaded from
+    it when the index is constructed.
+    """
+
+    def __init__(self, path: str | None = None, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.positions: array[int] = array("q")
+        self.times: array[float] = array("d")
+        self._lock = threading.Lock()
+        self._file: BinaryIO | None = None
+        if path is not None:
+            self._load(path)
+            self._file = open(path, "ab")
+
+    def _load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        # Ignore a partly written last sample.
+        end = len(data) - len(data) % SAMPLE.size
+        for position, recorded_at in SAMPLE.iter_unpack(data[:end]):
+            self.positions.append(position)
+            self.times.append(recorded_at)
+        if end != len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def last_position(self) -> int | None:
+        return self.positions[-1] if self.positions else None
+
+    def add(self, position: int, recorded_at: float) -> bool:
+        """
+        Adds a sample, unless the position isn't after the last sample or the
+        time is within 'interval' of the last sample. Returns True if added.
+        """
+        with self._lock:
+            if self.positions:
+                if position <= self.positions[-1]:
+                    return False
+                if recorded_at < self.times[-1] + self.interval:
+                    return False
+            self.positions.append(position)
+            self.times.append(recorded_at)
+            if self._file is not None:
+                self._file.write(SAMPLE.pack(position, recorded_at))
+                self._file.flush()
+            return True
+
+    def resolve(self, when: datetime | float) -> int | None:
+        """
+        Returns a position from which to read or subscribe (as 'gt' or
+        'after') so as not to miss events recorded at or after the given
+        time, or None if reading should start from the beginning.
+        """
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        i = bisect_left(self.times, when)
+        return self.positions[i - 1] if i > 0 else None
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> TimeIndex:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class TimeIndexer:
+    """
+    Follows new events with a subscription, and samples their positions and
+    recorded times into a TimeIndex. UmaDB doesn't record when events were
+    appended, so by default the recorded time of an event is when it was
+    received. Give 'timestamp_of' to use a time from the event instead, for
+    example to index events that were recorded before the indexer started.
+    """
+
+    def __init__(
+        self,
+        client: UmaDbClient,
+        index: TimeIndex,
+        timestamp_of: Callable[[umadb.SequencedEvent], float] | None = None,
+    ) -> None:
+        self.index = index
+        self.timestamp_of = timestamp_of
+        after = index.last_position
+        if after is None and timestamp_of is None:
+            # Times of past events aren't known, so start from the head.
+            after = client.head()
+        self._subscription = client.subscribe(after=after)
+        self._has_been_stopped = False
+        self._thread = threading.Thread(target=self._follow, daemon=True)
+        self._thread.start()
+
+    def _follow(self) -> None:
+        last_time = float("-inf")
+        try:
+            while not self._has_been_stopped:
+                batch = self._subscription.next_batch()
+                if not batch:
+                    break
+                if self.timestamp_of is None:
+                    last = batch[-1]
+                    self.index.add(last.position, time.time())
+                    continue
+                for ue in batch:
+                    last_time = max(last_time, self.timestamp_of(ue))
+                    self.index.add(ue.position, last_time)
+        except umadb.CancelledByUserError:
+            if not self._has_been_stopped:
+                raise
+
+    def stop(self) -> None:
+        self._has_been_stopped = True
+        self._subscription.cancel()
+        self._thread.join()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from typing import Any
+
+
+class CountingClient:
+    """
+    Wraps an UmaDB client, and counts the calls of read() and head().
+    """
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+        self.read_calls = 0
+        self.head_calls = 0
+
+    def read(self, *args: Any, **kwargs: Any) -> Any:
+        self.read_calls += 1
+        return self.client.read(*args, **kwargs)
+
+    def head(self) -> int | None:
+        self.head_calls += 1
+        return self.client.head()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
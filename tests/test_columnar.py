@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import tracemalloc
+from collections import Counter
+from typing import Callable, List, Sized, Tuple
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.persistence import StoredEvent
+from umadb import Client
+
+from eventsourcing_umadb.columnar import ColumnarPage, TopicDictionary
+from eventsourcing_umadb.compression import PayloadCompression, ZlibDictCompressor
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestTopicDictionary(TestCase):
+    def test_codes(self) -> None:
+        dictionary = TopicDictionary()
+        self.assertEqual(dictionary.code("a"), 0)
+        self.assertEqual(dictionary.code("b"), 1)
+        self.assertEqual(dictionary.code("a"), 0)
+        self.assertEqual(dictionary.topics, ["a", "b"])
+        self.assertEqual(dictionary.get("b"), 1)
+        self.assertIsNone(dictionary.get("c"))
+
+
+class TestColumnarReads(TestCase):
+    def setUp(self) -> None:
+        compression = PayloadCompression(min_size=10)
+        compression.register("zlib", ZlibDictCompressor(), default=True)
+        self.recorder = UmaDbApplicationRecorder(
+            Client(DEFAULT_LOCAL_UMADB_URI), payload_compression=compression
+        )
+
+    def insert(self, num_events: int, topic_prefix: str) -> int:
+        notification_ids = self.recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=str(uuid4()),
+                    originator_version=0,
+                    topic=f"{topic_prefix}{i % 3}",
+                    state=f"payload-{i}".encode() * (i % 4),
+                )
+                for i in range(num_events)
+            ]
+        )
+        assert notification_ids is not None
+        return notification_ids[0]
+
+    def test_select_notifications_columnar(self) -> None:
+        prefix = f"topic-{uuid4()}-"
+        start = self.insert(10, prefix)
+        dictionary = TopicDictionary()
+        page = self.recorder.select_notifications_columnar(
+            start, 10, topic_dictionary=dictionary
+        )
+        notifications = self.recorder.select_notifications(start, 10)
+        self.assertIsInstance(page, ColumnarPage)
+        self.assertEqual(len(page), 10)
+        self.assertEqual(list(page.positions), [n.id for n in notifications])
+        self.assertEqual(page.last_position, notifications[-1].id)
+        for i, notification in enumerate(notifications):
+            self.assertEqual(page.topic(i), notification.topic)
+            self.assertEqual(bytes(page.payload(i)), notification.state)
+        self.assertEqual(len(page.payload_offsets), 11)
+        self.assertEqual(len(page.payloads), sum(len(n.state) for n in notifications))
+
+        # Aggregate without constructing objects.
+        counts = Counter(page.topic_codes)
+        self.assertEqual(counts[dictionary.code(f"{prefix}0")], 4)
+
+        # Codes are the same on the next page.
+        page2 = self.recorder.select_notifications_columnar(
+            start, 5, topics=[f"{prefix}1"], topic_dictionary=dictionary
+        )
+        self.assertEqual(set(page2.topic_codes), {dictionary.code(f"{prefix}1")})
+        self.assertEqual(len(page2), 3)
+
+        # Start, stop and inclusive_of_start as select_notifications().
+        page3 = self.recorder.select_notifications_columnar(
+            start, 10, stop=start + 2, inclusive_of_start=False
+        )
+        self.assertEqual(list(page3.positions), [start + 1, start + 2])
+        self.assertIsNone(
+            self.recorder.select_notifications_columnar(
+                start, 10, topics=[f"{prefix}-none"]
+            ).last_position
+        )
+        self.assertEqual(page3.payload_offsets[0], 0)
+        self.assertEqual(page3.positions.typecode, "q")
+
+    def test_benchmark(self) -> None:
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 5000
+        recorder = UmaDbApplicationRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=str(uuid4()),
+                    originator_version=0,
+                    topic=f"topic{i % 5}",
+                    state=b"x" * 100,
+                )
+                for i in range(num_events)
+            ]
+        )
+        assert notification_ids is not None
+        start = notification_ids[0]
+        print()
+        selects: List[Tuple[str, Callable[[int, int], Sized]]] = [
+            ("select_notifications", recorder.select_notifications),
+            ("select_notifications_columnar", recorder.select_notifications_columnar),
+        ]
+        for name, select in selects:
+            tracemalloc.start()
+            started = datetime.datetime.now()
+            result = select(start, num_events)
+            duration = datetime.datetime.now() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(len(result), num_events)
+            print(
+                f"{name}: {num_events / duration.total_seconds():.0f} events/s,"
+                f" peak memory {peak / 1024 / 1024:.1f} MiB"
+            )
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+from typing import List
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.compressor import ZlibCompressor
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client, Query, QueryItem
+
+from eventsourcing_umadb.compression import (
+    COMPRESSION_METADATA_KEY,
+    PayloadCompression,
+    ZlibDictCompressor,
+    train_dictionary,
+)
+from eventsourcing_umadb.factory import DcbFactory, Factory
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbDcbRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+def make_payload(i: int) -> bytes:
+    return json.dumps(
+        {
+            "order_id": str(uuid4()),
+            "customer_name": f"Customer {i}",
+            "shipping_address": {"street": f"{i} High Street", "city": "London"},
+            "line_items": [
+                {"product_code": f"SKU-{i % 7}", "quantity": i % 3 + 1},
+                {"product_code": f"SKU-{i % 11}", "quantity": 1},
+            ],
+            "currency": "GBP",
+        }
+    ).encode()
+
+
+class ExamplePayloadCompression(PayloadCompression):
+    def __init__(self) -> None:
+        super().__init__()
+        self.register("zlib", ZlibCompressor(), default=True)
+
+
+class TestPayloadCompression(TestCase):
+    def test_zlib_dict_compressor(self) -> None:
+        samples = [make_payload(i) for i in range(100)]
+        zdict = train_dictionary(samples[:50])
+        self.assertLessEqual(len(zdict), 32768)
+        with_dict = ZlibDictCompressor(zdict=zdict)
+        without_dict = ZlibDictCompressor()
+        for sample in samples[50:]:
+            self.assertEqual(with_dict.decompress(with_dict.compress(sample)), sample)
+            self.assertLess(
+                len(with_dict.compress(sample)), len(without_dict.compress(sample))
+            )
+
+    def test_train_dictionary_prefers_common_samples(self) -> None:
+        zdict = train_dictionary([b"rare", b"common", b"common"], size=10)
+        self.assertEqual(zdict, b"rarecommon")
+        zdict = train_dictionary([b"rare", b"common", b"common"], size=8)
+        self.assertEqual(zdict, b"common")
+
+    def test_encode_and_decode(self) -> None:
+        compression = PayloadCompression(min_size=10)
+        compression.register("orders", ZlibDictCompressor(), event_types=["Order"])
+        payload = make_payload(1)
+
+        # Compressed for registered event types.
+        data, metadata = compression.encode("Order", payload, {"a": "b"})
+        self.assertLess(len(data), len(payload))
+        self.assertEqual(metadata, {"a": "b", COMPRESSION_METADATA_KEY: "orders"})
+        self.assertEqual(compression.decode(data, metadata), (payload, {"a": "b"}))
+
+        # Not compressed for other event types.
+        self.assertEqual(
+            compression.encode("Other", payload, {"a": "b"}), (payload, {"a": "b"})
+        )
+
+        # Not compressed when too small, or when compressing doesn't help.
+        self.assertEqual(compression.encode("Order", b"small", {}), (b"small", {}))
+        random_bytes = os.urandom(100)
+        self.assertEqual(
+            compression.encode("Order", random_bytes, {}), (random_bytes, {})
+        )
+
+        # Decoding unflagged payloads does nothing.
+        self.assertEqual(compression.decode(payload, {"a": "b"}), (payload, {"a": "b"}))
+
+        # Compressor must be registered.
+        data, metadata = compression.encode("Order", payload, {})
+        with self.assertRaises(ValueError):
+            PayloadCompression().decode(data, metadata)
+
+
+class TestRecordersWithPayloadCompression(TestCase):
+    def setUp(self) -> None:
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+        self.compression = PayloadCompression()
+        self.compression.register("zlib", ZlibDictCompressor(), default=True)
+
+    def test_application_recorder(self) -> None:
+        recorder = UmaDbApplicationRecorder(
+            umadb=self.umadb, payload_compression=self.compression
+        )
+        originator_id = str(uuid4())
+        payload = make_payload(1)
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=0,
+                    topic="topic1",
+                    state=payload,
+                    metadata={"a": "b"},
+                )
+            ]
+        )
+        assert notification_ids is not None
+
+        # Stored compressed.
+        ue = next(self.umadb.read(start=notification_ids[0], limit=1))
+        self.assertLess(len(ue.event.data), len(payload))
+        self.assertEqual(ue.event.metadata[COMPRESSION_METADATA_KEY], "zlib")
+
+        # Read decompressed.
+        stored_events = recorder.select_events(originator_id)
+        self.assertEqual(stored_events[0].state, payload)
+        self.assertEqual(stored_events[0].metadata, {"a": "b"})
+        notifications = recorder.select_notifications(notification_ids[0], 1)
+        self.assertEqual(notifications[0].state, payload)
+        self.assertEqual(notifications[0].metadata, {"a": "b"})
+
+        # Recorders without compression read compressed bytes.
+        stored_events = UmaDbApplicationRecorder(self.umadb).select_events(
+            originator_id
+        )
+        self.assertNotEqual(stored_events[0].state, payload)
+
+    def test_dcb_recorder(self) -> None:
+        recorder = UmaDbDcbRecorder(self.umadb, payload_compression=self.compression)
+        tag = f"tag-{uuid4()}"
+        payload = make_payload(1)
+        position = recorder.append(
+            [
+                DcbEvent(
+                    type="type1", data=payload, tags=[tag], uuid=uuid4(), metadata={}
+                )
+            ]
+        )
+        ue = next(self.umadb.read(start=position, limit=1))
+        self.assertLess(len(ue.event.data), len(payload))
+
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        events = list(recorder.read(query))
+        self.assertEqual(events[0].event.data, payload)
+        self.assertEqual(events[0].event.metadata, {})
+        with recorder.subscribe(query) as subscription:
+            self.assertEqual(next(subscription).event.data, payload)
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI,
+                Factory.UMADB_PAYLOAD_COMPRESSION_TOPIC: (
+                    f"{__name__}:ExamplePayloadCompression"
+                ),
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            self.assertIsInstance(
+                recorder.payload_compression, ExamplePayloadCompression
+            )
+        with DcbFactory(env) as dcb_factory:
+            dcb_recorder = dcb_factory.dcb_recorder()
+            assert isinstance(dcb_recorder, UmaDbDcbRecorder)
+            self.assertIsInstance(
+                dcb_recorder.payload_compression, ExamplePayloadCompression
+            )
+        env.pop(Factory.UMADB_PAYLOAD_COMPRESSION_TOPIC)
+        with Factory(env) as factory:
+            self.assertIsNone(factory.payload_compression)
+
+    def test_benchmark(self) -> None:
+        samples = [make_payload(i) for i in range(1000)]
+        zdict = train_dictionary(samples[:200])
+        compressors = {
+            "none": None,
+            "zlib": ZlibDictCompressor(),
+            "zlib-dict": ZlibDictCompressor(zdict=zdict),
+            "zlib-dict-fast": ZlibDictCompressor(zdict=zdict, level=1),
+        }
+        num_per_iter = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 200
+        print()
+        for name, compressor in compressors.items():
+            compression = None
+            if compressor is not None:
+                compression = PayloadCompression()
+                compression.register(name, compressor, default=True)
+            recorder = UmaDbDcbRecorder(self.umadb, payload_compression=compression)
+            tag = f"benchmark-{uuid4()}"
+            payloads = samples[200 : 200 + num_per_iter]
+            events: List[DcbEvent] = [
+                DcbEvent(type="Order", data=p, tags=[tag], uuid=uuid4(), metadata={})
+                for p in payloads
+            ]
+            start = datetime.datetime.now()
+            for event in events:
+                recorder.append([event])
+            append_duration = datetime.datetime.now() - start
+            start = datetime.datetime.now()
+            read = list(recorder.read(DcbQuery(items=[DcbQueryItem(tags=[tag])])))
+            read_duration = datetime.datetime.now() - start
+            self.assertEqual([e.event.data for e in read], payloads)
+            stored = sum(
+                len(ue.event.data)
+                for ue in self.umadb.read(Query(items=[QueryItem(tags=[tag])]))
+            )
+            original = sum(len(p) for p in payloads)
+            print(
+                f"{name}: {stored / original:.0%} of {original} bytes stored, "
+                f"append rate: {len(events) / append_duration.total_seconds():.0f}"
+                f" events/s, read rate: "
+                f"{len(read) / read_duration.total_seconds():.0f} events/s"
+            )
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.cipher import AESCipher
+from eventsourcing.compressor import ZlibCompressor
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem, DcbSequencedEvent
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.persistence import AggregateEventMapper, Notification, StoredEvent
+from eventsourcing.pydantic import Decision, Transcoder
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.compression import (
+    COMPRESSION_METADATA_KEY,
+    PayloadCompression,
+    ZlibDictCompressor,
+)
+from eventsourcing_umadb.decoding import DecodingPipeline
+from eventsourcing_umadb.recorders import (
+    UmaDbApplicationRecorder,
+    UmaDbDcbRecorder,
+    UmaDbSubscription,
+)
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+PADDING = "padding " * 10
+
+
+class Registered(Decision):
+    name: str
+    tricks: List[str]
+
+
+def decode_notification(notification: Notification) -> Tuple[int, int]:
+    return notification.id, json.loads(notification.state)["i"]
+
+
+def decode_dcb_event(sequenced: DcbSequencedEvent) -> Tuple[int, Dict[str, Any]]:
+    return sequenced.position, json.loads(sequenced.event.data)
+
+
+def fail_on_three(notification: Notification) -> int:
+    if json.loads(notification.state)["i"] == 3:
+        raise ValueError("Can't decode")
+    return notification.id
+
+
+class TestDecodingPipeline(TestCase):
+    def setUp(self) -> None:
+        payload_compression = PayloadCompression()
+        payload_compression.register("zlib", ZlibDictCompressor(), default=True)
+        self.recorder = UmaDbApplicationRecorder(
+            Client(DEFAULT_LOCAL_UMADB_URI), payload_compression=payload_compression
+        )
+
+    def insert(self, num_events: int) -> List[int]:
+        return self.insert_stored_events(
+            [
+                StoredEvent(
+                    originator_id=str(uuid4()),
+                    originator_version=0,
+                    topic="topic1",
+                    state=json.dumps({"i": i, "padding": PADDING}).encode(),
+                )
+                for i in range(num_events)
+            ]
+        )
+
+    def insert_stored_events(self, stored_events: List[StoredEvent]) -> List[int]:
+        notification_ids = self.recorder.insert_events(stored_events)
+        assert notification_ids is not None
+        return list(notification_ids)
+
+    def subscribe(self, notification_ids: List[int]) -> UmaDbSubscription:
+        subscription = self.recorder.subscribe(gt=notification_ids[0] - 1)
+        assert isinstance(subscription, UmaDbSubscription)
+        return subscription
+
+    def test_decodes_in_order(self) -> None:
+        notification_ids = self.insert(250)
+        # Payloads are decompressed by the workers.
+        first = next(iter(self.recorder.umadb.read(start=notification_ids[0])))
+        self.assertIn(COMPRESSION_METADATA_KEY, first.event.metadata)
+        with DecodingPipeline(
+            self.subscribe(notification_ids),
+            decode_notification,
+            max_workers=3,
+            batch_size=7,
+        ) as pipeline:
+            decoded = [next(pipeline) for _ in range(250)]
+        self.assertEqual(decoded, [(n, i) for i, n in enumerate(notification_ids)])
+        # Stopped.
+        self.assertEqual(list(pipeline), [])
+
+    def test_decode_error_is_raised(self) -> None:
+        notification_ids = self.insert(5)
+        with DecodingPipeline(
+            self.subscribe(notification_ids), fail_on_three, max_workers=2
+        ) as pipeline:
+            with self.assertRaises(ValueError):
+                for _ in range(5):
+                    next(pipeline)
+
+    def test_dcb_subscription_with_threads(self) -> None:
+        recorder = UmaDbDcbRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        tag = f"tag-{uuid4()}"
+        events = [
+            DcbEvent(
+                type="type1",
+                data=json.dumps({"i": i}).encode(),
+                tags=[tag],
+                uuid=uuid4(),
+                metadata={},
+            )
+            for i in range(20)
+        ]
+        last = recorder.append(events)
+        subscription = recorder.subscribe(
+            query=DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            with DecodingPipeline(
+                subscription, decode_dcb_event, batch_size=3, executor=executor
+            ) as pipeline:
+                decoded = [next(pipeline) for _ in range(20)]
+        self.assertEqual(
+            decoded, [(last - 19 + i, {"i": i}) for i in range(len(events))]
+        )
+
+    def test_benchmark(self) -> None:
+        # Domain events are transcoded, compressed and encrypted by the
+        # library's mapper, as they are by an application with a cipher key.
+        environment = Environment(env={"CIPHER_KEY": AESCipher.create_key(16)})
+        mapper = AggregateEventMapper(
+            Transcoder(), ZlibCompressor(), AESCipher(environment)
+        )
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 1000
+        notification_ids = self.insert_stored_events(
+            [
+                mapper.to_stored_event(
+                    AggregateEvent(
+                        decision=Registered(name=f"dog{i}", tricks=["sit"] * 10),
+                        originator_id=str(uuid4()),
+                        originator_version=0,
+                        metadata={},
+                    )
+                )
+                for i in range(num_events)
+            ]
+        )
+        print()
+
+        subscription = self.subscribe(notification_ids)
+        start = datetime.datetime.now()
+        for _ in range(num_events):
+            mapper.to_domain_event(next(subscription))
+        duration = datetime.datetime.now() - start
+        subscription.stop()
+        print(f"decode in thread: {num_events / duration.total_seconds():.0f} events/s")
+
+        with DecodingPipeline(
+            self.subscribe(notification_ids), mapper.to_domain_event, max_workers=4
+        ) as pipeline:
+            start = datetime.datetime.now()
+            for _ in range(num_events):
+                next(pipeline)
+            duration = datetime.datetime.now() - start
+        print(
+            f"decode in 4 processes: {num_events / duration.total_seconds():.0f}"
+            " events/s"
+        )
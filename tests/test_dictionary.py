@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import time
+from typing import Any, List, cast
+from uuid import uuid4
+
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.compression import PayloadCompression, ZlibDictCompressor
+from eventsourcing_umadb.dictionary import (
+    CODE_PREFIX,
+    METADATA_CODE_KEY,
+    WireDictionary,
+)
+from eventsourcing_umadb.factory import Factory
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbClient
+from tests.counting import CountingClient
+from tests.test_sharding import WithLocalUmaDbServers
+
+TOPIC = "myapp.domain.orders:Order.Created"
+METADATA = {"schema": "orders-v1", "producer": "orders-service"}
+
+
+class TestWireDictionary(WithLocalUmaDbServers):
+    num_servers = 2
+    first_port = 50091
+
+    def setUp(self) -> None:
+        self.events_client = Client(self.uris[0])
+        self.dictionary_client = Client(self.uris[1])
+        self.dictionary = WireDictionary(self.dictionary_client, encode_metadata=True)
+        self.addCleanup(self.dictionary.close)
+        compression = PayloadCompression(min_size=10)
+        compression.register("zlib", ZlibDictCompressor(), default=True)
+        self.recorder = UmaDbApplicationRecorder(
+            self.events_client,
+            payload_compression=compression,
+            wire_dictionary=self.dictionary,
+        )
+
+    def stored_events(self, num_events: int, topic: str = TOPIC) -> List[StoredEvent]:
+        return [
+            StoredEvent(
+                originator_id=str(uuid4()),
+                originator_version=0,
+                topic=topic,
+                state=b"state" * 10,
+                metadata=dict(METADATA),
+            )
+            for _ in range(num_events)
+        ]
+
+    def test_codes_are_stable_and_shared(self) -> None:
+        value = f"value-{uuid4()}"
+        self.assertIsNone(self.dictionary.find_code(value))
+        code = self.dictionary.code(value)
+        self.assertTrue(code.startswith(CODE_PREFIX))
+        self.assertEqual(self.dictionary.code(value), code)
+
+        # Another process finds the same code and value.
+        other = WireDictionary(Client(self.uris[1]))
+        self.assertEqual(other.code(value), code)
+        self.assertEqual(WireDictionary(Client(self.uris[1])).value(code), value)
+        with self.assertRaises(ValueError):
+            other.value(f"{CODE_PREFIX}999999")
+
+    def test_misses_are_cached_until_registered(self) -> None:
+        value = f"value-{uuid4()}"
+        client = CountingClient(Client(self.uris[1]))
+        dictionary = WireDictionary(cast(UmaDbClient, client))
+        self.addCleanup(dictionary.close)
+        self.assertEqual(dictionary.query_types([value]), [value])
+        self.assertEqual(dictionary.query_types([value]), [value])
+        self.assertEqual(client.read_calls, 1)
+
+        # Registered by another process, and received by the subscription.
+        code = WireDictionary(Client(self.uris[1]), cache_misses=False).code(value)
+        deadline = time.monotonic() + 5
+        while dictionary.find_code(value) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(dictionary.query_types([value]), [value, code])
+        self.assertEqual(client.read_calls, 1)
+
+    def test_metadata_with_code_prefix_keys(self) -> None:
+        recorder = UmaDbApplicationRecorder(
+            self.events_client, wire_dictionary=WireDictionary(self.dictionary_client)
+        )
+        for metadata in [{"~": "a"}, {"~~": "b"}, {"~": "c", "d": "e"}]:
+            stored_event = self.stored_events(1)[0]
+            stored_event.metadata.clear()
+            stored_event.metadata.update(metadata)
+            recorder.insert_events([stored_event])
+            selected = recorder.select_events(stored_event.originator_id)
+            self.assertEqual(selected[0].metadata, metadata)
+
+    def test_encoded_on_write_and_decoded_on_read(self) -> None:
+        stored_event = self.stored_events(1)[0]
+        notification_ids = self.recorder.insert_events([stored_event])
+        assert notification_ids is not None
+
+        # Stored with codes.
+        ue = list(self.events_client.read(start=notification_ids[0], limit=1))[0]
+        self.assertTrue(ue.event.event_type.startswith(CODE_PREFIX))
+        self.assertEqual(list(ue.event.metadata), [METADATA_CODE_KEY])
+
+        # Decoded by a recorder with an empty cache.
+        recorder = UmaDbApplicationRecorder(
+            self.events_client,
+            payload_compression=self.recorder.payload_compression,
+            wire_dictionary=WireDictionary(Client(self.uris[1])),
+        )
+        selected = recorder.select_events(stored_event.originator_id)
+        self.assertEqual(selected[0].topic, TOPIC)
+        self.assertEqual(selected[0].metadata, METADATA)
+        self.assertEqual(selected[0].state, stored_event.state)
+        notifications = recorder.select_notifications(notification_ids[0], 1)
+        self.assertEqual(notifications[0].topic, TOPIC)
+        self.assertEqual(notifications[0].metadata, METADATA)
+        page = recorder.select_notifications_columnar(notification_ids[0], 1)
+        self.assertEqual(page.topic(0), TOPIC)
+        self.assertEqual(bytes(page.payload(0)), stored_event.state)
+
+    def test_topic_filters_match_encoded_and_plain_events(self) -> None:
+        topic = f"myapp:Event-{uuid4()}"
+        plain_recorder = UmaDbApplicationRecorder(self.events_client)
+        plain_ids = plain_recorder.insert_events(self.stored_events(1, topic))
+        encoded_ids = self.recorder.insert_events(self.stored_events(1, topic))
+        assert plain_ids is not None and encoded_ids is not None
+        notifications = self.recorder.select_notifications(
+            plain_ids[0], 10, topics=[topic]
+        )
+        self.assertEqual([n.id for n in notifications], [plain_ids[0], encoded_ids[0]])
+        self.assertEqual({n.topic for n in notifications}, {topic})
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: self.uris[0],
+                Factory.UMADB_DICTIONARY_URI: self.uris[1],
+                Factory.UMADB_DICTIONARY_ENCODE_METADATA: "yes",
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            assert recorder.wire_dictionary is factory.wire_dictionary
+            assert factory.wire_dictionary is not None
+            self.assertTrue(factory.wire_dictionary.encode_metadata_values)
+
+    def test_benchmark(self) -> None:
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 2000
+        print()
+        dictionary = WireDictionary(self.dictionary_client, True)
+        self.addCleanup(dictionary.close)
+        for name, wire_dictionary in [("plain", None), ("dictionary", dictionary)]:
+            recorder = UmaDbApplicationRecorder(
+                self.events_client, wire_dictionary=wire_dictionary
+            )
+            notification_ids = recorder.insert_events(self.stored_events(num_events))
+            assert notification_ids is not None
+            stored_size = sum(
+                len(ue.event.event_type)
+                + sum(len(k) + len(v) for k, v in ue.event.metadata.items())
+                for ue in self.events_client.read(
+                    start=notification_ids[0], limit=num_events
+                )
+            )
+            start = datetime.datetime.now()
+            notifications = recorder.select_notifications(
+                notification_ids[0], num_events
+            )
+            duration = datetime.datetime.now() - start
+            self.assertEqual(len(notifications), num_events)
+            print(
+                f"{name}: {stored_size / num_events:.0f} bytes of topic and"
+                f" metadata per event,"
+                f" read {num_events / duration.total_seconds():.0f} events/s"
+            )
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import time
+from typing import Any
+from unittest import TestCase
+from uuid import uuid4
+
+import umadb
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.existence import BloomFilter, ExistenceFilter
+from eventsourcing_umadb.factory import Factory
+from eventsourcing_umadb.recorders import UmaDbAggregateRecorder
+from tests.counting import CountingClient
+from tests.test_sharding import WithLocalUmaDbServers
+
+
+def stored_event(originator_id: str, originator_version: int = 0) -> StoredEvent:
+    return StoredEvent(
+        originator_id=originator_id,
+        originator_version=originator_version,
+        topic="topic1",
+        state=b"",
+    )
+
+
+class TestBloomFilter(TestCase):
+    def test_added_keys_are_found(self) -> None:
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [str(uuid4()) for _ in range(1000)]
+        for key in keys:
+            bloom_filter.add(key)
+        for key in keys:
+            self.assertIn(key, bloom_filter)
+
+        false_positives = sum(str(uuid4()) in bloom_filter for _ in range(10000))
+        self.assertLess(false_positives, 300)
+        # Keys are counted approximately.
+        self.assertGreater(bloom_filter.num_keys, 980)
+        self.assertFalse(bloom_filter.is_saturated)
+        for _ in range(20):
+            bloom_filter.add(str(uuid4()))
+        self.assertTrue(bloom_filter.is_saturated)
+
+
+class TestExistenceFilter(WithLocalUmaDbServers):
+    # A server of its own, so that the number of originators is known.
+    num_servers = 1
+    first_port = 50101
+
+    def setUp(self) -> None:
+        self.client = Client(self.uris[0])
+        self.other_recorder = UmaDbAggregateRecorder(Client(self.uris[0]))
+
+    def test_built_from_recorded_events_and_subscription(self) -> None:
+        originator_id1 = str(uuid4())
+        self.other_recorder.insert_events([stored_event(originator_id1)])
+        existence_filter = ExistenceFilter(self.client, capacity=1000)
+        try:
+            deadline = time.monotonic() + 5
+            while existence_filter.position != self.client.head():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            self.assertTrue(existence_filter.might_exist(originator_id1))
+            self.assertFalse(existence_filter.might_exist(str(uuid4())))
+
+            # Events appended by other writers are followed.
+            originator_id2 = str(uuid4())
+            self.other_recorder.insert_events([stored_event(originator_id2)])
+            deadline = time.monotonic() + 5
+            while existence_filter.position != self.client.head():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            self.assertTrue(existence_filter.might_exist(originator_id2))
+        finally:
+            existence_filter.close()
+
+    def test_misses_are_not_definite_until_caught_up(self) -> None:
+        existence_filter = ExistenceFilter(self.client, subscribe=False)
+        recorder = UmaDbAggregateRecorder(
+            self.client, existence_filter=existence_filter
+        )
+        originator_id = str(uuid4())
+        self.other_recorder.insert_events([stored_event(originator_id)])
+        # Not added to the filter, but found by reading events.
+        self.assertNotIn(originator_id, existence_filter.bloom_filter)
+        self.assertTrue(existence_filter.might_exist(originator_id))
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+        existence_filter.close()
+
+    def test_recorder_skips_definite_misses(self) -> None:
+        counting = CountingClient(self.client)
+        existence_filter = ExistenceFilter(
+            counting, subscribe=False, head_max_staleness=60
+        )
+        recorder = UmaDbAggregateRecorder(counting, existence_filter=existence_filter)
+        counting.read_calls = 0
+
+        for _ in range(10):
+            self.assertEqual(recorder.select_events(uuid4()), [])
+        self.assertEqual(counting.read_calls, 0)
+        # The head is only read once.
+        self.assertEqual(counting.head_calls, 1)
+
+        originator_id = uuid4()
+        recorder.insert_events([stored_event(str(originator_id))])
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+        self.assertEqual(counting.read_calls, 1)
+        self.assertEqual(counting.head_calls, 1)
+        existence_filter.close()
+
+    def test_saturated_filter_is_disabled(self) -> None:
+        self.other_recorder.insert_events(
+            [stored_event(str(uuid4())) for _ in range(20)]
+        )
+        with self.assertLogs("eventsourcing_umadb.existence", "WARNING"):
+            existence_filter = ExistenceFilter(
+                self.client, capacity=10, subscribe=False
+            )
+        self.assertTrue(existence_filter.is_disabled)
+        self.assertTrue(existence_filter.might_exist(str(uuid4())))
+        existence_filter.close()
+
+        # Also when following the log.
+        with self.assertLogs("eventsourcing_umadb.existence", "WARNING"):
+            existence_filter = ExistenceFilter(self.client, capacity=10)
+            deadline = time.monotonic() + 5
+            while not existence_filter.is_disabled:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        existence_filter.close()
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: self.uris[0],
+                Factory.UMADB_EXISTENCE_FILTER_CAPACITY: "100000",
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbAggregateRecorder)
+            assert recorder.existence_filter is not None
+            self.assertEqual(recorder.existence_filter.bloom_filter.capacity, 100000)
+            self.assertEqual(factory.existence_filters, [recorder.existence_filter])
+
+    def test_benchmark(self) -> None:
+        num_gets = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 1000
+        existence_filter = ExistenceFilter(self.client, subscribe=False)
+        print()
+        for name, recorder in [
+            ("without filter", UmaDbAggregateRecorder(self.client)),
+            (
+                "with filter",
+                UmaDbAggregateRecorder(self.client, existence_filter=existence_filter),
+            ),
+        ]:
+            originator_ids = [uuid4() for _ in range(num_gets)]
+            start = datetime.datetime.now()
+            for originator_id in originator_ids:
+                recorder.select_events(originator_id)
+            duration = datetime.datetime.now() - start
+            print(
+                f"select_events() misses {name}:"
+                f" {num_gets / duration.total_seconds():.0f} calls/s"
+            )
+        existence_filter.close()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.domain import NIL_UUID
+from umadb import Client, Event, Query, QueryItem
+
+from eventsourcing_umadb.export import (
+    ExportFormatError,
+    ExportReader,
+    export_events,
+    main,
+    restore_events,
+)
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestExport(TestCase):
+    def setUp(self) -> None:
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+        self.tempdir = TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "export.bin")
+        self.tag = f"export-{uuid4()}"
+        self.query = Query(items=[QueryItem(tags=[self.tag])])
+        self.uuids = [uuid4() for _ in range(24)]
+        self.umadb.append(
+            events=[
+                Event(
+                    event_type="type1" if i % 2 else "type2",
+                    data=f"data{i}".encode(),
+                    tags=[self.tag, f"tag{i}"],
+                    uuid=self.uuids[i] if i % 3 else None,
+                    metadata={"n": str(i)} if i % 4 else {},
+                )
+                for i in range(24)
+            ]
+        )
+        self.positions = [ue.position for ue in self.umadb.read(query=self.query)]
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_export_and_read(self) -> None:
+        for compress in (True, False):
+            num_events = export_events(
+                self.umadb, self.path, query=self.query, chunk_size=5, compress=compress
+            )
+            self.assertEqual(num_events, 24)
+
+            with ExportReader(self.path) as reader:
+                self.assertEqual(len(reader), 24)
+                self.assertEqual(reader.num_chunks, 5)
+                events = list(reader.read())
+                self.assertEqual([e.position for e in events], self.positions)
+                for i, e in enumerate(events):
+                    self.assertEqual(e.event.type, "type1" if i % 2 else "type2")
+                    self.assertEqual(e.event.data, f"data{i}".encode())
+                    self.assertEqual(e.event.tags, [self.tag, f"tag{i}"])
+                    self.assertEqual(e.event.uuid, self.uuids[i] if i % 3 else NIL_UUID)
+                    self.assertEqual(e.event.metadata, {"n": str(i)} if i % 4 else {})
+
+                # Read after a position, seeking to the chunk with the index.
+                after = self.positions[11]
+                events = list(reader.read(after=after))
+                self.assertEqual([e.position for e in events], self.positions[12:])
+                self.assertEqual(list(reader.read(after=self.positions[-1])), [])
+
+                # Only selected records of a chunk are decoded.
+                selected = reader.read_chunk(1, lambda t, tags: t == "type1")
+                self.assertEqual([e.position for e in selected], self.positions[5:10:2])
+                self.assertEqual(selected[0].event.data, b"data5")
+                self.assertEqual(selected[0].event.metadata, {"n": "5"})
+
+    def test_export_after(self) -> None:
+        num_events = export_events(
+            self.umadb, self.path, query=self.query, after=self.positions[19]
+        )
+        self.assertEqual(num_events, 4)
+        with ExportReader(self.path) as reader:
+            self.assertEqual([e.position for e in reader.read()], self.positions[20:])
+
+    def test_export_empty(self) -> None:
+        query = Query(items=[QueryItem(tags=[f"export-{uuid4()}"])])
+        self.assertEqual(export_events(self.umadb, self.path, query=query), 0)
+        with ExportReader(self.path) as reader:
+            self.assertEqual(len(reader), 0)
+            self.assertEqual(list(reader.read()), [])
+
+    def test_not_an_export_file(self) -> None:
+        with open(self.path, "wb") as f:
+            f.write(b"")
+        with self.assertRaises(ExportFormatError):
+            ExportReader(self.path)
+
+        with open(self.path, "wb") as f:
+            f.write(b"0" * 100)
+        with self.assertRaises(ExportFormatError):
+            ExportReader(self.path)
+
+        # Truncated.
+        export_events(self.umadb, self.path, query=self.query)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ExportFormatError):
+            ExportReader(self.path)
+
+    def test_restore(self) -> None:
+        export_events(self.umadb, self.path, query=self.query, chunk_size=5)
+        tracking_source = f"restore-{uuid4()}"
+
+        head = self.umadb.head()
+        self.assertEqual(
+            restore_events(
+                self.umadb, self.path, batch_size=10, tracking_source=tracking_source
+            ),
+            24,
+        )
+        self.assertEqual(
+            self.umadb.get_tracking_info(tracking_source), self.positions[-1]
+        )
+        restored = list(self.umadb.read(query=self.query, start=(head or 0) + 1))
+        self.assertEqual(len(restored), 24)
+        self.assertEqual(
+            [r.event.data for r in restored], [f"data{i}".encode() for i in range(24)]
+        )
+        self.assertEqual(restored[1].event.uuid, self.uuids[1])
+        self.assertIsNone(restored[0].event.uuid)
+
+        # Resumes from the tracking position.
+        self.assertEqual(
+            restore_events(self.umadb, self.path, tracking_source=tracking_source), 0
+        )
+
+    def test_main(self) -> None:
+        main(["export", DEFAULT_LOCAL_UMADB_URI, self.path, "--tags", self.tag])
+        with ExportReader(self.path) as reader:
+            self.assertEqual(len(reader), 24)
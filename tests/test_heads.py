@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import threading
+import time
+from typing import Any, List, Tuple
+from unittest import TestCase
+from uuid import uuid4
+
+import umadb
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import Factory
+from eventsourcing_umadb.heads import HeadTrackingClient
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbClient
+from tests.counting import CountingClient
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+def append(client: Client) -> int:
+    return client.append(
+        [
+            umadb.Event(
+                event_type="type1", data=b"", tags=[f"tag-{uuid4()}"], uuid=uuid4()
+            )
+        ]
+    )
+
+
+class TestHeadTrackingClient(TestCase):
+    def setUp(self) -> None:
+        self.client = Client(DEFAULT_LOCAL_UMADB_URI)
+        self.other_client = Client(DEFAULT_LOCAL_UMADB_URI)
+
+    def test_head_is_cached(self) -> None:
+        counting = CountingClient(self.client)
+        tracker = HeadTrackingClient(counting, max_staleness=60, refresh=False)
+        head = tracker.head()
+        self.assertEqual(head, self.client.head())
+        self.assertEqual(counting.head_calls, 1)
+        for _ in range(10):
+            self.assertEqual(tracker.head(), head)
+        self.assertEqual(counting.head_calls, 1)
+
+        # Appends move the position forwards.
+        position = tracker.append(
+            [umadb.Event(event_type="type1", data=b"", tags=[], uuid=uuid4())]
+        )
+        self.assertEqual(tracker.head(), position)
+        self.assertEqual(counting.head_calls, 1)
+
+        # Stale positions are refreshed.
+        tracker.max_staleness = 0
+        position = append(self.other_client)
+        time.sleep(0.001)
+        self.assertEqual(tracker.head(), position)
+        self.assertEqual(counting.head_calls, 2)
+        tracker.close()
+
+    def test_background_refresh_follows_other_writers(self) -> None:
+        counting = CountingClient(self.client)
+        tracker = HeadTrackingClient(counting, max_staleness=0.05)
+        try:
+            tracker.head()
+            position = append(self.other_client)
+            self.assertTrue(tracker.wait_for_position(position, timeout=5))
+            self.assertGreaterEqual(tracker.head() or 0, position)
+            self.assertFalse(tracker.wait_for_position(position + 1000, timeout=0.05))
+
+            # The position is refreshed without calling head().
+            position = append(self.other_client)
+            time.sleep(0.1)
+            self.assertGreaterEqual(tracker.position or 0, position)
+        finally:
+            tracker.close()
+        # Refreshed in the background.
+        self.assertGreater(counting.head_calls, 2)
+
+    def test_background_refresh_is_started_by_head_and_stops_when_idle(
+        self,
+    ) -> None:
+        counting = CountingClient(self.client)
+        tracker = HeadTrackingClient(counting, max_staleness=0.02, idle_timeout=0.1)
+        try:
+            # Nothing is called until head() is called.
+            time.sleep(0.1)
+            self.assertEqual(counting.head_calls, 0)
+            self.assertIsNone(tracker._thread)
+
+            tracker.head()
+            thread = tracker._thread
+            assert thread is not None
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+            self.assertIsNone(tracker._thread)
+            head_calls = counting.head_calls
+            self.assertGreater(head_calls, 1)
+            time.sleep(0.1)
+            self.assertEqual(counting.head_calls, head_calls)
+
+            # Started again by the next call.
+            tracker.head()
+            self.assertIsNotNone(tracker._thread)
+        finally:
+            tracker.close()
+
+    def test_wait_for_position_without_refresh(self) -> None:
+        tracker = HeadTrackingClient(self.client, max_staleness=60, refresh=False)
+        head = tracker.head() or 0
+        positions = []
+
+        def write() -> None:
+            time.sleep(0.05)
+            positions.append(append(self.other_client))
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        self.assertTrue(tracker.wait_for_position(head + 1, timeout=5))
+        thread.join()
+        self.assertGreaterEqual(tracker.position or 0, positions[0])
+        self.assertFalse(tracker.wait_for_position(head + 1000, timeout=0.05))
+        tracker.close()
+
+    def test_recorder_and_factory(self) -> None:
+        tracker = HeadTrackingClient(self.client, max_staleness=60)
+        recorder = UmaDbApplicationRecorder(tracker)
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=str(uuid4()),
+                    originator_version=0,
+                    topic="topic1",
+                    state=b"",
+                )
+            ]
+        )
+        assert notification_ids is not None
+        self.assertGreaterEqual(
+            recorder.max_notification_id() or 0, notification_ids[-1]
+        )
+        tracker.close()
+
+        env = Environment(
+            env={
+                Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI,
+                Factory.UMADB_HEAD_MAX_STALENESS: "0.5",
+            }
+        )
+        with Factory(env) as factory:
+            client = factory.umadb.client
+            assert isinstance(client, HeadTrackingClient)
+            self.assertEqual(client.max_staleness, 0.5)
+
+    def test_benchmark(self) -> None:
+        num_calls = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 1000
+        tracker = HeadTrackingClient(self.client, max_staleness=0.1)
+        print()
+        clients: List[Tuple[str, UmaDbClient]] = [
+            ("server", self.other_client),
+            ("tracked", tracker),
+        ]
+        for name, client in clients:
+            start = datetime.datetime.now()
+            for _ in range(num_calls):
+                client.head()
+            duration = datetime.datetime.now() - start
+            print(f"head() {name}: {num_calls / duration.total_seconds():.0f} calls/s")
+        tracker.close()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.popo import POPOApplicationRecorder
+from umadb import Client
+
+from eventsourcing_umadb.importer import ImportVerificationError, UmaDbImporter
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestUmaDbImporter(TestCase):
+    def setUp(self) -> None:
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+        self.source = POPOApplicationRecorder()
+        self.target = UmaDbApplicationRecorder(umadb=self.umadb)
+        self.originator_ids = [str(uuid4()) for _ in range(3)]
+        for version in range(7):
+            self.source.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic="topic1",
+                        state=f"state{version}".encode(),
+                        uuid=uuid4(),
+                        metadata={"key": originator_id},
+                    )
+                    for originator_id in self.originator_ids
+                ]
+            )
+
+    def create_importer(self) -> UmaDbImporter:
+        return UmaDbImporter(
+            source=self.source,
+            target=self.target,
+            tracking_source=f"import-{uuid4()}",
+            batch_size=5,
+            max_batches_in_flight=2,
+        )
+
+    def test_import_and_verify(self) -> None:
+        importer = self.create_importer()
+        self.assertIsNone(importer.position())
+        target_after = self.umadb.head()
+
+        self.assertEqual(importer.run(), 21)
+        self.assertEqual(importer.position(), 21)
+        self.assertEqual(importer.verify(target_after=target_after), 21)
+
+        # Imported events are tagged like inserted events.
+        for originator_id in self.originator_ids:
+            stored_events = self.target.select_events(originator_id)
+            self.assertEqual([s.originator_version for s in stored_events], [*range(7)])
+            self.assertEqual(stored_events[2].state, b"state2")
+            self.assertEqual(stored_events[2].metadata, {"key": originator_id})
+
+        # Nothing more to import.
+        self.assertEqual(importer.run(), 0)
+
+    def test_resume(self) -> None:
+        importer = self.create_importer()
+        target_after = self.umadb.head()
+
+        self.assertEqual(importer.run(stop=10), 10)
+        self.assertEqual(importer.position(), 10)
+
+        self.assertEqual(importer.run(), 11)
+        self.assertEqual(importer.position(), 21)
+        self.assertEqual(importer.verify(target_after=target_after), 21)
+
+    def test_verify_detects_missing_events(self) -> None:
+        importer = self.create_importer()
+        target_after = self.umadb.head()
+        importer.run(stop=10)
+        with self.assertRaises(ImportVerificationError):
+            importer.verify(target_after=target_after)
+
+    def test_verify_allows_other_writers(self) -> None:
+        importer = self.create_importer()
+        target_after = self.umadb.head()
+        importer.run(stop=10)
+        # Another writer records events between the imported batches.
+        self.target.insert_events(
+            [
+                StoredEvent(
+                    originator_id=str(uuid4()),
+                    originator_version=0,
+                    topic="topic1",
+                    state=b"other",
+                    uuid=uuid4(),
+                )
+            ]
+        )
+        importer.run()
+        self.assertEqual(importer.verify(target_after=target_after), 21)
+
+    def test_events_recorded_by_an_earlier_run_are_not_duplicated(self) -> None:
+        target_after = self.umadb.head()
+        self.create_importer().run(stop=10)
+
+        # A new tracking source starts from the beginning, with other batches.
+        importer = self.create_importer()
+        importer.batch_size = 4
+        self.assertEqual(importer.run(), 21)
+        self.assertEqual(importer.verify(target_after=target_after), 21)
+        for originator_id in self.originator_ids:
+            stored_events = self.target.select_events(originator_id)
+            self.assertEqual([s.originator_version for s in stored_events], [*range(7)])
+
+    def test_events_without_ids_are_given_ids(self) -> None:
+        source = POPOApplicationRecorder()
+        originator_id = str(uuid4())
+        source.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=version,
+                    topic="topic1",
+                    state=b"state",
+                )
+                for version in range(3)
+            ]
+        )
+        importer = UmaDbImporter(source, self.target, f"import-{uuid4()}")
+        target_after = self.umadb.head()
+        self.assertEqual(importer.run(), 3)
+        self.assertEqual(importer.verify(target_after=target_after), 3)
+        uuids = {s.uuid for s in self.target.select_events(originator_id)}
+        self.assertEqual(len(uuids), 3)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+from typing import List
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.persistence import IntegrityError, StoredEvent
+from umadb import Client
+
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+def email_tags(stored_event: StoredEvent) -> List[str]:
+    return [f"email:{json.loads(stored_event.state)['email']}"]
+
+
+class TestIndexTags(TestCase):
+    def setUp(self) -> None:
+        self.recorder = UmaDbApplicationRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        self.topic = f"Registered-{uuid4()}"
+        self.recorder.register_tag_extractor(self.topic, email_tags)
+
+    def stored_event(self, email: str, version: int = 0) -> StoredEvent:
+        return StoredEvent(
+            originator_id=str(uuid4()),
+            originator_version=version,
+            topic=self.topic,
+            state=json.dumps({"email": email}).encode(),
+        )
+
+    def test_find_originators(self) -> None:
+        email1 = f"{uuid4()}@example.com"
+        email2 = f"{uuid4()}@example.com"
+        event1 = self.stored_event(email1)
+        event2 = self.stored_event(email2)
+        event3 = self.stored_event(email1)
+        self.recorder.insert_events([event1, event2, event3])
+
+        self.assertEqual(
+            self.recorder.find_originators(f"email:{email1}"),
+            [event1.originator_id, event3.originator_id],
+        )
+        self.assertEqual(
+            self.recorder.find_originators(f"email:{email2}"),
+            [event2.originator_id],
+        )
+        self.assertEqual(
+            self.recorder.find_originators(f"email:{email1}", topics=["other"]), []
+        )
+        self.assertEqual(self.recorder.find_originators("email:nobody"), [])
+
+        # Index tags don't change what is selected.
+        stored_events = self.recorder.select_events(event1.originator_id)
+        self.assertEqual(len(stored_events), 1)
+        self.assertEqual(stored_events[0].originator_version, 0)
+        self.assertEqual(stored_events[0].state, event1.state)
+
+    def test_conflicts_are_detected(self) -> None:
+        event1 = self.stored_event(f"{uuid4()}@example.com")
+        self.recorder.insert_events([event1])
+        # Same originator version with different index tags.
+        event2 = StoredEvent(
+            originator_id=event1.originator_id,
+            originator_version=0,
+            topic=self.topic,
+            state=json.dumps({"email": "other@example.com"}).encode(),
+            uuid=uuid4(),
+        )
+        with self.assertRaises(IntegrityError):
+            self.recorder.insert_events([event2])
+        # Also without an index tag.
+        event3 = StoredEvent(
+            originator_id=event1.originator_id,
+            originator_version=0,
+            topic="untagged",
+            state=b"",
+            uuid=uuid4(),
+        )
+        with self.assertRaises(IntegrityError):
+            self.recorder.insert_events([event3])
+
+    def test_benchmark(self) -> None:
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 2000
+        email = f"{uuid4()}@example.com"
+        stored_events = [
+            self.stored_event(f"{uuid4()}@example.com") for _ in range(num_events)
+        ]
+        stored_events.append(self.stored_event(email))
+        notification_ids = self.recorder.insert_events(stored_events)
+        assert notification_ids is not None
+        print()
+
+        start = datetime.datetime.now()
+        found = self.recorder.find_originators(f"email:{email}")
+        duration = datetime.datetime.now() - start
+        self.assertEqual(found, [stored_events[-1].originator_id])
+        print(f"find_originators(): {duration.total_seconds() * 1000:.2f} ms")
+
+        start = datetime.datetime.now()
+        notifications = self.recorder.select_notifications(
+            notification_ids[0], num_events + 1, topics=[self.topic]
+        )
+        found = [
+            n.originator_id
+            for n in notifications
+            if json.loads(n.state)["email"] == email
+        ]
+        duration = datetime.datetime.now() - start
+        self.assertEqual(found, [stored_events[-1].originator_id])
+        print(f"scan: {duration.total_seconds() * 1000:.2f} ms")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import tracemalloc
+from typing import List
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import DcbFactory, Factory
+from eventsourcing_umadb.interning import StringInterner
+from eventsourcing_umadb.recorders import (
+    UmaDbApplicationRecorder,
+    UmaDbDcbRecorder,
+    UmaDbDcbSubscription,
+)
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestStringInterner(TestCase):
+    def test_intern(self) -> None:
+        interner = StringInterner(max_size=2)
+        a = "".join(["tag", "-a"])
+        a2 = "".join(["tag", "-", "a"])
+        self.assertIsNot(a, a2)
+        self.assertIs(interner.intern(a), a)
+        self.assertIs(interner.intern(a2), a)
+        self.assertEqual(interner.intern_all(["x", a2]), ["x", a])
+        self.assertEqual(len(interner), 2)
+
+        # Forgets everything when full.
+        interner.intern("y")
+        self.assertEqual(len(interner), 1)
+        self.assertIs(interner.intern(a2), a2)
+
+
+class TestInterningRecorders(TestCase):
+    def setUp(self) -> None:
+        self.client = Client(DEFAULT_LOCAL_UMADB_URI)
+
+    def append_dcb_events(self, recorder: UmaDbDcbRecorder, tag: str, n: int) -> int:
+        return recorder.append(
+            [
+                DcbEvent(
+                    type="TrickAdded",
+                    data=b"",
+                    tags=[tag, "school:1"],
+                    uuid=uuid4(),
+                    metadata={},
+                )
+                for _ in range(n)
+            ]
+        )
+
+    def test_dcb_read_and_subscription(self) -> None:
+        recorder = UmaDbDcbRecorder(self.client, string_interner=StringInterner())
+        tag = f"dog:{uuid4()}"
+        self.append_dcb_events(recorder, tag, 3)
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        a, b, c = recorder.read(query)
+        self.assertIs(a.event.type, b.event.type)
+        self.assertIs(a.event.tags[0], c.event.tags[0])
+        self.assertIs(a.event.tags[1], b.event.tags[1])
+        self.assertIsNot(a.event.tags, b.event.tags)
+
+        subscription = recorder.subscribe(query)
+        assert isinstance(subscription, UmaDbDcbSubscription)
+        first = next(subscription)
+        rest = subscription.next_batch()
+        subscription.stop()
+        self.assertIs(first.event.type, a.event.type)
+        self.assertIs(rest[-1].event.tags[0], a.event.tags[0])
+
+    def test_notifications(self) -> None:
+        recorder = UmaDbApplicationRecorder(
+            self.client, string_interner=StringInterner()
+        )
+        originator_id = str(uuid4())
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=i,
+                    topic="topic1",
+                    state=b"",
+                )
+                for i in range(2)
+            ]
+        )
+        assert notification_ids is not None
+        n1, n2 = recorder.select_notifications(notification_ids[0], 2)
+        self.assertIs(n1.originator_id, n2.originator_id)
+        self.assertIs(n1.topic, n2.topic)
+        s1, s2 = recorder.select_events(originator_id)
+        self.assertIs(s1.originator_id, n1.originator_id)
+        self.assertIs(s1.topic, s2.topic)
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI,
+                Factory.UMADB_INTERN_STRINGS: "y",
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            self.assertIsInstance(recorder.string_interner, StringInterner)
+        with DcbFactory(env) as dcb_factory:
+            dcb_recorder = dcb_factory.dcb_recorder()
+            assert isinstance(dcb_recorder, UmaDbDcbRecorder)
+            self.assertIs(dcb_recorder.string_interner, dcb_factory.string_interner)
+
+    def test_benchmark(self) -> None:
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 10000
+        tag = f"dog:{uuid4()}"
+        self.append_dcb_events(UmaDbDcbRecorder(self.client), tag, num_events)
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        print()
+        for name, interner in [("plain", None), ("interned", StringInterner())]:
+            recorder = UmaDbDcbRecorder(self.client, string_interner=interner)
+            tracemalloc.start()
+            start = datetime.datetime.now()
+            retained: List[object] = list(recorder.read(query))
+            duration = datetime.datetime.now() - start
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(len(retained), num_events)
+            print(
+                f"read {name}: {num_events / duration.total_seconds():.0f} events/s,"
+                f" retained {size / num_events:.0f} bytes/event"
+            )
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from typing import List
+from unittest import TestCase
+
+from eventsourcing.persistence import IntegrityError
+from eventsourcing.utils import Environment
+
+from eventsourcing_umadb.factory import DcbFactory, Factory
+from eventsourcing_umadb.load import (
+    LatencyHistogram,
+    LiveSubscription,
+    LoadGenerator,
+    LoadInterval,
+    LoadReport,
+    Operation,
+    aggregate_save,
+    catch_up_read,
+    dcb_append,
+    sent_at_metadata,
+)
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestLatencyHistogram(TestCase):
+    def test_percentiles(self) -> None:
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(99), 0.0)
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.5 * 0.03)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.99 * 0.03)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertEqual(set(histogram.percentiles()), {"p50", "p95", "p99", "p99.9"})
+
+        other = LatencyHistogram()
+        other.record(5.0)
+        histogram.merge(other)
+        self.assertEqual(histogram.count, 1001)
+        self.assertEqual(histogram.max, 5.0)
+
+
+class TestLoadReport(TestCase):
+    def interval(self, start: float, count: int, latency: float) -> LoadInterval:
+        interval = LoadInterval(start=start, duration=1.0)
+        for _ in range(count):
+            interval.histogram("op").record(latency)
+        return interval
+
+    def test_degraded(self) -> None:
+        steady = LoadReport([self.interval(i, 100, 0.001) for i in range(6)])
+        self.assertEqual(steady.degraded(), [])
+        self.assertEqual(steady.throughput("op"), 100)
+
+        slower = LoadReport(
+            [self.interval(i, 100 if i < 3 else 50, 0.001) for i in range(6)]
+        )
+        self.assertEqual(slower.degraded(), ["op"])
+
+        later = LoadReport(
+            [self.interval(i, 100, 0.001 if i < 3 else 0.01) for i in range(6)]
+        )
+        self.assertEqual(later.degraded(), ["op"])
+
+        # Too short to compare.
+        self.assertEqual(LoadReport(slower.intervals[2:4]).degraded(), [])
+
+
+class TestLoadGenerator(TestCase):
+    def test_rates_and_outcomes(self) -> None:
+        calls: List[None] = []
+
+        def call() -> None:
+            calls.append(None)
+            if len(calls) % 10 == 0:
+                raise IntegrityError()
+            if len(calls) % 25 == 0:
+                raise ValueError()
+
+        generator = LoadGenerator([Operation("op", rate=100, call=call)], interval=0.25)
+        intervals: List[LoadInterval] = []
+        report = generator.run(1.0, intervals.append)
+        self.assertEqual(len(report.intervals), 4)
+        self.assertEqual(len(intervals), 4)
+        self.assertAlmostEqual(len(calls), 100, delta=20)
+        self.assertGreater(report.count("op", "conflicts"), 5)
+        self.assertGreater(report.count("op", "errors"), 1)
+        self.assertAlmostEqual(report.throughput("op"), 90, delta=20)
+
+    def test_latency_includes_delay_of_slow_calls(self) -> None:
+        generator = LoadGenerator(
+            [Operation("op", rate=100, call=lambda: time.sleep(0.05), concurrency=1)]
+        )
+        report = generator.run(0.5)
+        # Calls are due every 10ms, but only one can start every 50ms.
+        self.assertGreater(report.histogram("op").percentile(99), 0.2)
+
+
+class TestLoadAgainstUmaDb(TestCase):
+    def setUp(self) -> None:
+        env = Environment(env={Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI})
+        self.factory = Factory(env)
+        self.dcb_factory = DcbFactory(env)
+
+    def tearDown(self) -> None:
+        self.factory.close()
+        self.dcb_factory.close()
+
+    def run_load(self, duration: float, rate: float) -> LoadReport:
+        recorder = self.factory.application_recorder()
+        dcb_recorder = self.dcb_factory.dcb_recorder()
+        generator = LoadGenerator(
+            [
+                Operation("aggregate-save", rate, aggregate_save(recorder, 5, 0.2)),
+                Operation("dcb-append", rate, dcb_append(dcb_recorder, 2, 0.5, 0.2)),
+                Operation("catch-up-read", rate / 10, catch_up_read(dcb_recorder)),
+            ],
+            [
+                LiveSubscription(
+                    "subscription",
+                    lambda: dcb_recorder.subscribe(after=dcb_recorder.head()),
+                    sent_at_metadata,
+                )
+            ],
+            interval=duration / 6,
+        )
+        return generator.run(duration)
+
+    def test_mixed_workload(self) -> None:
+        report = self.run_load(1.5, 100)
+        self.assertEqual(
+            set(report.names),
+            {"aggregate-save", "dcb-append", "catch-up-read", "subscription"},
+        )
+        for name in report.names:
+            self.assertEqual(report.count(name, "errors"), 0, name)
+        self.assertGreater(report.count("aggregate-save", "conflicts"), 0)
+        self.assertGreater(report.count("dcb-append", "conflicts"), 0)
+        self.assertGreater(report.histogram("subscription").count, 100)
+
+    def test_benchmark(self) -> None:
+        duration = float(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 3
+        report = self.run_load(duration, 200)
+        print()
+        print(report.summary())
+        print(f"degraded: {report.degraded()}")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+from typing import List, Tuple
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.persistence import StoredEvent
+from umadb import Client
+
+from eventsourcing_umadb.paging import (
+    AdaptiveNotificationReader,
+    AdaptivePageSize,
+    notification_size,
+)
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestAdaptivePageSize(TestCase):
+    def test_grows_for_small_events(self) -> None:
+        page_size = AdaptivePageSize(target_bytes=100_000, initial_limit=10)
+        self.assertEqual(page_size.observe(10, 1000, 0.001), 40)
+        self.assertEqual(page_size.observe(40, 4000, 0.004), 160)
+        self.assertEqual(page_size.observe(160, 16000, 0.016), 640)
+        self.assertEqual(page_size.observe(640, 64000, 0.064), 1000)
+        # A short page doesn't grow the limit.
+        self.assertEqual(page_size.observe(5, 500, 0.0005), 1000)
+        # Nothing observed.
+        self.assertEqual(page_size.observe(0, 0, 0.001), 1000)
+
+    def test_shrinks_for_large_or_slow_events(self) -> None:
+        page_size = AdaptivePageSize(target_bytes=1_000_000, smoothing=1.0)
+        self.assertEqual(page_size.observe(10, 5_000_000, 0.01), 2)
+        page_size.limit = 100
+        self.assertEqual(page_size.observe(100, 1000, 1.0), 50)
+        self.assertEqual(page_size.observe(50, 500, 0.2), 25)
+        page_size.limit = 1
+        self.assertEqual(page_size.observe(1, 10_000_000, 0.01), 1)
+
+    def test_limits(self) -> None:
+        with self.assertRaises(ValueError):
+            AdaptivePageSize(initial_limit=0)
+        with self.assertRaises(ValueError):
+            AdaptivePageSize(initial_limit=10, max_limit=5)
+
+
+class TestAdaptiveNotificationReader(TestCase):
+    def setUp(self) -> None:
+        self.recorder = UmaDbApplicationRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+
+    def insert(self, num_events: int, state_size: int) -> Tuple[str, List[int]]:
+        topic = f"topic-{uuid4()}"
+        notification_ids: List[int] = []
+        batch_size = max(1, 500_000 // (state_size + 300))
+        for i in range(0, num_events, batch_size):
+            ids = self.recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=str(uuid4()),
+                        originator_version=0,
+                        topic=topic,
+                        state=os.urandom(state_size),
+                    )
+                    for _ in range(min(batch_size, num_events - i))
+                ]
+            )
+            assert ids is not None
+            notification_ids.extend(ids)
+        return topic, notification_ids
+
+    def test_reads_all_in_pages(self) -> None:
+        topic, notification_ids = self.insert(1000, 10)
+        reader = AdaptiveNotificationReader(
+            self.recorder, AdaptivePageSize(target_seconds=10.0)
+        )
+        pages = list(reader.pages(topics=[topic]))
+        self.assertEqual([n.id for page in pages for n in page], notification_ids)
+        self.assertEqual([len(page) for page in pages[:3]], [10, 40, 160])
+
+        # From a start to a stop.
+        start, stop = notification_ids[100], notification_ids[899]
+        notifications = list(
+            AdaptiveNotificationReader(self.recorder).read(
+                start, stop, [topic], inclusive_of_start=False
+            )
+        )
+        self.assertEqual([n.id for n in notifications], notification_ids[101:900])
+
+    def test_large_events_have_small_pages(self) -> None:
+        topic, notification_ids = self.insert(12, 200_000)
+        reader = AdaptiveNotificationReader(
+            self.recorder, AdaptivePageSize(target_bytes=500_000)
+        )
+        pages = list(reader.pages(topics=[topic]))
+        self.assertEqual([n.id for page in pages for n in page], notification_ids)
+        # Only the first page is larger than the target.
+        for page in pages[1:]:
+            self.assertLessEqual(
+                sum(notification_size(n) for n in page), 500_000 + 1000
+            )
+
+    def test_benchmark(self) -> None:
+        num_iters = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1))
+        print()
+        for num_events, state_size in [(20000 * num_iters, 10), (30, 300_000)]:
+            topic, _ = self.insert(num_events, state_size)
+            for name, page_size in [
+                ("limit 10", AdaptivePageSize(1 << 40, 1e6, 10, 10, 10)),
+                ("limit 1000", AdaptivePageSize(1 << 40, 1e6, 1000, 1000, 1000)),
+                ("adaptive", AdaptivePageSize()),
+            ]:
+                reader = AdaptiveNotificationReader(self.recorder, page_size)
+                start = datetime.datetime.now()
+                num_pages = 0
+                max_page_bytes = 0
+                for page in reader.pages(topics=[topic]):
+                    num_pages += 1
+                    page_bytes = sum(notification_size(n) for n in page)
+                    max_page_bytes = max(max_page_bytes, page_bytes)
+                duration = datetime.datetime.now() - start
+                print(
+                    f"{state_size} byte events, {name}:"
+                    f" {num_events / duration.total_seconds():.0f} events/s,"
+                    f" {num_pages} pages,"
+                    f" max page {max_page_bytes / 1e6:.1f} MB"
+                )
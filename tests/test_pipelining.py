@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Sequence
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbQueryItem,
+)
+from eventsourcing.persistence import IntegrityError, StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import DcbFactory, Factory
+from eventsourcing_umadb.pipelining import AppendPipeline
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbDcbRecorder
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestAppendPipeline(TestCase):
+    def setUp(self) -> None:
+        self.pipeline = AppendPipeline(max_in_flight=4)
+        self.calls: List[str] = []
+
+    def tearDown(self) -> None:
+        self.pipeline.close()
+
+    def append(self, name: str, delay: float = 0.0, fail: bool = False) -> str:
+        time.sleep(delay)
+        if fail:
+            raise IntegrityError(name)
+        self.calls.append(name)
+        return name
+
+    def test_dependent_appends_are_ordered(self) -> None:
+        a = self.pipeline.submit({"x"}, lambda: self.append("a", delay=0.1))
+        b = self.pipeline.submit({"y"}, lambda: self.append("b"))
+        c = self.pipeline.submit({"x", "z"}, lambda: self.append("c"))
+        self.assertEqual([a.result(), b.result(), c.result()], ["a", "b", "c"])
+        # Independent append didn't wait.
+        self.assertEqual(self.calls, ["b", "a", "c"])
+
+    def test_appends_without_keys_wait_for_all(self) -> None:
+        self.pipeline.submit({"x"}, lambda: self.append("a", delay=0.1))
+        self.pipeline.submit(None, lambda: self.append("b"))
+        self.pipeline.submit({"y"}, lambda: self.append("c"))
+        self.pipeline.join()
+        self.assertEqual(self.calls, ["a", "b", "c"])
+
+    def test_failures(self) -> None:
+        a = self.pipeline.submit({"x"}, lambda: self.append("a", fail=True))
+        b = self.pipeline.submit({"x"}, lambda: self.append("b"))
+        c = self.pipeline.submit({"y"}, lambda: self.append("c"))
+        with self.assertRaises(IntegrityError):
+            a.result()
+        with self.assertRaises(IntegrityError):
+            b.result()
+        self.assertEqual(c.result(), "c")
+        self.assertEqual(self.calls, ["c"])
+
+    def test_max_in_flight(self) -> None:
+        lock = threading.Lock()
+        running = [0]
+        max_running = [0]
+
+        def append() -> None:
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        futures = [self.pipeline.submit({str(i)}, append) for i in range(20)]
+        for future in futures:
+            future.result()
+        self.assertEqual(max_running[0], 4)
+
+        with self.assertRaises(ValueError):
+            AppendPipeline(max_in_flight=0)
+
+
+class TestPipelinedRecorders(TestCase):
+    def setUp(self) -> None:
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+
+    def test_insert_events_nowait(self) -> None:
+        recorder = UmaDbApplicationRecorder(self.umadb)
+        originator_ids = [str(uuid4()) for _ in range(5)]
+        futures: List[Future[Optional[Sequence[int]]]] = []
+        for version in range(5):
+            for originator_id in originator_ids:
+                futures.append(
+                    recorder.insert_events_nowait(
+                        [
+                            StoredEvent(
+                                originator_id=originator_id,
+                                originator_version=version,
+                                topic="topic1",
+                                state=b"state",
+                            )
+                        ]
+                    )
+                )
+        notification_ids = [f.result() for f in futures]
+        for originator_id in originator_ids:
+            stored_events = recorder.select_events(originator_id)
+            self.assertEqual(
+                [s.originator_version for s in stored_events], [0, 1, 2, 3, 4]
+            )
+        ids = [i[0] for i in notification_ids if i is not None]
+        self.assertEqual(len(set(ids)), 25)
+
+        # Conflicts are raised by the future.
+        future = recorder.insert_events_nowait(
+            [
+                StoredEvent(
+                    originator_id=originator_ids[0],
+                    originator_version=4,
+                    topic="topic1",
+                    state=b"state",
+                    uuid=uuid4(),
+                )
+            ]
+        )
+        with self.assertRaises(IntegrityError):
+            future.result()
+
+    def test_append_async(self) -> None:
+        recorder = UmaDbDcbRecorder(self.umadb)
+        tag = f"tag-{uuid4()}"
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+
+        def event() -> DcbEvent:
+            return DcbEvent(
+                type="type1", data=b"data", tags=[tag], uuid=uuid4(), metadata={}
+            )
+
+        # Each append is conditional on the one before.
+        head = recorder.head()
+        first = recorder.append_async(
+            [event()], DcbAppendCondition(fail_if_events_match=query, after=head)
+        )
+        second = recorder.append_async([event()])
+        self.assertLess(first.result(), second.result())
+
+        # Conflict, because second was appended after head.
+        conflict = recorder.append_async(
+            [event()], DcbAppendCondition(fail_if_events_match=query, after=head)
+        )
+        with self.assertRaises(IntegrityError):
+            conflict.result()
+        self.assertEqual(len(list(recorder.read(query))), 2)
+
+    def test_append_keys(self) -> None:
+        event = DcbEvent(type="t", data=b"", tags=["a", "b"], uuid=uuid4(), metadata={})
+        self.assertEqual(UmaDbDcbRecorder._append_keys([event], None), {"a", "b"})
+        condition = DcbAppendCondition(
+            fail_if_events_match=DcbQuery(
+                items=[DcbQueryItem(tags=["c"]), DcbQueryItem(types=["u"], tags=["d"])]
+            )
+        )
+        self.assertEqual(UmaDbDcbRecorder._append_keys([], condition), {"c", "d"})
+        condition = DcbAppendCondition(
+            fail_if_events_match=DcbQuery(items=[DcbQueryItem(types=["t"])])
+        )
+        self.assertIsNone(UmaDbDcbRecorder._append_keys([event], condition))
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI,
+                Factory.UMADB_MAX_APPENDS_IN_FLIGHT: "3",
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            self.assertEqual(recorder.append_pipeline.max_in_flight, 3)
+            future = recorder.insert_events_nowait(
+                [
+                    StoredEvent(
+                        originator_id=str(uuid4()),
+                        originator_version=0,
+                        topic="topic1",
+                        state=b"state",
+                    )
+                ]
+            )
+        # Appends in flight are finished, and pipelines are closed.
+        self.assertIsNotNone(future.result(timeout=0))
+        with self.assertRaises(RuntimeError):
+            recorder.insert_events_nowait([]).result()
+        with DcbFactory(env) as dcb_factory:
+            dcb_recorder = dcb_factory.dcb_recorder()
+            assert isinstance(dcb_recorder, UmaDbDcbRecorder)
+            self.assertEqual(dcb_recorder.append_pipeline.max_in_flight, 3)
+        with self.assertRaises(RuntimeError):
+            dcb_recorder.append_async([]).result()
+
+    def test_benchmark(self) -> None:
+        num_appends = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 500
+
+        def events() -> List[DcbEvent]:
+            return [
+                DcbEvent(
+                    type="type1",
+                    data=b"data",
+                    tags=[f"tag-{uuid4()}"],
+                    uuid=uuid4(),
+                    metadata={},
+                )
+                for _ in range(num_appends)
+            ]
+
+        print()
+        recorder = UmaDbDcbRecorder(self.umadb)
+        start = datetime.datetime.now()
+        for e in events():
+            recorder.append([e])
+        duration = datetime.datetime.now() - start
+        print(f"append: {num_appends / duration.total_seconds():.0f} appends/s")
+
+        for max_in_flight in (4, 16, 64):
+            recorder = UmaDbDcbRecorder(self.umadb, max_appends_in_flight=max_in_flight)
+            start = datetime.datetime.now()
+            futures = [recorder.append_async([e]) for e in events()]
+            for future in futures:
+                future.result()
+            duration = datetime.datetime.now() - start
+            print(
+                f"append_async ({max_in_flight} in flight): "
+                f"{num_appends / duration.total_seconds():.0f} appends/s"
+            )
+            recorder.append_pipeline.close()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+from typing import Dict, List, Sequence
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem, DcbSequencedEvent
+from eventsourcing.persistence import StoredEvent
+from umadb import Client, Event, TrackingInfo
+
+from eventsourcing_umadb.projections import (
+    CHECKPOINT_POSITION_KEY,
+    CHECKPOINT_TYPE,
+    PartitionedProjectionRunner,
+    ProjectionProgress,
+    checkpoint_tag,
+    tracking_source,
+)
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbDcbRecorder
+from eventsourcing_umadb.replay import ReplayHandler
+from tests.test_sharding import WithLocalUmaDbServers
+
+
+class EntityVersions(ReplayHandler[Dict[str, List[int]]]):
+    def __init__(self, partition: int = 0, num_partitions: int = 1) -> None:
+        super().__init__(partition, num_partitions)
+        self.versions: Dict[str, List[int]] = {}
+
+    def process_events(self, events: Sequence[DcbSequencedEvent]) -> None:
+        for sequenced in events:
+            entity = sequenced.event.tags[0]
+            self.versions.setdefault(entity, []).append(int(sequenced.event.data))
+
+    def result(self) -> Dict[str, List[int]]:
+        return self.versions
+
+    def get_state(self) -> bytes | None:
+        return json.dumps(self.versions).encode()
+
+    def set_state(self, state: bytes) -> None:
+        self.versions = json.loads(state)
+
+
+class StatelessEntityVersions(EntityVersions):
+    def get_state(self) -> bytes | None:
+        return None
+
+
+class FailingHandler(EntityVersions):
+    def process_events(self, events: Sequence[DcbSequencedEvent]) -> None:
+        raise ValueError("Projection failed")
+
+
+class TestPartitionedProjectionRunner(WithLocalUmaDbServers):
+    num_servers = 2
+    first_port = 50111
+
+    def setUp(self) -> None:
+        # Events are projected from the first server, and checkpoints are
+        # recorded in the second.
+        self.recorder = UmaDbDcbRecorder(Client(self.uris[0]))
+        self.run_tag = f"run:{uuid4()}"
+        self.query = DcbQuery(items=[DcbQueryItem(tags=[self.run_tag])])
+
+    def append(self, num_entities: int, versions: range) -> int:
+        return self.recorder.append(
+            [
+                DcbEvent(
+                    type="Changed",
+                    data=str(version).encode(),
+                    tags=[f"entity:{self.run_tag}-{i}", self.run_tag],
+                    uuid=uuid4(),
+                    metadata={},
+                )
+                for version in versions
+                for i in range(num_entities)
+            ]
+        )
+
+    def runner(
+        self,
+        num_partitions: int,
+        handler_class: type[EntityVersions] = EntityVersions,
+        partition_tag_prefix: str = "entity:",
+        with_checkpoints: bool = True,
+    ) -> PartitionedProjectionRunner[Dict[str, List[int]]]:
+        return PartitionedProjectionRunner(
+            self.uris[0],
+            handler_class,
+            num_partitions=num_partitions,
+            name=self.run_tag,
+            partition_tag_prefix=partition_tag_prefix,
+            query=self.query,
+            checkpoint_uri=self.uris[1] if with_checkpoints else None,
+        )
+
+    def test_partitions_preserve_entity_order(self) -> None:
+        position = self.append(num_entities=10, versions=range(3))
+        with self.runner(num_partitions=3) as runner:
+            self.assertTrue(runner.wait_for_position(position, timeout=30))
+            progress = runner.progress()
+            self.assertIsInstance(progress, ProjectionProgress)
+            self.assertEqual(progress.positions, (position,) * 3)
+            self.assertEqual(progress.position, position)
+            self.assertGreaterEqual(progress.head or 0, position)
+            results = runner.stop()
+
+        self.assertEqual(len(results), 3)
+        entities: Dict[str, List[int]] = {}
+        for result in results:
+            self.assertTrue(set(entities).isdisjoint(result))
+            entities.update(result)
+        self.assertEqual(len(entities), 10)
+        for versions in entities.values():
+            self.assertEqual(versions, [0, 1, 2])
+
+        # Positions are tracked with the checkpoints.
+        client = Client(self.uris[1])
+        for partition in range(3):
+            self.assertEqual(
+                client.get_tracking_info(tracking_source(self.run_tag, partition, 3)),
+                position,
+            )
+
+        # Continues after the tracked positions, with the recorded states.
+        position = self.append(num_entities=10, versions=range(3, 4))
+        with self.runner(num_partitions=3) as runner:
+            self.assertTrue(runner.wait_for_position(position, timeout=30))
+            results = runner.stop()
+        self.assertEqual(sum(len(result) for result in results), 10)
+        for result in results:
+            for versions in result.values():
+                self.assertEqual(versions, [0, 1, 2, 3])
+
+    def test_application_log_is_readable_after_restart(self) -> None:
+        recorder = UmaDbApplicationRecorder(Client(self.uris[0]))
+        topic = f"topic-{uuid4()}"
+        self.query = DcbQuery(items=[DcbQueryItem(types=[topic])])
+        originator_ids = [str(uuid4()) for _ in range(5)]
+
+        def insert(version: int) -> int:
+            notification_ids = recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic=topic,
+                        state=str(version).encode(),
+                    )
+                    for originator_id in originator_ids
+                ]
+            )
+            assert notification_ids is not None
+            return notification_ids[-1]
+
+        for version in range(2):
+            position = insert(version)
+            with self.runner(2, partition_tag_prefix="originator:") as runner:
+                self.assertTrue(runner.wait_for_position(position, timeout=30))
+                results = runner.stop()
+
+        # The second run continued with the state of the first.
+        entities: Dict[str, List[int]] = {}
+        for result in results:
+            entities.update(result)
+        self.assertEqual(entities, {f"originator:{i}": [0, 1] for i in originator_ids})
+
+        # Nothing but the application's events were recorded in its log.
+        first = position - 2 * len(originator_ids) + 1
+        notifications = recorder.select_notifications(first, 100)
+        self.assertEqual(len(notifications), 10)
+        self.assertEqual({n.topic for n in notifications}, {topic})
+
+    def test_checkpoint_not_at_tracked_position_is_an_error(self) -> None:
+        self.append(num_entities=1, versions=range(1))
+        source = tracking_source(self.run_tag, 0, 1)
+        client = Client(self.uris[1])
+        client.append(
+            [
+                Event(
+                    event_type=CHECKPOINT_TYPE,
+                    data=b"{}",
+                    tags=[checkpoint_tag(source)],
+                    metadata={CHECKPOINT_POSITION_KEY: "1"},
+                )
+            ],
+            tracking_info=TrackingInfo(source, 1),
+        )
+        client.append([], tracking_info=TrackingInfo(source, 2))
+        with self.runner(num_partitions=1) as runner:
+            with self.assertRaises(RuntimeError):
+                runner.wait_for_position(2, timeout=30)
+            with self.assertRaises(RuntimeError):
+                runner.stop()
+
+    def test_state_needs_checkpoint_database(self) -> None:
+        position = self.append(num_entities=2, versions=range(1))
+        with self.runner(num_partitions=1, with_checkpoints=False) as runner:
+            # The state is recorded when the runner is stopped.
+            self.assertTrue(runner.wait_for_position(position, timeout=30))
+            with self.assertRaises(RuntimeError):
+                runner.stop()
+        with self.assertRaises(ValueError):
+            PartitionedProjectionRunner(
+                self.uris[0],
+                EntityVersions,
+                1,
+                self.run_tag,
+                checkpoint_uri=self.uris[0],
+            )
+
+        # Only the position is tracked for handlers without state.
+        with self.runner(1, StatelessEntityVersions, with_checkpoints=False) as runner:
+            self.assertTrue(runner.wait_for_position(position, timeout=30))
+            runner.stop()
+        self.assertEqual(
+            Client(self.uris[0]).get_tracking_info(tracking_source(self.run_tag, 0, 1)),
+            position,
+        )
+
+    def test_worker_error_is_raised(self) -> None:
+        position = self.append(num_entities=2, versions=range(1))
+        with self.runner(num_partitions=2, handler_class=FailingHandler) as runner:
+            with self.assertRaises(ValueError):
+                runner.wait_for_position(position, timeout=30)
+            with self.assertRaises(ValueError):
+                runner.stop()
+
+    def test_benchmark(self) -> None:
+        num_entities = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 1000
+        print()
+        for num_partitions in (1, 2):
+            self.run_tag = f"run:{uuid4()}"
+            self.query = DcbQuery(items=[DcbQueryItem(tags=[self.run_tag])])
+            position = self.append(num_entities=num_entities, versions=range(5))
+            with self.runner(num_partitions) as runner:
+                runner.wait_for_position(0)
+                start = datetime.datetime.now()
+                self.assertTrue(runner.wait_for_position(position, timeout=60))
+                duration = datetime.datetime.now() - start
+                runner.stop()
+            print(
+                f"{num_partitions} partitions:"
+                f" {num_entities * 5 / duration.total_seconds():.0f} events/s"
+            )
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import random
+from unittest import TestCase
+from uuid import uuid4
+
+import umadb
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbQueryItem,
+)
+from eventsourcing.persistence import IntegrityError
+from umadb import Client
+
+from eventsourcing_umadb.queries import QueryPlanner, normalise_query_items
+from eventsourcing_umadb.recorders import UmaDbDcbRecorder
+from eventsourcing_umadb.replay import matches_query
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestNormaliseQueryItems(TestCase):
+    def test_deduplicates(self) -> None:
+        items = [
+            DcbQueryItem(types=["a"], tags=["x", "y"]),
+            DcbQueryItem(types=["a"], tags=["y", "x"]),
+        ]
+        self.assertEqual(normalise_query_items(items), [(("a",), ("x", "y"))])
+
+    def test_merges_items_with_same_tags(self) -> None:
+        items = [
+            DcbQueryItem(types=["b"], tags=["x"]),
+            DcbQueryItem(types=["a"], tags=["x"]),
+            DcbQueryItem(types=["c"], tags=["y"]),
+        ]
+        self.assertEqual(
+            normalise_query_items(items), [(("a", "b"), ("x",)), (("c",), ("y",))]
+        )
+        items = [
+            DcbQueryItem(types=["b"], tags=["x"]),
+            DcbQueryItem(types=[], tags=["x"]),
+        ]
+        self.assertEqual(normalise_query_items(items), [((), ("x",))])
+
+    def test_drops_subsumed_items(self) -> None:
+        items = [
+            DcbQueryItem(types=["a"], tags=["x", "y"]),
+            DcbQueryItem(types=["a", "b"], tags=["x"]),
+            DcbQueryItem(types=["c"], tags=["x", "z"]),
+        ]
+        self.assertEqual(
+            normalise_query_items(items),
+            [(("a", "b"), ("x",)), (("c",), ("x", "z"))],
+        )
+        items = [
+            DcbQueryItem(types=["a"], tags=["x", "y"]),
+            DcbQueryItem(types=[], tags=["y"]),
+        ]
+        self.assertEqual(normalise_query_items(items), [((), ("y",))])
+        items = [
+            DcbQueryItem(types=["a"], tags=["x"]),
+            DcbQueryItem(types=[], tags=[]),
+        ]
+        self.assertEqual(normalise_query_items(items), [((), ())])
+        self.assertEqual(normalise_query_items([]), [])
+
+    def test_matches_same_events(self) -> None:
+        rng = random.Random(42)
+        types = ["a", "b", "c"]
+        tags = ["w", "x", "y", "z"]
+        events = [
+            DcbEvent(
+                type=t,
+                data=b"",
+                tags=[tag for tag in tags if rng.random() < 0.5],
+                uuid=uuid4(),
+                metadata={},
+            )
+            for t in types
+            for _ in range(20)
+        ]
+        for _ in range(500):
+            items = [
+                DcbQueryItem(
+                    types=rng.sample(types, rng.randint(0, 2)),
+                    tags=rng.sample(tags, rng.randint(0, 3)),
+                )
+                for _ in range(rng.randint(1, 6))
+            ]
+            normalised = DcbQuery(
+                items=[
+                    DcbQueryItem(types=list(types_), tags=list(tags_))
+                    for types_, tags_ in normalise_query_items(items)
+                ]
+            )
+            self.assertLessEqual(len(normalised.items), len(items))
+            for event in events:
+                self.assertEqual(
+                    matches_query(event, DcbQuery(items=items)),
+                    matches_query(event, normalised),
+                )
+
+
+class TestQueryPlanner(TestCase):
+    def test_translate(self) -> None:
+        planner = QueryPlanner(cache_size=2)
+
+        def query(*tags: str) -> DcbQuery:
+            return DcbQuery(items=[DcbQueryItem(tags=[t]) for t in tags])
+
+        translated = planner.translate(query("x", "y"))
+        self.assertIsInstance(translated, umadb.Query)
+        self.assertEqual((planner.hits, planner.misses), (0, 1))
+
+        # Equal queries are translated once.
+        self.assertIs(planner.translate(query("x", "y")), translated)
+        self.assertEqual((planner.hits, planner.misses), (1, 1))
+
+        # Least recently used translations are evicted.
+        planner.translate(query("z"))
+        planner.translate(query("x", "y"))
+        planner.translate(query("w"))
+        self.assertEqual((planner.hits, planner.misses), (2, 3))
+        self.assertIs(planner.translate(query("x", "y")), translated)
+        planner.translate(query("z"))
+        self.assertEqual((planner.hits, planner.misses), (3, 4))
+
+
+class TestRecorderWithQueryPlanner(TestCase):
+    def setUp(self) -> None:
+        self.recorder = UmaDbDcbRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+
+    def test_conditions_and_reads(self) -> None:
+        tag1 = f"tag-{uuid4()}"
+        tag2 = f"tag-{uuid4()}"
+        query = DcbQuery(
+            items=[
+                DcbQueryItem(types=["type1"], tags=[tag1, tag2]),
+                DcbQueryItem(types=["type1"], tags=[tag1]),
+                DcbQueryItem(types=["type2"], tags=[tag1]),
+                DcbQueryItem(types=["type1"], tags=[tag1]),
+            ]
+        )
+        head = self.recorder.head()
+        self.recorder.append(
+            [DcbEvent(type="type2", data=b"", tags=[tag1], uuid=uuid4(), metadata={})],
+            DcbAppendCondition(fail_if_events_match=query, after=head),
+        )
+        with self.assertRaises(IntegrityError):
+            self.recorder.append(
+                [
+                    DcbEvent(
+                        type="type1", data=b"", tags=[tag1], uuid=uuid4(), metadata={}
+                    )
+                ],
+                DcbAppendCondition(fail_if_events_match=query, after=head),
+            )
+        self.assertEqual(len(list(self.recorder.read(query))), 1)
+        with self.recorder.subscribe(query, after=head) as subscription:
+            self.assertEqual(next(subscription).event.type, "type2")
+
+    def test_benchmark(self) -> None:
+        num_appends = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 300
+        umadb_client = self.recorder.umadb
+        # A condition composed from several overlapping decision models.
+        tags = [f"tag-{uuid4()}" for _ in range(5)]
+        items = [
+            DcbQueryItem(types=[f"type{i % 3}"], tags=tags[: 1 + i % 5])
+            for i in range(30)
+        ]
+        query = DcbQuery(items=items)
+        planner = QueryPlanner()
+
+        print()
+        print(
+            f"{len(items)} items normalised to "
+            f"{len(normalise_query_items(items))} items"
+        )
+
+        start = datetime.datetime.now()
+        for _ in range(num_appends):
+            umadb.Query(
+                items=[umadb.QueryItem(types=i.types, tags=i.tags) for i in items]
+            )
+        duration = datetime.datetime.now() - start
+        print(
+            f"translate without planner: "
+            f"{duration.total_seconds() / num_appends * 1e6:.1f} us/query"
+        )
+        start = datetime.datetime.now()
+        for _ in range(num_appends):
+            planner.translate(DcbQuery(items=list(items)))
+        duration = datetime.datetime.now() - start
+        print(
+            f"translate with planner (cached): "
+            f"{duration.total_seconds() / num_appends * 1e6:.1f} us/query"
+        )
+
+        for name, translated in [
+            (
+                "without planner",
+                umadb.Query(
+                    items=[umadb.QueryItem(types=i.types, tags=i.tags) for i in items]
+                ),
+            ),
+            ("with planner", planner.translate(query)),
+        ]:
+            start = datetime.datetime.now()
+            for _ in range(num_appends):
+                umadb_client.append(
+                    [
+                        umadb.Event(
+                            event_type="other",
+                            data=b"",
+                            tags=[f"other-{uuid4()}"],
+                            uuid=uuid4(),
+                        )
+                    ],
+                    condition=umadb.AppendCondition(
+                        fail_if_events_match=translated, after=None
+                    ),
+                )
+            duration = datetime.datetime.now() - start
+            print(
+                f"conditional append {name}: "
+                f"{num_appends / duration.total_seconds():.0f} appends/s"
+            )
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
+import os
 import threading
 from datetime import datetime
-from typing import ClassVar
+from timeit import timeit
+from typing import Any, ClassVar, List, cast
 from unittest import TestCase
 from uuid import uuid4
 
@@ -402,6 +404,166 @@ class TestUmaDbApplicationRecorder(ApplicationRecorderTestCase, WithUmaDb):
         self.assertEqual(len(notifications), 1, len(notifications))
         self.assertEqual(notifications[0].id, start + 2)
 
+    def test_select_notifications_desc(self) -> None:
+        recorder = cast(UmaDbApplicationRecorder, self.create_recorder())
+        topic = f"topic-{uuid4()}"
+
+        # Check there aren't any.
+        self.assertEqual(
+            len(recorder.select_notifications(None, 10, topics=[topic], desc=True)),
+            0,
+        )
+
+        # Write five stored events.
+        originator_id = str(uuid4())
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=self.INITIAL_VERSION + i,
+                    topic=topic,
+                    state=f"state{i}".encode(),
+                )
+                for i in range(5)
+            ]
+        )
+        assert notification_ids is not None
+        n1, n2, n3, n4, n5 = notification_ids
+
+        # Select latest, newest first.
+        notifications = recorder.select_notifications(
+            None, 2, topics=[topic], desc=True
+        )
+        self.assertEqual([n.id for n in notifications], [n5, n4])
+        self.assertEqual(notifications[0].state, b"state4")
+        self.assertEqual(notifications[0].originator_version, self.INITIAL_VERSION + 4)
+
+        # Page backwards using the last ID as a cursor.
+        notifications = recorder.select_notifications(
+            n4, 2, topics=[topic], inclusive_of_start=False, desc=True
+        )
+        self.assertEqual([n.id for n in notifications], [n3, n2])
+        notifications = recorder.select_notifications(
+            n2, 2, topics=[topic], inclusive_of_start=False, desc=True
+        )
+        self.assertEqual([n.id for n in notifications], [n1])
+
+        # Start is inclusive by default.
+        notifications = recorder.select_notifications(n3, 2, topics=[topic], desc=True)
+        self.assertEqual([n.id for n in notifications], [n3, n2])
+
+        # Stop is the lower bound.
+        notifications = recorder.select_notifications(
+            None, 10, stop=n3, topics=[topic], desc=True
+        )
+        self.assertEqual([n.id for n in notifications], [n5, n4, n3])
+
+        # Nothing before the first position.
+        notifications = recorder.select_notifications(
+            1, 10, inclusive_of_start=False, desc=True
+        )
+        self.assertEqual(len(notifications), 0)
+
+    def test_select_events_as_of_position(self) -> None:
+        recorder = cast(UmaDbApplicationRecorder, self.create_recorder())
+        originator_id = str(uuid4())
+        other_id = str(uuid4())
+
+        # Write events of two aggregates, interleaved.
+        notification_ids = []
+        for i in range(4):
+            ids = recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=_id,
+                        originator_version=self.INITIAL_VERSION + i,
+                        topic="topic1",
+                        state=f"state{i}".encode(),
+                    )
+                    for _id in (originator_id, other_id)
+                ]
+            )
+            assert ids is not None
+            notification_ids.append(ids[0])
+        n1, n2, n3, n4 = notification_ids
+
+        def versions(**kwargs: Any) -> List[int]:
+            return [
+                s.originator_version - self.INITIAL_VERSION
+                for s in recorder.select_events(originator_id, **kwargs)
+            ]
+
+        self.assertEqual(versions(as_of_position=n1 - 1), [])
+        self.assertEqual(versions(as_of_position=n1), [0])
+        self.assertEqual(versions(as_of_position=n3), [0, 1, 2])
+        self.assertEqual(versions(as_of_position=n3 + 1), [0, 1, 2])
+        self.assertEqual(versions(as_of_position=n4), [0, 1, 2, 3])
+
+        # Combined with the other arguments.
+        self.assertEqual(versions(as_of_position=n3, desc=True), [2, 1, 0])
+        self.assertEqual(versions(as_of_position=n3, desc=True, limit=1), [2])
+        self.assertEqual(versions(as_of_position=n3, limit=2), [0, 1])
+        self.assertEqual(versions(as_of_position=n2, limit=5), [0, 1])
+        self.assertEqual(versions(as_of_position=n1 - 1, limit=5), [])
+        v = self.INITIAL_VERSION
+        self.assertEqual(versions(as_of_position=n3, gt=v), [1, 2])
+        self.assertEqual(versions(as_of_position=n3, gt=v, desc=True), [2, 1])
+        self.assertEqual(versions(as_of_position=n4, lte=v + 1), [0, 1])
+        self.assertEqual(
+            versions(as_of_position=n4, lte=v + 2, desc=True, limit=2), [2, 1]
+        )
+        self.assertEqual(versions(as_of_position=n4, gt=v, lte=v + 2), [1, 2])
+        self.assertEqual(versions(as_of_position=n4, gt=v, limit=2), [1, 2])
+        self.assertEqual(versions(as_of_position=n2, gt=v, limit=2), [1])
+
+    def test_benchmark_select_events_as_of_position(self) -> None:
+        recorder = cast(UmaDbApplicationRecorder, self.create_recorder())
+        originator_id = str(uuid4())
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 2000
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=i,
+                    topic="topic1",
+                    state=b"state",
+                )
+                for i in range(num_events)
+            ]
+        )
+        assert notification_ids is not None
+        as_of = notification_ids[num_events // 10]
+        number = 20
+
+        def filtered() -> List[StoredEvent]:
+            return [
+                s
+                for s, notification_id in zip(
+                    recorder.select_events(originator_id), notification_ids
+                )
+                if notification_id <= as_of
+            ]
+
+        def bounded() -> List[StoredEvent]:
+            return recorder.select_events(originator_id, as_of_position=as_of)
+
+        def bounded_limited() -> List[StoredEvent]:
+            return recorder.select_events(originator_id, as_of_position=as_of, limit=10)
+
+        self.assertEqual(filtered(), bounded())
+        self.assertEqual(filtered()[:10], bounded_limited())
+        print()
+        for name, select in [
+            ("filtered", filtered),
+            ("as_of_position", bounded),
+            ("as_of_position limit 10", bounded_limited),
+        ]:
+            duration = timeit(select, number=number)
+            print(
+                f"select {len(select())} of {num_events} events {name}:"
+                f" {number / duration:.0f} selects/s"
+            )
+
     def test_concurrent_no_conflicts(self, initial_position: int = 0) -> None:
         super().test_concurrent_no_conflicts(self.umadb.head() or 0)
 
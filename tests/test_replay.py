@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import Counter
+from tempfile import TemporaryDirectory
+from typing import Dict, Sequence
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem, DcbSequencedEvent
+from eventsourcing.dcb.popo import InMemoryDcbRecorder
+from eventsourcing.persistence import StoredEvent
+from umadb import Client, Query, QueryItem
+
+from eventsourcing_umadb.compression import COMPRESSION_METADATA_KEY
+from eventsourcing_umadb.export import ExportReader, export_events
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+from eventsourcing_umadb.replay import (
+    ExportApplicationRecorder,
+    ExportDcbRecorder,
+    ReplayHandler,
+    replay,
+    replay_partitioned,
+    tag_partition,
+)
+from tests.test_compression import ExamplePayloadCompression, make_payload
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class CountVersions(ReplayHandler[Dict[str, int]]):
+    def __init__(self, partition: int = 0, num_partitions: int = 1) -> None:
+        super().__init__(partition, num_partitions)
+        self.versions: Dict[str, int] = {}
+
+    def process_events(self, events: Sequence[DcbSequencedEvent]) -> None:
+        for sequenced in events:
+            originator_tag, version_tag = sequenced.event.tags
+            version = int(version_tag.split(":")[1])
+            # Check events for each originator are processed in order.
+            assert self.versions.get(originator_tag, -1) == version - 1
+            self.versions[originator_tag] = version
+
+    def result(self) -> Dict[str, int]:
+        return self.versions
+
+
+class CollectStates(ReplayHandler[Dict[str, bytes]]):
+    def __init__(self, partition: int = 0, num_partitions: int = 1) -> None:
+        super().__init__(partition, num_partitions)
+        self.states: Dict[str, bytes] = {}
+
+    def process_events(self, events: Sequence[DcbSequencedEvent]) -> None:
+        for sequenced in events:
+            assert COMPRESSION_METADATA_KEY not in sequenced.event.metadata
+            self.states[sequenced.event.tags[0]] = sequenced.event.data
+
+    def result(self) -> Dict[str, bytes]:
+        return self.states
+
+
+class TestReplay(TestCase):
+    def setUp(self) -> None:
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+        self.tempdir = TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "export.bin")
+        self.topic = f"topic-{uuid4()}"
+        self.originator_ids = [str(uuid4()) for _ in range(8)]
+        recorder = UmaDbApplicationRecorder(umadb=self.umadb)
+        for version in range(5):
+            recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic=self.topic,
+                        state=f"state{version}".encode(),
+                    )
+                    for originator_id in self.originator_ids
+                ]
+            )
+        export_events(
+            self.umadb,
+            self.path,
+            query=Query(items=[QueryItem(types=[self.topic])]),
+            chunk_size=7,
+        )
+        self.reader = ExportReader(self.path)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+        self.tempdir.cleanup()
+
+    def test_dcb_recorder(self) -> None:
+        recorder = ExportDcbRecorder(self.reader)
+        events = list(recorder.read())
+        self.assertEqual(len(events), 40)
+        self.assertEqual(recorder.head(), events[-1].position)
+
+        tag = f"originator:{self.originator_ids[0]}"
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        events = list(recorder.read(query, after=events[10].position, limit=2))
+        self.assertEqual(len(events), 2)
+        self.assertTrue(all(tag in e.event.tags for e in events))
+
+        with self.assertRaises(NotImplementedError):
+            recorder.append([])
+
+        # Subscriptions end after the last event.
+        with recorder.subscribe(query) as subscription:
+            self.assertEqual(len(list(subscription)), 5)
+
+        subscription = recorder.subscribe()
+        next(subscription)
+        subscription.stop()
+        with self.assertRaises(StopIteration):
+            next(subscription)
+
+    def test_application_recorder(self) -> None:
+        recorder = ExportApplicationRecorder(self.reader)
+        max_id = recorder.max_notification_id()
+        assert max_id is not None
+
+        notifications = recorder.select_notifications(None, 3)
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(notifications[0].originator_id, self.originator_ids[0])
+        self.assertEqual(notifications[0].originator_version, 0)
+        self.assertEqual(notifications[0].state, b"state0")
+        self.assertEqual(notifications[1].originator_id, self.originator_ids[1])
+
+        notifications = recorder.select_notifications(
+            max_id - 1, 10, inclusive_of_start=False
+        )
+        self.assertEqual([n.id for n in notifications], [max_id])
+
+        stored_events = recorder.select_events(self.originator_ids[3], gt=1, desc=True)
+        self.assertEqual([s.originator_version for s in stored_events], [4, 3, 2])
+        # Events are in rounds of one version of each originator.
+        notification_ids = [n.id for n in recorder.select_notifications(None, 12)]
+        for as_of, versions in [(10, [0]), (11, [0]), (12, [0, 1])]:
+            stored_events = recorder.select_events(
+                self.originator_ids[3], as_of_position=notification_ids[as_of - 1]
+            )
+            self.assertEqual([s.originator_version for s in stored_events], versions)
+
+        with recorder.subscribe(gt=max_id - 2, topics=[self.topic]) as subscription:
+            self.assertEqual([n.id for n in subscription], [max_id - 1, max_id])
+
+    def test_replay(self) -> None:
+        # From an export file.
+        result = replay(ExportDcbRecorder(self.reader), CountVersions(), batch_size=3)
+        self.assertEqual(len(result), 8)
+        self.assertEqual(set(result.values()), {4})
+
+        # From the in-memory recorder.
+        recorder = InMemoryDcbRecorder()
+        recorder.append(
+            [
+                DcbEvent(
+                    type="type1",
+                    data=b"",
+                    tags=["originator:1", f"originator-1-version:{i}"],
+                    uuid=uuid4(),
+                    metadata={},
+                )
+                for i in range(4)
+            ]
+        )
+        self.assertEqual(replay(recorder, CountVersions()), {"originator:1": 3})
+
+    def test_replay_partitioned(self) -> None:
+        results = replay_partitioned(self.path, CountVersions, num_partitions=3)
+        self.assertEqual(len(results), 3)
+        merged: Dict[str, int] = {}
+        for partition, result in enumerate(results):
+            for tag in result:
+                self.assertEqual(tag_partition([tag], "originator:", 3), partition)
+            merged.update(result)
+        self.assertEqual(merged, {f"originator:{o}": 4 for o in self.originator_ids})
+
+    def test_replay_partitioned_with_payload_compression(self) -> None:
+        payload_compression = ExamplePayloadCompression()
+        recorder = UmaDbApplicationRecorder(
+            umadb=self.umadb, payload_compression=payload_compression
+        )
+        topic = f"topic-{uuid4()}"
+        states = {f"originator:{uuid4()}": make_payload(i) for i in range(6)}
+        recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=tag.split(":")[1],
+                    originator_version=0,
+                    topic=topic,
+                    state=state,
+                )
+                for tag, state in states.items()
+            ]
+        )
+        path = os.path.join(self.tempdir.name, "compressed.bin")
+        export_events(self.umadb, path, query=Query(items=[QueryItem(types=[topic])]))
+        with ExportReader(path) as reader:
+            compressed = [s.event for s in reader.read()]
+        self.assertTrue(all(COMPRESSION_METADATA_KEY in e.metadata for e in compressed))
+
+        results = replay_partitioned(
+            path,
+            CollectStates,
+            num_partitions=2,
+            payload_compression=payload_compression,
+        )
+        merged: Dict[str, bytes] = {}
+        for result in results:
+            merged.update(result)
+        self.assertEqual(merged, states)
+
+    def test_tag_partition(self) -> None:
+        tags = [f"originator:{uuid4()}" for _ in range(300)]
+        counts = Counter(tag_partition([t], "originator:", 4) for t in tags)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertEqual(tag_partition(["other"], "originator:", 4), 0)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import List
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem
+from eventsourcing.persistence import StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import DcbFactory, Factory
+from eventsourcing_umadb.heads import HeadTrackingClient
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder, UmaDbDcbRecorder
+from eventsourcing_umadb.replicas import ReplicaRoutingClient
+from tests.counting import CountingClient
+from tests.test_sharding import WithLocalUmaDbServers
+
+LEADER = -1
+
+
+class TestReplicaRoutingClient(WithLocalUmaDbServers):
+    num_servers = 2
+    first_port = 50081
+
+    def setUp(self) -> None:
+        self.leader = Client(self.uris[0])
+        self.replica = Client(self.uris[1])
+        self.client = ReplicaRoutingClient(self.leader, [self.replica])
+
+    def replicate(self) -> None:
+        # Copies new events from the leader, so positions are the same.
+        after = self.replica.head() or 0
+        events = [ue.event for ue in self.leader.read(start=after + 1)]
+        if events:
+            self.replica.append(events)
+
+    def insert(self, recorder: UmaDbApplicationRecorder) -> str:
+        originator_id = str(uuid4())
+        recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=0,
+                    topic="topic1",
+                    state=b"state",
+                )
+            ]
+        )
+        return originator_id
+
+    def test_application_recorder(self) -> None:
+        self.replicate()
+        recorder = UmaDbApplicationRecorder(self.client)
+
+        # Reads go to replicas before anything is written.
+        recorder.select_notifications(None, 10)
+        self.assertEqual(self.client.read_counts, {LEADER: 0, 0: 1})
+
+        # Reads go to the leader until the replica has caught up.
+        originator_id = self.insert(recorder)
+        self.assertEqual(self.client.position_token(), self.leader.head())
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+        self.assertEqual(recorder.max_notification_id(), self.leader.head())
+        self.assertEqual(self.client.read_counts, {LEADER: 1, 0: 1})
+
+        self.replicate()
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+        self.assertEqual(self.client.read_counts, {LEADER: 1, 0: 2})
+
+        # Appends made by other threads are read.
+        originator_id = str(uuid4())
+        recorder.insert_events_nowait(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=0,
+                    topic="topic1",
+                    state=b"state",
+                )
+            ]
+        ).result()
+        token = self.client.position_token()
+        self.assertEqual(token, self.leader.head())
+        results: List[int] = []
+
+        def read() -> None:
+            results.append(len(recorder.select_events(originator_id)))
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        read()
+
+        # Position tokens can be passed to other clients.
+        other = ReplicaRoutingClient(self.leader, [self.replica])
+        other_recorder = UmaDbApplicationRecorder(other)
+        results.append(len(other_recorder.select_events(originator_id)))
+        other.observe_position(token)
+        results.append(len(other_recorder.select_events(originator_id)))
+        self.assertEqual(results, [1, 1, 0, 1])
+        self.assertEqual(self.client.read_counts, {LEADER: 3, 0: 2})
+        self.assertEqual(other.read_counts, {LEADER: 1, 0: 1})
+
+        # Tokens only move forwards.
+        self.client.observe_position(1)
+        self.assertEqual(self.client.position_token(), token)
+
+    def test_dcb_recorder(self) -> None:
+        recorder = UmaDbDcbRecorder(self.client)
+        tag = f"tag-{uuid4()}"
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        recorder.append(
+            [
+                DcbEvent(
+                    type="type1", data=b"data", tags=[tag], uuid=uuid4(), metadata={}
+                )
+            ]
+        )
+        self.assertEqual(len(list(recorder.read(query))), 1)
+        self.assertEqual(self.client.read_counts[LEADER], 1)
+
+        self.replicate()
+        self.assertEqual(len(list(recorder.read(query))), 1)
+        self.assertEqual(self.client.read_counts, {LEADER: 1, 0: 1})
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: self.uris[0],
+                Factory.UMADB_REPLICA_URIS: self.uris[1],
+            }
+        )
+        with Factory(env) as factory:
+            self.assertIsInstance(factory.umadb.client, ReplicaRoutingClient)
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            self.assertIs(recorder.umadb, factory.umadb)
+        with DcbFactory(env) as dcb_factory:
+            dcb_recorder = dcb_factory.dcb_recorder()
+            assert isinstance(dcb_recorder, UmaDbDcbRecorder)
+            self.assertIs(dcb_recorder.umadb, dcb_factory.umadb)
+            self.assertIsInstance(dcb_factory.umadb.client, ReplicaRoutingClient)
+
+        # Heads are tracked on the leader, without calling the replicas.
+        env[Factory.UMADB_HEAD_MAX_STALENESS] = "60"
+        with Factory(env) as factory:
+            client = factory.umadb.client
+            assert isinstance(client, ReplicaRoutingClient)
+            self.assertIsInstance(client.leader, HeadTrackingClient)
+            replica = CountingClient(client.replicas[0])
+            client.replicas = [replica]
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            head = recorder.max_notification_id()
+            self.insert(recorder)
+            for _ in range(10):
+                self.assertGreater(recorder.max_notification_id() or 0, head or 0)
+            self.assertEqual(replica.head_calls, 0)
+        env.pop(Factory.UMADB_HEAD_MAX_STALENESS)
+
+        env.pop(Factory.UMADB_REPLICA_URIS)
+        with Factory(env) as factory:
+            self.assertIsInstance(factory.umadb.client, Client)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import threading
+from typing import List, Sequence
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.dcb.api import (
+    DcbAppendCondition,
+    DcbEvent,
+    DcbQuery,
+    DcbQueryItem,
+    DcbReadResponse,
+    DcbSequencedEvent,
+)
+from eventsourcing.dcb.popo import InMemoryDcbRecorder
+from eventsourcing.persistence import IntegrityError
+from umadb import Client
+
+from eventsourcing_umadb.recorders import UmaDbDcbRecorder
+from eventsourcing_umadb.retries import ConflictRetrier, ContentionStatistics
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+def count(state: int, _: DcbSequencedEvent) -> int:
+    return state + 1
+
+
+def increment(tag: str) -> DcbEvent:
+    return DcbEvent(type="Incremented", data=b"", tags=[tag], uuid=uuid4(), metadata={})
+
+
+class InterferingRecorder(InMemoryDcbRecorder):
+    """Appends a conflicting event after each of the first reads."""
+
+    def __init__(self, tag: str, num_conflicts: int) -> None:
+        super().__init__()
+        self.tag = tag
+        self.num_conflicts = num_conflicts
+        self.reads_after: List[int | None] = []
+
+    def read(
+        self,
+        query: DcbQuery | None = None,
+        *,
+        after: int | None = None,
+        limit: int | None = None,
+    ) -> DcbReadResponse:
+        response = super().read(query, after=after, limit=limit)
+        if limit is not None:
+            # Checking an append condition.
+            return response
+        self.reads_after.append(after)
+        if self.num_conflicts:
+            self.num_conflicts -= 1
+            super().append([increment(self.tag)])
+        return response
+
+
+class TestContentionStatistics(TestCase):
+    def test_statistics(self) -> None:
+        statistics = ContentionStatistics()
+        statistics.record(["a", "b"], conflicted=True)
+        statistics.record(["a", "a"], conflicted=False)
+        statistics.record(["c"], conflicted=False)
+        a = statistics.get("a")
+        self.assertEqual((a.attempts, a.conflicts, a.conflict_rate), (2, 1, 0.5))
+        self.assertEqual(statistics.get("c").conflict_rate, 0.0)
+        self.assertEqual(statistics.get("d").conflict_rate, 0.0)
+        self.assertEqual([t.tag for t in statistics.hottest()], ["b", "a"])
+        self.assertEqual(len(statistics.hottest(1)), 1)
+
+
+class TestConflictRetrier(TestCase):
+    def test_retries_after_conflicts(self) -> None:
+        recorder = InterferingRecorder("counter", num_conflicts=2)
+        recorder.append([increment("counter")])
+        retrier = ConflictRetrier(recorder, base_delay=0.001)
+        query = DcbQuery(items=[DcbQueryItem(tags=["counter"])])
+        decided: List[int] = []
+
+        def decide(state: int) -> Sequence[DcbEvent]:
+            decided.append(state)
+            return [increment("counter")]
+
+        position = retrier.execute(query, 0, count, decide)
+        self.assertEqual(position, 4)
+        # Each retry only read the events after the failed condition.
+        self.assertEqual(recorder.reads_after, [None, 1, 2])
+        self.assertEqual(decided, [1, 2, 3])
+        contention = retrier.statistics.get("counter")
+        self.assertEqual((contention.attempts, contention.conflicts), (3, 2))
+
+    def test_gives_up(self) -> None:
+        recorder = InterferingRecorder("counter", num_conflicts=3)
+        retrier = ConflictRetrier(recorder, max_attempts=3, base_delay=0.001)
+        query = DcbQuery(items=[DcbQueryItem(tags=["counter"])])
+        with self.assertRaises(IntegrityError):
+            retrier.execute(query, 0, count, lambda s: [increment("counter")])
+        self.assertEqual(retrier.statistics.get("counter").conflicts, 3)
+
+    def test_decides_nothing(self) -> None:
+        retrier = ConflictRetrier(InMemoryDcbRecorder())
+        query = DcbQuery(items=[DcbQueryItem(tags=["counter"])])
+        self.assertIsNone(retrier.execute(query, 0, count, lambda s: []))
+
+
+class TestConflictRetrierWithUmaDb(TestCase):
+    def test_concurrent_increments(self) -> None:
+        recorder = UmaDbDcbRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        statistics = ContentionStatistics()
+        hot_tag = f"hot-{uuid4()}"
+        cold_tags = [f"cold-{uuid4()}" for _ in range(4)]
+        num_threads = 4
+        num_increments = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 20
+
+        def run(thread_index: int) -> None:
+            retrier = ConflictRetrier(recorder, max_attempts=100, statistics=statistics)
+            for i in range(num_increments):
+                tag = hot_tag if i % 2 else cold_tags[thread_index]
+                query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+                retrier.execute(query, 0, count, lambda _: [increment(tag)])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(num_threads)]
+        start = datetime.datetime.now()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = datetime.datetime.now() - start
+
+        # No lost updates.
+        query = DcbQuery(items=[DcbQueryItem(tags=[hot_tag])])
+        self.assertEqual(
+            len(list(recorder.read(query))), num_threads * num_increments // 2
+        )
+        hottest = statistics.hottest(1)
+        if hottest:
+            self.assertEqual(hottest[0].tag, hot_tag)
+        print()
+        print(
+            f"{num_threads * num_increments / duration.total_seconds():.0f}"
+            f" decisions/s, hot tag conflict rate: "
+            f"{statistics.get(hot_tag).conflict_rate:.0%}"
+        )
+
+    def test_condition_after_is_respected(self) -> None:
+        recorder = UmaDbDcbRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        tag = f"tag-{uuid4()}"
+        query = DcbQuery(items=[DcbQueryItem(tags=[tag])])
+        recorder.append([increment(tag)])
+        head = recorder.head()
+        retrier = ConflictRetrier(recorder)
+        retrier.execute(query, 0, count, lambda s: [increment(tag)])
+        with self.assertRaises(IntegrityError):
+            recorder.append(
+                [increment(tag)],
+                DcbAppendCondition(fail_if_events_match=query, after=head),
+            )
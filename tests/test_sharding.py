@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import shutil
+import subprocess
+import threading
+import time
+import unittest
+from collections import Counter
+from tempfile import TemporaryDirectory
+from typing import ClassVar, List
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.persistence import IntegrityError, StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import Factory
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+from eventsourcing_umadb.sharding import (
+    ConsistentHashRing,
+    ShardedUmaDbAggregateRecorder,
+    ShardedUmaDbApplicationRecorder,
+    decode_notification_id,
+)
+
+
+class WithLocalUmaDbServers(TestCase):
+    """
+    Starts UmaDB servers, each with its own database file, for tests that
+    need more than one server.
+    """
+
+    num_servers: ClassVar[int] = 3
+    first_port: ClassVar[int] = 50071
+    uris: ClassVar[List[str]]
+    _tempdir: ClassVar[TemporaryDirectory[str]]
+    _processes: ClassVar[List[subprocess.Popen[bytes]]]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        executable = shutil.which("umadb")
+        if executable is None:
+            raise unittest.SkipTest("UmaDB server executable not found")
+        cls._tempdir = TemporaryDirectory()
+        cls._processes = []
+        cls.uris = []
+        for i in range(cls.num_servers):
+            address = f"127.0.0.1:{cls.first_port + i}"
+            cls._processes.append(
+                subprocess.Popen(
+                    [
+                        executable,
+                        "--listen",
+                        address,
+                        "--db-path",
+                        os.path.join(cls._tempdir.name, f"uma{i}.db"),
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            )
+            cls.uris.append(f"http://{address}")
+        for uri in cls.uris:
+            cls._wait_for_server(uri)
+
+    @staticmethod
+    def _wait_for_server(uri: str) -> None:
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                Client(uri).head()
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+            else:
+                return
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for process in cls._processes:
+            process.terminate()
+            process.wait()
+        cls._tempdir.cleanup()
+        super().tearDownClass()
+
+
+class TestConsistentHashRing(TestCase):
+    def test_distribution(self) -> None:
+        ring = ConsistentHashRing(4)
+        keys = [str(uuid4()) for _ in range(4000)]
+        counts = Counter(ring.shard_for(k) for k in keys)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        for count in counts.values():
+            self.assertGreater(count, 600)
+
+        # Adding a shard moves only keys to the new shard.
+        new_ring = ConsistentHashRing(5)
+        moved = [k for k in keys if ring.shard_for(k) != new_ring.shard_for(k)]
+        self.assertTrue(all(new_ring.shard_for(k) == 4 for k in moved))
+        self.assertLess(len(moved), 4000 * 0.3)
+
+    def test_requires_shards(self) -> None:
+        with self.assertRaises(ValueError):
+            ConsistentHashRing(0)
+
+
+class TestShardedRecorders(WithLocalUmaDbServers):
+    def create_recorder(self) -> ShardedUmaDbApplicationRecorder:
+        return ShardedUmaDbApplicationRecorder(
+            [UmaDbApplicationRecorder(Client(uri)) for uri in self.uris]
+        )
+
+    def insert(
+        self, recorder: ShardedUmaDbAggregateRecorder, num_originators: int
+    ) -> List[str]:
+        originator_ids = [str(uuid4()) for _ in range(num_originators)]
+        for version in range(2):
+            recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic="topic1",
+                        state=f"{originator_id}-{version}".encode(),
+                    )
+                    for originator_id in originator_ids
+                ]
+            )
+        return originator_ids
+
+    def test_ring_must_match_shards(self) -> None:
+        with self.assertRaises(ValueError):
+            ShardedUmaDbApplicationRecorder(
+                [UmaDbApplicationRecorder(Client(self.uris[0]))],
+                ring=ConsistentHashRing(2),
+            )
+
+    def test_insert_and_select_events(self) -> None:
+        recorder = self.create_recorder()
+        originator_ids = self.insert(recorder, 30)
+
+        for originator_id in originator_ids:
+            stored_events = recorder.select_events(originator_id)
+            self.assertEqual([s.originator_version for s in stored_events], [0, 1])
+            self.assertEqual(stored_events[1].state, f"{originator_id}-1".encode())
+
+            # Only in one shard.
+            shard = recorder.shard_for(originator_id)
+            for i, shard_recorder in enumerate(recorder.shards):
+                self.assertEqual(
+                    len(shard_recorder.select_events(originator_id)),
+                    2 if i == shard else 0,
+                )
+
+        # Conflicts are detected within a shard.
+        with self.assertRaises(IntegrityError):
+            recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_ids[0],
+                        originator_version=1,
+                        topic="topic1",
+                        state=b"",
+                        uuid=uuid4(),
+                    )
+                ]
+            )
+
+    def test_select_events_as_of_position(self) -> None:
+        recorder = self.create_recorder()
+        originator_id = str(uuid4())
+        notification_ids = []
+        for version in range(3):
+            ids = recorder.insert_events(
+                [
+                    StoredEvent(
+                        originator_id=originator_id,
+                        originator_version=version,
+                        topic="topic1",
+                        state=b"",
+                    )
+                ]
+            )
+            assert ids is not None
+            notification_ids.append(ids[0])
+        stored_events = recorder.select_events(
+            originator_id, as_of_position=notification_ids[1]
+        )
+        self.assertEqual([s.originator_version for s in stored_events], [0, 1])
+
+        # Positions in other shards can't be compared.
+        with self.assertRaises(ValueError):
+            recorder.select_events(
+                originator_id, as_of_position=notification_ids[1] + 1
+            )
+
+    def test_notification_ids(self) -> None:
+        recorder = self.create_recorder()
+        originator_ids = [str(uuid4()) for _ in range(10)]
+        notification_ids = recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=originator_id,
+                    originator_version=0,
+                    topic="topic1",
+                    state=b"",
+                )
+                for originator_id in originator_ids
+            ]
+        )
+        assert notification_ids is not None
+        for originator_id, notification_id in zip(originator_ids, notification_ids):
+            shard, position = decode_notification_id(notification_id, 3)
+            self.assertEqual(shard, recorder.shard_for(originator_id))
+            notifications = recorder.shards[shard].select_notifications(position, 1)
+            self.assertEqual(notifications[0].originator_id, originator_id)
+        max_notification_id = recorder.max_notification_id()
+        assert max_notification_id is not None
+        self.assertGreaterEqual(max_notification_id, max(notification_ids))
+
+    def test_read_merged(self) -> None:
+        recorder = self.create_recorder()
+        cursor = recorder.head_cursor()
+        originator_ids = self.insert(recorder, 20)
+
+        read: List[str] = []
+        while True:
+            notifications, cursor = recorder.read_merged(cursor, limit=7)
+            if not notifications:
+                break
+            self.assertLessEqual(len(notifications), 7)
+            ids = [n.id for n in notifications]
+            self.assertEqual(ids, sorted(ids))
+            read += [n.state.decode() for n in notifications]
+        self.assertEqual(len(read), 40)
+        self.assertEqual(
+            set(read), {f"{o}-{v}" for o in originator_ids for v in range(2)}
+        )
+        self.assertEqual(cursor, recorder.head_cursor())
+
+        # Cursors issued before a shard was added are rejected.
+        with self.assertRaises(ValueError):
+            recorder.read_merged(cursor[:2], limit=7)
+        with self.assertRaises(ValueError):
+            recorder.subscribe_merged(cursor[:2])
+
+        # The merged log can't be read after a notification ID.
+        with self.assertRaises(NotImplementedError):
+            recorder.select_notifications(None, 5)
+        with self.assertRaises(NotImplementedError):
+            recorder.subscribe(gt=None)
+
+    def test_subscribe(self) -> None:
+        recorder = self.create_recorder()
+        with recorder.subscribe_merged(recorder.head_cursor()) as subscription:
+            originator_ids = self.insert(recorder, 10)
+            received = [next(subscription) for _ in range(20)]
+            self.assertEqual(
+                {n.state.decode() for n in received},
+                {f"{o}-{v}" for o in originator_ids for v in range(2)},
+            )
+            # Cursor has the last received position in each shard.
+            self.assertEqual(subscription.cursor, recorder.head_cursor())
+        with self.assertRaises(StopIteration):
+            next(subscription)
+
+    def test_factory(self) -> None:
+        env = Environment(env={Factory.UMADB_SHARD_URIS: ",".join(self.uris)})
+        with Factory(env) as factory:
+            aggregate_recorder = factory.aggregate_recorder()
+            assert isinstance(aggregate_recorder, ShardedUmaDbAggregateRecorder)
+            self.assertEqual(len(aggregate_recorder.shards), 3)
+            self.assertEqual(factory.umadb, factory.shard_clients[0])
+
+            # Applications can't read the notifications of sharded recorders.
+            with self.assertRaises(EnvironmentError):
+                factory.application_recorder()
+
+    def test_benchmark(self) -> None:
+        num_threads = 6
+        num_per_thread = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 100
+        print()
+        for num_shards in (1, len(self.uris)):
+            for batch_size in (1, 6):
+                recorder = ShardedUmaDbAggregateRecorder(
+                    [
+                        UmaDbApplicationRecorder(Client(uri))
+                        for uri in self.uris[:num_shards]
+                    ]
+                )
+
+                def insert() -> None:
+                    for _ in range(num_per_thread):
+                        recorder.insert_events(
+                            [
+                                StoredEvent(
+                                    originator_id=str(uuid4()),
+                                    originator_version=0,
+                                    topic="topic1",
+                                    state=b"state",
+                                )
+                                for _ in range(batch_size)
+                            ]
+                        )
+
+                threads = [threading.Thread(target=insert) for _ in range(num_threads)]
+                start = datetime.datetime.now()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                duration = datetime.datetime.now() - start
+                rate = num_threads * num_per_thread / duration.total_seconds()
+                print(
+                    f"{num_shards} shard(s), {batch_size} aggregate(s) per batch,"
+                    f" rate: {rate:.0f} inserts/s"
+                )
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+from typing import List
+from unittest import TestCase
+from uuid import uuid4
+
+from eventsourcing.dcb.api import DcbEvent, DcbQuery, DcbQueryItem, DcbSequencedEvent
+from umadb import Client
+
+from eventsourcing_umadb.recorders import UmaDbDcbRecorder
+from eventsourcing_umadb.snapshots import (
+    DecisionModel,
+    DecisionSnapshot,
+    InMemoryDecisionSnapshotStore,
+    SnapshottingDecisionReader,
+    UmaDbDecisionSnapshotStore,
+    query_key,
+)
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class CountingModel:
+    def __init__(self) -> None:
+        self.num_evolved = 0
+
+    def evolve(self, balance: int, sequenced: DcbSequencedEvent) -> int:
+        self.num_evolved += 1
+        return balance + int(sequenced.event.data)
+
+    def model(self, name: str = "balance-v1") -> DecisionModel[int]:
+        return DecisionModel(
+            name=name,
+            initial=0,
+            evolve=self.evolve,
+            encode=lambda balance: str(balance).encode(),
+            decode=lambda data: int(data),
+        )
+
+
+class TestQueryKey(TestCase):
+    def test_equivalent_queries_have_same_key(self) -> None:
+        query1 = DcbQuery(
+            items=[
+                DcbQueryItem(types=["A"], tags=["x", "y"]),
+                DcbQueryItem(types=["B"], tags=["z"]),
+            ]
+        )
+        query2 = DcbQuery(
+            items=[
+                DcbQueryItem(types=["B"], tags=["z"]),
+                DcbQueryItem(types=["A"], tags=["y", "x"]),
+                DcbQueryItem(types=["A"], tags=["y", "x", "w"]),
+            ]
+        )
+        self.assertEqual(query_key(query1), query_key(query2))
+        self.assertNotEqual(
+            query_key(query1), query_key(DcbQuery(items=[DcbQueryItem(tags=["z"])]))
+        )
+
+
+class TestInMemoryDecisionSnapshotStore(TestCase):
+    def test_keeps_newest_and_most_recently_used(self) -> None:
+        store = InMemoryDecisionSnapshotStore(max_snapshots=2)
+        store.put(DecisionSnapshot("a", 5, b"5"))
+        store.put(DecisionSnapshot("a", 3, b"3"))
+        self.assertEqual(store.get("a"), DecisionSnapshot("a", 5, b"5"))
+        store.put(DecisionSnapshot("b", 1, b"1"))
+        store.get("a")
+        store.put(DecisionSnapshot("c", 1, b"1"))
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("a"))
+
+
+class TestSnapshottingDecisionReader(TestCase):
+    def setUp(self) -> None:
+        self.recorder = UmaDbDcbRecorder(Client(DEFAULT_LOCAL_UMADB_URI))
+        self.tag = f"account:{uuid4()}"
+        self.query = DcbQuery(items=[DcbQueryItem(tags=[self.tag])])
+
+    def deposit(self, amounts: List[int]) -> int:
+        return self.recorder.append(
+            [
+                DcbEvent(
+                    type="Deposited",
+                    data=str(amount).encode(),
+                    tags=[self.tag],
+                    uuid=uuid4(),
+                    metadata={},
+                )
+                for amount in amounts
+            ]
+        )
+
+    def test_reads_after_snapshot(self) -> None:
+        counting = CountingModel()
+        store = InMemoryDecisionSnapshotStore()
+        reader = SnapshottingDecisionReader(self.recorder, store, snapshot_every=3)
+
+        self.assertEqual(reader.read(counting.model(), self.query)[0], 0)
+
+        # Too few events for a snapshot.
+        self.deposit([1, 2])
+        self.assertEqual(reader.read(counting.model(), self.query)[0], 3)
+        self.assertEqual(counting.num_evolved, 2)
+
+        position = self.deposit([3])
+        balance, after = reader.read(counting.model(), self.query)
+        self.assertEqual(balance, 6)
+        self.assertGreaterEqual(after or 0, position)
+        self.assertEqual(counting.num_evolved, 5)
+
+        # Only the new event is read.
+        self.deposit([4])
+        self.assertEqual(reader.read(counting.model(), self.query)[0], 10)
+        self.assertEqual(counting.num_evolved, 6)
+
+        # Snapshots of another model aren't used.
+        self.assertEqual(reader.read(counting.model("balance-v2"), self.query)[0], 10)
+        self.assertEqual(counting.num_evolved, 10)
+
+    def test_umadb_store(self) -> None:
+        store = UmaDbDecisionSnapshotStore(Client(DEFAULT_LOCAL_UMADB_URI))
+        key = f"model:{uuid4()}"
+        self.assertIsNone(store.get(key))
+        store.put(DecisionSnapshot(key, 5, b"five"))
+        store.put(DecisionSnapshot(key, 9, b"nine"))
+        self.assertEqual(store.get(key), DecisionSnapshot(key, 9, b"nine"))
+
+        counting = CountingModel()
+        reader = SnapshottingDecisionReader(self.recorder, store, snapshot_every=2)
+        self.deposit([1, 2, 3])
+        self.assertEqual(reader.read(counting.model(), self.query)[0], 6)
+        self.assertEqual(reader.read(counting.model(), self.query)[0], 6)
+        self.assertEqual(counting.num_evolved, 3)
+
+    def test_benchmark(self) -> None:
+        num_events = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 5000
+        num_reads = 20
+        self.deposit([1] * num_events)
+        print()
+        for name, snapshot_every in [("without", num_events + 1), ("with", 100)]:
+            counting = CountingModel()
+            reader = SnapshottingDecisionReader(
+                self.recorder, InMemoryDecisionSnapshotStore(), snapshot_every
+            )
+            start = datetime.datetime.now()
+            for _ in range(num_reads):
+                balance, _ = reader.read(counting.model(), self.query)
+                self.assertEqual(balance, num_events)
+            duration = datetime.datetime.now() - start
+            print(
+                f"read {num_events} event history {name} snapshots:"
+                f" {num_reads / duration.total_seconds():.0f} reads/s"
+            )
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+from dataclasses import replace
+from tempfile import TemporaryDirectory
+from typing import List, Sequence
+from unittest import TestCase
+from uuid import UUID, uuid4
+
+from eventsourcing.persistence import IntegrityError, StoredEvent
+from eventsourcing.utils import Environment
+from umadb import Client
+
+from eventsourcing_umadb.factory import Factory
+from eventsourcing_umadb.recorders import UmaDbApplicationRecorder
+from eventsourcing_umadb.sharding import ShardedUmaDbApplicationRecorder
+from eventsourcing_umadb.spool import HEADER, RECORD_HEADER, AppendSpool
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+def stored_events(originator_id: str, versions: Sequence[int]) -> List[StoredEvent]:
+    return [
+        StoredEvent(
+            originator_id=originator_id,
+            originator_version=version,
+            topic="topic1",
+            state=f"state{version}".encode(),
+            metadata={"source": "sensor"},
+        )
+        for version in versions
+    ]
+
+
+class WithSpoolFile(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "spool")
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+
+class TestAppendSpool(WithSpoolFile):
+    def test_batches_are_durable_and_sent_in_order(self) -> None:
+        originator_id = str(uuid4())
+        with AppendSpool(self.path, capacity=1 << 16) as spool:
+            spool.append(stored_events(originator_id, [0, 1]))
+            spool.append(stored_events(originator_id, [2]))
+            spool.append([])
+            metrics = spool.metrics()
+            self.assertEqual(metrics.backlog_records, 2)
+            self.assertGreater(metrics.backlog_bytes, 0)
+            self.assertGreaterEqual(metrics.lag, 0.0)
+
+            # Only one process can use the file.
+            with self.assertRaises(RuntimeError):
+                AppendSpool(self.path)
+
+        # Unsent batches are sent after the spool is opened again.
+        sent: List[StoredEvent] = []
+        with AppendSpool(self.path, capacity=1 << 16) as spool:
+            self.assertEqual(spool.metrics().backlog_records, 2)
+            spool.start(sent.extend)
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+            metrics = spool.metrics()
+            self.assertEqual(metrics.backlog_records, 0)
+            self.assertEqual(metrics.backlog_bytes, 0)
+            self.assertEqual(metrics.lag, 0.0)
+            self.assertEqual(metrics.sent_events, 3)
+
+        expected = stored_events(originator_id, [0, 1, 2])
+        self.assertEqual([s.originator_version for s in sent], [0, 1, 2])
+        self.assertEqual([s.state for s in sent], [s.state for s in expected])
+        self.assertEqual(sent[0].metadata, {"source": "sensor"})
+        # Events were given IDs.
+        self.assertEqual(len({s.uuid for s in sent}), 3)
+        self.assertNotIn(UUID(int=0), {s.uuid for s in sent})
+
+        # Nothing is sent again.
+        with AppendSpool(self.path) as spool:
+            self.assertEqual(spool.metrics().backlog_records, 0)
+
+    def test_incomplete_batch_is_dropped(self) -> None:
+        with AppendSpool(self.path, capacity=1 << 16) as spool:
+            spool.append(stored_events("a", [0]))
+            spool.append(stored_events("a", [1]))
+        with open(self.path, "r+b") as f:
+            _, write_offset, _ = HEADER.unpack(f.read(HEADER.size))
+            # Damage the last byte of the second batch.
+            f.seek(write_offset - 1)
+            f.write(b"\xff")
+        sent: List[StoredEvent] = []
+        with AppendSpool(self.path) as spool:
+            self.assertEqual(spool.metrics().backlog_records, 1)
+            spool.start(sent.extend)
+            spool.wait_until_sent(timeout=5)
+        self.assertEqual([s.originator_version for s in sent], [0])
+
+    def test_file_is_reused_when_sent(self) -> None:
+        batch = stored_events("a", [0])
+        with AppendSpool(self.path + "-size") as spool:
+            spool.append(batch)
+            record_size = spool.metrics().backlog_bytes
+        capacity = HEADER.size + 3 * record_size
+        with AppendSpool(self.path, capacity=capacity, append_timeout=0.1) as spool:
+            for _ in range(3):
+                spool.append(batch)
+            with self.assertRaises(TimeoutError):
+                spool.append(batch)
+            with self.assertRaises(ValueError):
+                spool.append(stored_events("a", range(100)))
+
+            sent: List[StoredEvent] = []
+            spool.start(sent.extend)
+            for _ in range(10):
+                spool.append(batch)
+            spool.wait_until_sent(timeout=5)
+            self.assertEqual(len(sent), 13)
+
+    def test_damaged_batch_is_reported(self) -> None:
+        sent: List[StoredEvent] = []
+        with AppendSpool(self.path, capacity=1 << 16, retry_interval=0.01) as spool:
+            spool.append(stored_events("a", [0]))
+            # Damage the payload of the batch after it was spooled.
+            spool._mmap[HEADER.size + RECORD_HEADER.size] ^= 0xFF
+            spool.start(sent.extend)
+            self.assertFalse(spool.wait_until_sent(timeout=0.2))
+            metrics = spool.metrics()
+            self.assertGreater(metrics.failed_sends, 0)
+            self.assertIsInstance(metrics.last_error, RuntimeError)
+            # The sender is still running.
+            with self.assertRaises(RuntimeError):
+                spool.start(sent.extend)
+            spool.close(timeout=0)
+        self.assertEqual(sent, [])
+
+    def test_failed_sends_are_retried(self) -> None:
+        attempts: List[int] = []
+        sent: List[StoredEvent] = []
+
+        def send(events: Sequence[StoredEvent]) -> None:
+            attempts.append(len(events))
+            if len(attempts) == 1:
+                raise ConnectionError("server unavailable")
+            if any(s.originator_id == "conflict" for s in events):
+                raise IntegrityError()
+            sent.extend(events)
+
+        with AppendSpool(self.path, capacity=1 << 16, retry_interval=0.01) as spool:
+            spool.append(stored_events("a", [0]))
+            spool.append(stored_events("conflict", [0, 1]))
+            spool.append(stored_events("b", [0]))
+            spool.start(send)
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+            metrics = spool.metrics()
+        self.assertEqual(metrics.failed_sends, 1)
+        self.assertEqual(metrics.sent_events, 2)
+        self.assertEqual(metrics.rejected_events, 2)
+        self.assertIsInstance(metrics.last_error, IntegrityError)
+        # Combined, then each batch to find the conflict.
+        self.assertEqual(attempts, [4, 4, 1, 2, 1])
+        self.assertEqual([s.originator_id for s in sent], ["a", "b"])
+
+    def test_rejected_events_are_counted_once(self) -> None:
+        attempts: List[int] = []
+
+        def send(events: Sequence[StoredEvent]) -> None:
+            attempts.append(len(events))
+            if any(s.originator_id == "conflict" for s in events):
+                raise IntegrityError()
+            if len(attempts) == 4:
+                raise ConnectionError("server unavailable")
+
+        with AppendSpool(self.path, capacity=1 << 16, retry_interval=0.01) as spool:
+            spool.append(stored_events("a", [0]))
+            spool.append(stored_events("conflict", [0, 1]))
+            spool.append(stored_events("b", [0]))
+            spool.start(send)
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+            metrics = spool.metrics()
+        self.assertEqual(metrics.failed_sends, 1)
+        self.assertEqual(metrics.sent_events, 2)
+        self.assertEqual(metrics.rejected_events, 2)
+        # Sent again after the error, which followed the rejected batch.
+        self.assertEqual(attempts, [4, 1, 2, 1, 4, 1, 2, 1])
+
+
+class TestSpoolingRecorder(WithSpoolFile):
+    def setUp(self) -> None:
+        super().setUp()
+        self.umadb = Client(DEFAULT_LOCAL_UMADB_URI)
+
+    def test_insert_events(self) -> None:
+        originator_id = str(uuid4())
+        with AppendSpool(self.path) as spool:
+            recorder = UmaDbApplicationRecorder(self.umadb, spool=spool)
+            self.assertIsNone(
+                recorder.insert_events(stored_events(originator_id, [0, 1]))
+            )
+            self.assertIsNone(recorder.insert_events(stored_events(originator_id, [2])))
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+        selected = recorder.select_events(originator_id)
+        self.assertEqual([s.originator_version for s in selected], [0, 1, 2])
+
+    def test_insert_events_nowait(self) -> None:
+        originator_id = str(uuid4())
+        with AppendSpool(self.path) as spool:
+            recorder = UmaDbApplicationRecorder(self.umadb, spool=spool)
+            future = recorder.insert_events_nowait(stored_events(originator_id, [0]))
+            self.assertIsNone(future.result())
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+
+    def test_sharded_recorder(self) -> None:
+        with (
+            AppendSpool(self.path + "-0") as spool0,
+            AppendSpool(self.path + "-1") as spool1,
+        ):
+            recorder = ShardedUmaDbApplicationRecorder(
+                [
+                    UmaDbApplicationRecorder(self.umadb, spool=spool0),
+                    UmaDbApplicationRecorder(self.umadb, spool=spool1),
+                ]
+            )
+            originator_ids = [str(uuid4()) for _ in range(20)]
+            # Events in one shard, and in both shards.
+            self.assertIsNone(
+                recorder.insert_events(stored_events(originator_ids[0], [0]))
+            )
+            self.assertIsNone(
+                recorder.insert_events(
+                    [s for i in originator_ids[1:] for s in stored_events(i, [0])]
+                )
+            )
+            self.assertTrue(spool0.wait_until_sent(timeout=5))
+            self.assertTrue(spool1.wait_until_sent(timeout=5))
+            sent_events = [s.metrics().sent_events for s in (spool0, spool1)]
+        self.assertEqual(sum(sent_events), 20)
+        self.assertNotIn(0, sent_events)
+        for originator_id in originator_ids:
+            self.assertEqual(len(recorder.select_events(originator_id)), 1)
+
+    def test_batches_sent_again_are_not_recorded_twice(self) -> None:
+        originator_id = str(uuid4())
+        batch1 = [replace(s, uuid=uuid4()) for s in stored_events(originator_id, [0])]
+        batch2 = [
+            replace(s, uuid=uuid4()) for s in stored_events(originator_id, [1, 2])
+        ]
+        with AppendSpool(self.path) as spool:
+            spool.append(batch1)
+            spool.append(batch2)
+
+        # Recorded, as if the spool failed before recording they were sent.
+        recorder = UmaDbApplicationRecorder(self.umadb)
+        recorder.insert_events(batch1)
+        recorder.insert_events(batch2)
+
+        with AppendSpool(self.path) as spool:
+            spool.append(stored_events(originator_id, [3]))
+            UmaDbApplicationRecorder(self.umadb, spool=spool)
+            self.assertTrue(spool.wait_until_sent(timeout=5))
+            self.assertEqual(spool.metrics().sent_events, 4)
+            self.assertEqual(spool.metrics().rejected_events, 0)
+        selected = recorder.select_events(originator_id)
+        self.assertEqual([s.originator_version for s in selected], [0, 1, 2, 3])
+
+    def test_factory(self) -> None:
+        env = Environment(
+            env={
+                Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI,
+                Factory.UMADB_SPOOL_PATH: self.path,
+            }
+        )
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            assert isinstance(recorder, UmaDbApplicationRecorder)
+            self.assertIs(recorder.spool, factory.spools[self.path])
+            # A spool file can only be used by one recorder.
+            with self.assertRaises(RuntimeError):
+                factory.application_recorder()
+            originator_id = str(uuid4())
+            recorder.insert_events(stored_events(originator_id, [0]))
+        # Sent when the factory is closed.
+        recorder = UmaDbApplicationRecorder(self.umadb)
+        self.assertEqual(len(recorder.select_events(originator_id)), 1)
+
+    def test_benchmark(self) -> None:
+        num_inserts = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 2000
+        print()
+        with AppendSpool(self.path) as spool:
+            for name, recorder in [
+                ("direct", UmaDbApplicationRecorder(self.umadb)),
+                ("spooled", UmaDbApplicationRecorder(self.umadb, spool=spool)),
+            ]:
+                batches = [stored_events(str(uuid4()), [0]) for _ in range(num_inserts)]
+                start = datetime.datetime.now()
+                for batch in batches:
+                    recorder.insert_events(batch)
+                duration = datetime.datetime.now() - start
+                spool.wait_until_sent(timeout=60)
+                drained = datetime.datetime.now() - start
+                print(
+                    f"insert_events {name}:"
+                    f" {num_inserts / duration.total_seconds():.0f} inserts/s,"
+                    f" all recorded after {drained.total_seconds():.2f}s"
+                )
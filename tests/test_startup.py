@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+from eventsourcing.utils import Environment
+from umadb import ServingStatus
+
+from eventsourcing_umadb.factory import Factory
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+UNAVAILABLE_UMADB_URI = "http://127.0.0.1:1"
+
+
+def run_python(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    ).stdout
+
+
+COLD_START = """
+import json, sys, time
+started = time.perf_counter()
+import eventsourcing_umadb
+imported = time.perf_counter()
+factory = eventsourcing_umadb.Factory.construct({
+    "PERSISTENCE_MODULE": "eventsourcing_umadb",
+    "UMADB_URI": %r,
+})
+recorder = factory.application_recorder()
+constructed = time.perf_counter()
+if %r:
+    factory.warm_up()
+warmed_up = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "construct": constructed - imported,
+    "warm_up": warmed_up - constructed,
+}))
+"""
+
+
+class TestStartup(TestCase):
+    def test_import_does_not_import_client(self) -> None:
+        modules = json.loads(
+            run_python(
+                "import json, sys, eventsourcing_umadb;"
+                " print(json.dumps(sorted(sys.modules)))"
+            )
+        )
+        self.assertIn("eventsourcing_umadb.factory", modules)
+        self.assertNotIn("umadb", modules)
+        self.assertNotIn("eventsourcing_umadb.recorders", modules)
+
+    def test_connection_is_deferred(self) -> None:
+        env = Environment(env={Factory.UMADB_URI: UNAVAILABLE_UMADB_URI})
+        with Factory(env) as factory:
+            factory.application_recorder()
+            self.assertFalse(factory.umadb.is_connected)
+            with self.assertRaises(Exception):
+                factory.warm_up()
+            self.assertFalse(factory.umadb.is_connected)
+
+        env = Environment(env={Factory.UMADB_URI: DEFAULT_LOCAL_UMADB_URI})
+        with Factory(env) as factory:
+            recorder = factory.application_recorder()
+            self.assertFalse(factory.umadb.is_connected)
+            recorder.max_notification_id()
+            self.assertTrue(factory.umadb.is_connected)
+
+        with Factory(env) as factory:
+            factory.warm_up()
+            self.assertTrue(factory.umadb.is_connected)
+
+        # Other methods of the client can be called.
+        with Factory(env) as factory:
+            self.assertEqual(factory.umadb.check_health(), ServingStatus.SERVING)
+            self.assertTrue(factory.umadb.is_connected)
+            with self.assertRaises(AttributeError):
+                factory.umadb.no_such_method()
+
+    def test_benchmark(self) -> None:
+        num_runs = int(os.environ.get("TEST_BENCHMARK_NUM_ITERS", 1)) * 5
+        print()
+        for name, warm_up in [("deferred", False), ("warmed up", True)]:
+            timings = [
+                json.loads(run_python(COLD_START % (DEFAULT_LOCAL_UMADB_URI, warm_up)))
+                for _ in range(num_runs)
+            ]
+            best = min(timings, key=lambda t: t["import"] + t["construct"])
+            print(
+                f"cold start {name}: import {best['import'] * 1000:.1f} ms,"
+                f" construct {best['construct'] * 1000:.1f} ms,"
+                f" warm up {best['warm_up'] * 1000:.1f} ms"
+            )
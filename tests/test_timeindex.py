@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from uuid import uuid4
+
+import umadb
+from umadb import Client
+
+from eventsourcing_umadb.timeindex import SAMPLE, TimeIndex, TimeIndexer
+
+DEFAULT_LOCAL_UMADB_URI = "http://127.0.0.1:50051"
+
+
+class TestTimeIndex(TestCase):
+    def test_add_and_resolve(self) -> None:
+        index = TimeIndex(interval=10)
+        self.assertIsNone(index.resolve(1000))
+        self.assertTrue(index.add(5, 1000))
+        # Too soon.
+        self.assertFalse(index.add(6, 1005))
+        # Not after last position.
+        self.assertFalse(index.add(5, 1020))
+        self.assertTrue(index.add(9, 1020))
+        self.assertTrue(index.add(20, 1040))
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.last_position, 20)
+
+        self.assertIsNone(index.resolve(999))
+        self.assertIsNone(index.resolve(1000))
+        self.assertEqual(index.resolve(1001), 5)
+        self.assertEqual(index.resolve(1020), 5)
+        self.assertEqual(index.resolve(1030), 9)
+        self.assertEqual(index.resolve(5000), 20)
+        self.assertEqual(
+            index.resolve(datetime.fromtimestamp(1030, tz=timezone.utc)), 9
+        )
+
+    def test_persistence(self) -> None:
+        with TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "time.idx")
+            index = TimeIndex(path, interval=0)
+            index.add(1, 100.0)
+            index.add(2, 200.0)
+            index.close()
+
+            # Partly written sample is dropped.
+            with open(path, "ab") as f:
+                f.write(SAMPLE.pack(3, 300.0)[:5])
+
+            with TimeIndex(path, interval=0) as index:
+                self.assertEqual(list(index.positions), [1, 2])
+                self.assertEqual(list(index.times), [100.0, 200.0])
+                self.assertTrue(index.add(3, 300.0))
+            self.assertEqual(os.path.getsize(path), 3 * SAMPLE.size)
+            with TimeIndex(path) as index:
+                self.assertEqual(index.resolve(250.0), 2)
+
+
+class TestTimeIndexer(TestCase):
+    def setUp(self) -> None:
+        self.client = Client(DEFAULT_LOCAL_UMADB_URI)
+
+    def append(self, data: bytes = b"") -> int:
+        return self.client.append(
+            [umadb.Event(event_type="type1", data=data, tags=[], uuid=uuid4())]
+        )
+
+    def wait_for(self, index: TimeIndex, position: int) -> None:
+        deadline = time.monotonic() + 5
+        while (index.last_position or 0) < position:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_indexes_received_events(self) -> None:
+        index = TimeIndex(interval=0)
+        indexer = TimeIndexer(self.client, index)
+        try:
+            before = time.time()
+            position1 = self.append()
+            self.wait_for(index, position1)
+            time.sleep(0.05)
+            middle = time.time()
+            position2 = self.append()
+            self.wait_for(index, position2)
+        finally:
+            indexer.stop()
+
+        # Replay from 'middle' starts after position1.
+        self.assertEqual(index.resolve(middle), position1)
+        self.assertLess(index.resolve(before) or 0, position1)
+
+    def test_indexes_event_timestamps(self) -> None:
+        head = self.client.head() or 0
+        with TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "time.idx")
+            index = TimeIndex(path, interval=0)
+            # Continue from a persisted position.
+            index.add(head, 0.0)
+            positions = [self.append(str(t).encode()) for t in (10.0, 20.0, 15.0)]
+            indexer = TimeIndexer(
+                self.client, index, timestamp_of=lambda ue: float(ue.event.data or 0)
+            )
+            try:
+                self.wait_for(index, positions[-1])
+            finally:
+                indexer.stop()
+                index.close()
+
+            with TimeIndex(path) as index:
+                self.assertEqual(index.resolve(10.0), head)
+                self.assertEqual(index.resolve(15.0), positions[0])
+                # Times are kept non-decreasing.
+                self.assertEqual(list(index.times)[-1], 20.0)
+                self.assertEqual(index.resolve(25.0), positions[-1])